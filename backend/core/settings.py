@@ -298,6 +298,93 @@ CACHES = {
     }
 }
 
+# 推荐系统相似度矩阵分块计算的内存预算（MB）
+RECOMMENDER_SIMILARITY_MEMORY_MB = int(os.getenv('RECOMMENDER_SIMILARITY_MEMORY_MB', 256))
+
+# 每个用户/题目保留的近邻数量（Top-K）
+RECOMMENDER_NEIGHBOR_K = int(os.getenv('RECOMMENDER_NEIGHBOR_K', 50))
+
+# 推荐系统批量写入（相似度、推荐记录）每个事务的行数
+RECOMMENDER_BULK_CHUNK_SIZE = int(os.getenv('RECOMMENDER_BULK_CHUNK_SIZE', 1000))
+
+# 近邻矩阵内存映射文件目录（update_similarity_matrix --export-artifact 导出）
+RECOMMENDER_ARTIFACT_DIR = Path(os.getenv('RECOMMENDER_ARTIFACT_DIR', BASE_DIR / 'data' / 'similarity'))
+
+# 推荐时是否从内存映射文件读取近邻（未导出时回退到数据库）
+RECOMMENDER_USE_ARTIFACT = os.getenv('RECOMMENDER_USE_ARTIFACT', 'False') == 'True'
+
+# 基于用户的推荐最多使用的相似用户数（Top-M）
+RECOMMENDER_USER_BASED_NEIGHBORS = int(os.getenv('RECOMMENDER_USER_BASED_NEIGHBORS', 30))
+
+# 基于用户的推荐是否通过 ANN 索引查找相似用户（build_ann_index 构建，未构建时回退）
+RECOMMENDER_USER_ANN = os.getenv('RECOMMENDER_USER_ANN', 'False') == 'True'
+
+# ANN 查询时扫描的簇数（越大召回率越高、越慢）
+RECOMMENDER_ANN_N_PROBE = int(os.getenv('RECOMMENDER_ANN_N_PROBE', 8))
+
+# 矩阵分解（ALS）推荐：潜在因子维数、训练轮数、正则化系数、训练线程数（train_mf_model 使用）
+RECOMMENDER_MF_FACTORS = int(os.getenv('RECOMMENDER_MF_FACTORS', 32))
+RECOMMENDER_MF_EPOCHS = int(os.getenv('RECOMMENDER_MF_EPOCHS', 15))
+RECOMMENDER_MF_REGULARIZATION = float(os.getenv('RECOMMENDER_MF_REGULARIZATION', 0.01))
+RECOMMENDER_MF_THREADS = int(os.getenv('RECOMMENDER_MF_THREADS', 1))
+
+# 图随机游走推荐：重启概率、迭代次数上限，构建二部图时收藏与答题用时的边权（build_walk_graph 使用，0 表示不使用）
+RECOMMENDER_GRAPH_RESTART = float(os.getenv('RECOMMENDER_GRAPH_RESTART', 0.15))
+RECOMMENDER_GRAPH_ITERATIONS = int(os.getenv('RECOMMENDER_GRAPH_ITERATIONS', 10))
+RECOMMENDER_GRAPH_FAVORITE_WEIGHT = float(os.getenv('RECOMMENDER_GRAPH_FAVORITE_WEIGHT', 0.5))
+RECOMMENDER_GRAPH_TIME_WEIGHT = float(os.getenv('RECOMMENDER_GRAPH_TIME_WEIGHT', 0))
+
+# 下一题转移模型：每道题保留的后继数与同一会话内相邻两题的最大间隔（分钟）（build_transition_model 使用）
+RECOMMENDER_SEQUENCE_TOP_K = int(os.getenv('RECOMMENDER_SEQUENCE_TOP_K', 20))
+RECOMMENDER_SEQUENCE_SESSION_GAP_MINUTES = int(os.getenv('RECOMMENDER_SEQUENCE_SESSION_GAP_MINUTES', 120))
+
+# 在线能力 / 难度评分（Elo）：是否在答题评分后在线更新、K 因子上下限、评分桶宽（修改后需执行 rebuild_ratings）
+# 与自适应选题的目标期望得分率
+RECOMMENDER_ONLINE_RATINGS = os.getenv('RECOMMENDER_ONLINE_RATINGS', 'True') == 'True'
+RECOMMENDER_RATING_MAX_K = float(os.getenv('RECOMMENDER_RATING_MAX_K', 32))
+RECOMMENDER_RATING_MIN_K = float(os.getenv('RECOMMENDER_RATING_MIN_K', 8))
+RECOMMENDER_RATING_BUCKET_WIDTH = int(os.getenv('RECOMMENDER_RATING_BUCKET_WIDTH', 50))
+RECOMMENDER_RATING_TARGET = float(os.getenv('RECOMMENDER_RATING_TARGET', 0.5))
+
+# 热门题目索引：热度半衰期（天）与刷新间隔（秒）
+RECOMMENDER_POPULARITY_HALF_LIFE_DAYS = float(os.getenv('RECOMMENDER_POPULARITY_HALF_LIFE_DAYS', 7))
+RECOMMENDER_POPULARITY_REFRESH_SECONDS = int(os.getenv('RECOMMENDER_POPULARITY_REFRESH_SECONDS', 300))
+
+# 热门题目、下一题等列表接口单次返回数量的上限（参数 n 超过时按上限处理）
+RECOMMENDER_MAX_RESULTS = int(os.getenv('RECOMMENDER_MAX_RESULTS', 100))
+
+# 推荐结果缓存时间（秒）；用户提交或评分答题后缓存立即失效，因此可以设置得较长
+RECOMMENDER_CACHE_TIMEOUT = int(os.getenv('RECOMMENDER_CACHE_TIMEOUT', 86400))
+
+# 混合推荐流水线：候选生成器线程池大小（0 表示依次执行）、每个生成器的时间预算（毫秒）、
+# 合并策略（weighted_sum 或 reciprocal_rank）与启用的候选生成器
+# （默认与原混合推荐相同；popularity、content_based 需显式加入）
+RECOMMENDER_PIPELINE_WORKERS = int(os.getenv('RECOMMENDER_PIPELINE_WORKERS', 4))
+RECOMMENDER_PIPELINE_BUDGET_MS = int(os.getenv('RECOMMENDER_PIPELINE_BUDGET_MS', 2000))
+RECOMMENDER_PIPELINE_MERGE = os.getenv('RECOMMENDER_PIPELINE_MERGE', 'weighted_sum')
+RECOMMENDER_PIPELINE_GENERATORS = os.getenv(
+    'RECOMMENDER_PIPELINE_GENERATORS', 'user_based,item_based'
+).split(',')
+
+# 异步推荐任务：每个进程的线程池大小（0 表示在请求线程内同步执行）与任务记录的保留时间（秒）
+RECOMMENDER_JOB_WORKERS = int(os.getenv('RECOMMENDER_JOB_WORKERS', 2))
+RECOMMENDER_JOB_TTL = int(os.getenv('RECOMMENDER_JOB_TTL', 3600))
+
+# 答题记录评分后是否增量更新相似度矩阵
+RECOMMENDER_INCREMENTAL_SIMILARITY = os.getenv('RECOMMENDER_INCREMENTAL_SIMILARITY', 'True') == 'True'
+
+# 相似度矩阵全量重建租约的过期时间（秒），同一类矩阵同时只允许一个全量重建
+RECOMMENDER_REBUILD_LEASE_SECONDS = int(os.getenv('RECOMMENDER_REBUILD_LEASE_SECONDS', 6 * 3600))
+
+# 事务从保存到提交的最长延迟（秒）：按时间水位线增量读取答题记录时向前重读的窗口
+RECOMMENDER_COMMIT_LAG_SECONDS = int(os.getenv('RECOMMENDER_COMMIT_LAG_SECONDS', 300))
+
+# 推荐系统遥测：每类构建保留的记录数、构建后超过多少小时且有新答题记录视为过期、
+# 耗时超过之前构建中位数多少倍视为变慢（check_recommender_status 与 telemetry 接口使用）
+RECOMMENDER_TELEMETRY_KEEP_BUILDS = int(os.getenv('RECOMMENDER_TELEMETRY_KEEP_BUILDS', 50))
+RECOMMENDER_TELEMETRY_STALE_HOURS = float(os.getenv('RECOMMENDER_TELEMETRY_STALE_HOURS', 24))
+RECOMMENDER_TELEMETRY_SLOW_FACTOR = float(os.getenv('RECOMMENDER_TELEMETRY_SLOW_FACTOR', 2.0))
+
 # 文件上传限制
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
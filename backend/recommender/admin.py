@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import UserSimilarity, QuestionSimilarity, Recommendation, UserPreference
+from .models import (
+    UserSimilarity, QuestionSimilarity, UserNeighbor, QuestionNeighbor, Recommendation,
+    MaterializedRecommendation, UserPreference, BuildRecord
+)
 
 
 @admin.register(UserSimilarity)
@@ -18,6 +21,22 @@ class QuestionSimilarityAdmin(admin.ModelAdmin):
     ordering = ['-similarity_score']
 
 
+@admin.register(UserNeighbor)
+class UserNeighborAdmin(admin.ModelAdmin):
+    list_display = ['user', 'rank', 'neighbor', 'similarity_score', 'common_questions', 'last_updated']
+    list_filter = ['last_updated']
+    search_fields = ['user__username', 'neighbor__username']
+    ordering = ['user', 'rank']
+
+
+@admin.register(QuestionNeighbor)
+class QuestionNeighborAdmin(admin.ModelAdmin):
+    list_display = ['question', 'rank', 'neighbor', 'similarity_score', 'common_users', 'last_updated']
+    list_filter = ['last_updated']
+    search_fields = ['question__title', 'neighbor__title']
+    ordering = ['question', 'rank']
+
+
 @admin.register(Recommendation)
 class RecommendationAdmin(admin.ModelAdmin):
     list_display = ['user', 'question', 'recommendation_type', 'score', 'is_viewed', 'is_answered', 'created_at']
@@ -27,9 +46,25 @@ class RecommendationAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
 
 
+@admin.register(MaterializedRecommendation)
+class MaterializedRecommendationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'recommendation_type', 'n', 'min_similarity', 'generated_at']
+    list_filter = ['recommendation_type', 'generated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['generated_at']
+
+
 @admin.register(UserPreference)
 class UserPreferenceAdmin(admin.ModelAdmin):
     list_display = ['user', 'avg_score', 'total_answered', 'last_updated']
     list_filter = ['last_updated']
     search_fields = ['user__username']
     readonly_fields = ['last_updated']
+
+
+@admin.register(BuildRecord)
+class BuildRecordAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'status', 'started_at', 'duration_ms', 'rows_written', 'peak_memory_mb', 'watermark']
+    list_filter = ['kind', 'status', 'started_at']
+    ordering = ['-started_at']
+    readonly_fields = ['started_at']
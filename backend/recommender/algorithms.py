@@ -1,15 +1,29 @@
 from collections import defaultdict
 from typing import List, Tuple, Dict, Optional, Any
-from django.db.models import Avg, Count, Q
+from django.conf import settings
 from practice.models import Interaction
-from .models import UserSimilarity, QuestionSimilarity, Recommendation, UserPreference
+from .models import Recommendation, UserPreference
+from .answered import AnsweredSet
+from .matrix import SimilarityEngine, neighbor_k
+from .ann import DEFAULT_N_PROBE, UserANNIndex
+from .artifact import ARTIFACT_TABLES, ArtifactStore
+from .factorization import ALSModel
+from .content import QuestionEmbeddings
+from .graph import WalkGraph, walk_settings
+from .popularity import PopularityIndex
+from .preferences import UserPreferenceBuilder
+from .telemetry import ServingTelemetry
 from questions.models import Question
 from users.models import User
 import math
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 基于用户的推荐默认使用的相似用户数
+DEFAULT_USER_BASED_NEIGHBORS = 30
+
 
 class CollaborativeFiltering:
     """
@@ -115,56 +129,12 @@ class CollaborativeFiltering:
             int: 更新的记录数
         """
         logger.info(f"Updating user similarities for target_user: {target_user.id if target_user else 'all'}")
-        
-        # 获取所有有答题记录的用户
-        users_with_interactions = User.objects.filter(
-            interaction__isnull=False
-        ).distinct()
-
-        if target_user:
-            users_with_interactions = users_with_interactions.filter(
-                Q(id=target_user.id) | Q(interaction__question__interaction__user=target_user)
-            ).distinct()
-
-        users_list = list(users_with_interactions)
-        updated_count = 0
-
-        for i, user_a in enumerate(users_list):
-            for user_b in users_list[i+1:]:
-                # 跳过同一用户
-                if user_a.id == user_b.id:
-                    continue
-
-                # 如果指定了目标用户，只计算与目标用户的相似度
-                if target_user and user_a.id != target_user.id and user_b.id != target_user.id:
-                    continue
-
-                # 计算相似度
-                similarity = CollaborativeFiltering.calculate_user_similarity(
-                    user_a, user_b, min_common_questions
-                )
 
-                # 获取共同答题数量
-                common_questions_count = Interaction.objects.filter(
-                    user=user_a,
-                    score__isnull=False
-                ).filter(
-                    question__interaction__user=user_b,
-                    question__interaction__score__isnull=False
-                ).distinct().count()
-
-                # 更新或创建相似度记录
-                UserSimilarity.objects.update_or_create(
-                    user_a=user_a,
-                    user_b=user_b,
-                    defaults={
-                        'similarity_score': similarity,
-                        'common_questions': common_questions_count
-                    }
-                )
-                updated_count += 1
-
-        return updated_count
+        # 使用稀疏矩阵引擎批量计算，避免逐对查询
+        return SimilarityEngine.rebuild_user_similarities(
+            min_common_questions=min_common_questions,
+            target_user=target_user
+        )
 
     @staticmethod
     def calculate_question_similarity(
@@ -254,64 +224,73 @@ class CollaborativeFiltering:
             int: 更新的记录数
         """
         logger.info(f"Updating question similarities for target_question: {target_question.id if target_question else 'all'}")
-        
-        # 获取所有有答题记录的题目
-        questions_with_interactions = Question.objects.filter(
-            interaction__isnull=False,
-            is_approved=True
-        ).distinct()
-
-        if target_question:
-            questions_with_interactions = questions_with_interactions.filter(
-                Q(id=target_question.id) | Q(interaction__user__interaction__question=target_question)
-            ).distinct()
-
-        questions_list = list(questions_with_interactions)
-        updated_count = 0
-
-        for i, question_a in enumerate(questions_list):
-            for question_b in questions_list[i+1:]:
-                # 跳过同一题目
-                if question_a.id == question_b.id:
-                    continue
-
-                # 如果指定了目标题目，只计算与目标题目的相似度
-                if target_question and question_a.id != target_question.id and question_b.id != target_question.id:
-                    continue
-
-                # 计算相似度
-                similarity = CollaborativeFiltering.calculate_question_similarity(
-                    question_a, question_b, min_common_users
-                )
 
-                # 获取共同答题用户数量
-                common_users_count = Interaction.objects.filter(
-                    question=question_a,
-                    score__isnull=False
-                ).filter(
-                    user__interaction__question=question_b,
-                    user__interaction__score__isnull=False
-                ).distinct().count()
-
-                # 更新或创建相似度记录
-                QuestionSimilarity.objects.update_or_create(
-                    question_a=question_a,
-                    question_b=question_b,
-                    defaults={
-                        'similarity_score': similarity,
-                        'common_users': common_users_count
-                    }
+        # 使用稀疏矩阵引擎按内存预算分块计算，避免逐对查询
+        return SimilarityEngine.rebuild_question_similarities(
+            min_common_users=min_common_users,
+            target_question=target_question
+        )
+
+    @staticmethod
+    def similar_users(user_id: int, min_similarity: float = 0.1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        获取相似用户（按相似度降序）
+
+        启用 RECOMMENDER_USER_ANN 且已构建 ANN 索引时，在索引中近似查找（不依赖全量相似度矩阵）；
+        启用 RECOMMENDER_USE_ARTIFACT 且已导出近邻矩阵时，直接切片内存映射的数组；
+        否则查询 UserNeighbor 表。
+
+        Args:
+            user_id: 用户 ID
+            min_similarity: 最小相似度阈值
+
+        Returns:
+            (neighbor_ids, scores): 相似用户 ID 数组与相似度数组
+        """
+        if getattr(settings, 'RECOMMENDER_USER_ANN', False):
+            index = UserANNIndex.current()
+            if index is not None:
+                return index.query(
+                    user_id, neighbor_k(),
+                    getattr(settings, 'RECOMMENDER_ANN_N_PROBE', DEFAULT_N_PROBE),
+                    min_similarity
                 )
-                updated_count += 1
+        return _lookup_neighbors('user', user_id, min_similarity)
 
-        logger.info(f"Updated {updated_count} question similarities")
-        return updated_count
+    @staticmethod
+    def similar_questions(question_id: int, min_similarity: float = 0.1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        获取相似题目（按相似度降序），数据来源同 similar_users
+
+        Args:
+            question_id: 题目 ID
+            min_similarity: 最小相似度阈值
+
+        Returns:
+            (neighbor_ids, scores): 相似题目 ID 数组与相似度数组
+        """
+        return _lookup_neighbors('question', question_id, min_similarity)
+
+    @staticmethod
+    def similar_questions_many(question_ids, min_similarity: float = 0.1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        一次获取多道题目的相似题目（一次 IN 查询，或一次内存映射数组读取）
+
+        Args:
+            question_ids: 题目 ID 列表
+            min_similarity: 最小相似度阈值
+
+        Returns:
+            (question_ids, neighbor_ids, scores): 三个等长数组，每个元素是一条近邻记录
+        """
+        return _lookup_neighbors_many('question', question_ids, min_similarity)
 
     @staticmethod
     def user_based_recommend(
         user: User,
         n: int = 10,
-        min_similarity: float = 0.1
+        min_similarity: float = 0.1,
+        max_neighbors: Optional[int] = None
     ) -> List[Tuple[Question, float, str]]:
         """
         基于用户的协同过滤推荐
@@ -320,81 +299,91 @@ class CollaborativeFiltering:
             user: 目标用户
             n: 推荐题目数量
             min_similarity: 最小相似度阈值
+            max_neighbors: 最多使用的相似用户数，默认取 RECOMMENDER_USER_BASED_NEIGHBORS
         
         Returns:
             list: 推荐的题目列表 [(question, score, reason), ...]
         """
         logger.info(f"Generating user-based recommendations for user {user.id}")
+        ServingTelemetry.record_run('user_based')
         
-        # 获取用户已答题目
-        answered_questions = set(
-            Interaction.objects.filter(
-                user=user,
-                is_submitted=True
-            ).values_list('question_id', flat=True)
-        )
+        # 获取用户已答题目（位图）
+        answered_questions = AnsweredSet.for_user(user.id)
         
         # 冷启动处理：如果用户答题数少于3个，使用热门题目推荐
         if len(answered_questions) < 3:
             logger.info(f"User {user.id} has insufficient data, using popular questions")
-            return CollaborativeFiltering._popular_questions_recommend(user, n, answered_questions)
+            return CollaborativeFiltering._popular_fallback(user, n, answered_questions, 'user_based')
         
-        # 获取相似用户
-        similar_users = UserSimilarity.objects.filter(
-            Q(user_a=user) | Q(user_b=user),
-            similarity_score__gte=min_similarity
-        ).order_by('-similarity_score')
+        # 获取相似度最高的前 M 个相似用户
+        neighbor_ids, neighbor_scores = CollaborativeFiltering.similar_users(user.id, min_similarity)
+        if max_neighbors is None:
+            max_neighbors = getattr(settings, 'RECOMMENDER_USER_BASED_NEIGHBORS', DEFAULT_USER_BASED_NEIGHBORS)
+        neighbor_ids, neighbor_scores = neighbor_ids[:max_neighbors], neighbor_scores[:max_neighbors]
         
         # 如果没有相似用户，使用热门题目
-        if not similar_users.exists():
+        if not len(neighbor_ids):
             logger.info(f"No similar users found for user {user.id}, using popular questions")
-            return CollaborativeFiltering._popular_questions_recommend(user, n, answered_questions)
+            return CollaborativeFiltering._popular_fallback(user, n, answered_questions, 'user_based')
         
-        recommendations = defaultdict(float)
-        reasons = defaultdict(list)
+        similarities = dict(zip(neighbor_ids.tolist(), neighbor_scores.tolist()))
         
-        for sim in similar_users:
-            # 确定相似用户
-            similar_user = sim.user_b if sim.user_a == user else sim.user_a
-            
-            # 获取相似用户的答题记录（只考虑高分题目）
-            similar_user_interactions = Interaction.objects.filter(
-                user=similar_user,
+        # 一次取出所有相似用户的高分答题记录，用位图一次过滤掉已答题目
+        rows = list(
+            Interaction.objects.filter(
+                user_id__in=list(similarities),
                 score__isnull=False,
                 is_submitted=True,
                 score__gte=60
-            ).exclude(question_id__in=answered_questions).select_related('question')
-            
-            for interaction in similar_user_interactions:
-                question_id = interaction.question_id
-                score = interaction.score
-                
-                # 计算推荐分数：相似度 * 用户评分
-                rec_score = sim.similarity_score * (score / 100)
-                
-                recommendations[question_id] += rec_score
-                reasons[question_id].append(
-                    f"相似用户 {similar_user.username} 得分 {score}"
-                )
+            ).values_list('user_id', 'question_id', 'score')
+        )
+        keep = ~answered_questions.contains(
+            np.fromiter((question_id for _, question_id, _ in rows), dtype=np.int64, count=len(rows))
+        )
+        contributions = [row for row, kept in zip(rows, keep.tolist()) if kept]
         
         # 如果没有推荐结果，使用热门题目
-        if not recommendations:
+        if not contributions:
             logger.info(f"No recommendations generated for user {user.id}, using popular questions")
-            return CollaborativeFiltering._popular_questions_recommend(user, n, answered_questions)
+            return CollaborativeFiltering._popular_fallback(user, n, answered_questions, 'user_based')
+        
+        # 累加推荐分数：Σ 相似度 * 相似用户评分
+        weights = np.array(
+            [similarities[similar_user_id] * (score / 100) for similar_user_id, _, score in contributions],
+            dtype=np.float64
+        )
+        question_ids, inverse = np.unique(
+            np.array([question_id for _, question_id, _ in contributions], dtype=np.int64), return_inverse=True
+        )
+        totals = np.bincount(inverse, weights=weights, minlength=len(question_ids))
+        
+        # 分数降序、ID 升序取前 n 个推荐
+        order = np.lexsort((question_ids, -totals))[:n]
+        top = list(zip(question_ids[order].tolist(), totals[order].tolist()))
+        questions = Question.objects.in_bulk([question_id for question_id, _ in top])
         
-        # 排序并返回前 n 个推荐
-        sorted_recommendations = sorted(
-            recommendations.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )[:n]
+        # 只为最终结果生成推荐理由（按相似用户的相似度排序）
+        rank = {similar_user_id: position for position, similar_user_id in enumerate(similarities)}
+        reasons = defaultdict(list)
+        for similar_user_id, question_id, score in sorted(contributions, key=lambda row: rank[row[0]]):
+            if question_id in questions:
+                reasons[question_id].append((similar_user_id, score))
+        usernames = dict(
+            User.objects.filter(
+                id__in={similar_user_id for entries in reasons.values() for similar_user_id, _ in entries}
+            ).values_list('id', 'username')
+        )
         
         # 构建推荐结果
         result = []
-        for question_id, score in sorted_recommendations:
-            question = Question.objects.get(id=question_id)
-            reason = "、".join(reasons[question_id])
-            result.append((question, score, reason))
+        for question_id, score in top:
+            if question_id not in questions:
+                continue
+            reason = "、".join(
+                f"相似用户 {usernames.get(similar_user_id, similar_user_id)} 得分 {user_score}"
+                for similar_user_id, user_score in reasons[question_id]
+            )
+            result.append((questions[question_id], score, reason))
         
         return result
     
@@ -402,27 +391,32 @@ class CollaborativeFiltering:
     def _popular_questions_recommend(
         user: User,
         n: int,
-        answered_questions: set
+        answered_questions
     ) -> List[Tuple[Question, float, str]]:
         """
-        热门题目推荐（用于冷启动）
+        热门题目推荐（用于冷启动），读取按时间衰减的热度索引，不聚合答题记录
         """
-        popular_questions = Question.objects.filter(
-            is_approved=True,
-            is_public=True
-        ).exclude(id__in=answered_questions).annotate(
-            answer_count=Count('interactions')
-        ).order_by('-answer_count', '-view_count')[:n]
-        
-        result = []
-        for question in popular_questions:
-            result.append((
-                question,
-                0.5,
-                f"热门题目（{question.answer_count}人已答）"
-            ))
-        
-        return result
+        question_ids, _, counts = PopularityIndex.current().top(n, answered_questions)
+        questions = Question.objects.in_bulk(question_ids.tolist())
+
+        return [
+            (questions[question_id], 0.5, f"热门题目（{count}人已答）")
+            for question_id, count in zip(question_ids.tolist(), counts.tolist())
+            if question_id in questions
+        ]
+
+    @staticmethod
+    def _popular_fallback(
+        user: User,
+        n: int,
+        answered_questions,
+        algorithm: str
+    ) -> List[Tuple[Question, float, str]]:
+        """
+        推荐算法缺少数据或模型时回退到热门题目，并计入该算法的回退次数
+        """
+        ServingTelemetry.record_fallback(algorithm)
+        return CollaborativeFiltering._popular_questions_recommend(user, n, answered_questions)
 
     @staticmethod
     def item_based_recommend(
@@ -442,56 +436,54 @@ class CollaborativeFiltering:
             list: 推荐的题目列表 [(question, score, reason), ...]
         """
         logger.info(f"Generating item-based recommendations for user {user.id}")
+        ServingTelemetry.record_run('item_based')
         
         # 获取用户已答题目及评分
-        user_interactions = Interaction.objects.filter(
-            user=user,
-            score__isnull=False,
-            is_submitted=True
+        answered_questions = dict(
+            Interaction.objects.filter(
+                user=user,
+                score__isnull=False,
+                is_submitted=True
+            ).values_list('question_id', 'score')
         )
 
-        answered_questions = {item.question_id: item.score for item in user_interactions}
-
-        recommendations = defaultdict(float)
-        reasons = defaultdict(list)
-
-        # 对用户已答的每个题目，找到相似题目
-        for question_id, user_score in answered_questions.items():
-            # 获取相似题目
-            similar_questions = QuestionSimilarity.objects.filter(
-                Q(question_a_id=question_id) | Q(question_b_id=question_id),
-                similarity_score__gte=min_similarity
-            ).order_by('-similarity_score')
-
-            for sim in similar_questions:
-                # 确定相似题目
-                similar_question_id = sim.question_b_id if sim.question_a_id == question_id else sim.question_a_id
+        # 一次取出所有已答题目的相似题目
+        sources, candidates, similarities = CollaborativeFiltering.similar_questions_many(
+            list(answered_questions), min_similarity
+        )
 
-                # 跳过已答题目
-                if similar_question_id in answered_questions:
-                    continue
+        # 跳过已答题目（包括已提交但尚未评分的题目）
+        answered = AnsweredSet.for_user(user.id)
+        keep = ~answered.contains(candidates)
+        sources, candidates, similarities = sources[keep], candidates[keep], similarities[keep]
 
-                # 计算推荐分数：相似度 * 用户对该题目的评分
-                rec_score = sim.similarity_score * (user_score / 100)
+        # 没有相似的未答题目（新用户或已答题目都没有近邻），使用热门题目
+        if not len(candidates):
+            logger.info(f"No similar questions found for user {user.id}, using popular questions")
+            return CollaborativeFiltering._popular_fallback(user, n, answered, 'item_based')
 
-                recommendations[similar_question_id] += rec_score
-                reasons[similar_question_id].append(
-                    f"与已答题 Q{question_id} 相似度 {sim.similarity_score:.2f}"
-                )
+        # 推荐分数：Σ 相似度 * 用户对已答题目的评分
+        user_scores = np.array([answered_questions[question_id] for question_id in sources.tolist()], dtype=np.float64)
+        contributions = similarities.astype(np.float64) * (user_scores / 100)
+        question_ids, inverse = np.unique(candidates, return_inverse=True)
+        totals = np.bincount(inverse, weights=contributions, minlength=len(question_ids))
 
-        # 排序并返回前 n 个推荐
-        sorted_recommendations = sorted(
-            recommendations.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )[:n]
+        # 分数降序、ID 升序取前 n 个
+        top = np.lexsort((question_ids, -totals))[:n]
+        top_ids = question_ids[top].tolist()
+        questions = Question.objects.in_bulk(top_ids)
 
-        # 构建推荐结果
+        # 构建推荐结果（只为最终结果生成推荐理由）
         result = []
-        for question_id, score in sorted_recommendations:
-            question = Question.objects.get(id=question_id)
-            reason = "、".join(reasons[question_id])
-            result.append((question, score, reason))
+        for position, question_id in zip(top.tolist(), top_ids):
+            if question_id not in questions:
+                continue
+            contributed = np.flatnonzero(inverse == position)
+            reason = "、".join(
+                f"与已答题 Q{source} 相似度 {similarity:.2f}"
+                for source, similarity in zip(sources[contributed].tolist(), similarities[contributed].tolist())
+            )
+            result.append((questions[question_id], float(totals[position]), reason))
 
         logger.info(f"Generated {len(result)} item-based recommendations")
         return result
@@ -501,127 +493,270 @@ class CollaborativeFiltering:
         user: User,
         n: int = 10,
         user_weight: float = 0.5,
-        item_weight: float = 0.5
+        item_weight: float = 0.5,
+        min_similarity: float = 0.1
     ) -> List[Tuple[Question, float, str]]:
         """
-        混合推荐算法（结合基于用户和基于物品的推荐）
+        混合推荐算法：通过推荐流水线并发执行基于用户与基于物品的召回（以及配置启用的其他生成器），再合并重排
 
         Args:
             user: 目标用户
             n: 推荐题目数量
             user_weight: 基于用户的推荐权重
             item_weight: 基于物品的推荐权重
+            min_similarity: 最小相似度阈值
 
         Returns:
             list: 推荐的题目列表 [(question, score, reason), ...]
         """
+        # 流水线的候选生成器调用本类的方法，延迟导入避免循环依赖
+        from .pipeline import RecommendationPipeline
+
         logger.info(f"Generating hybrid recommendations for user {user.id}")
-        
-        # 获取两种推荐结果
-        user_based = CollaborativeFiltering.user_based_recommend(user, n * 2)
-        item_based = CollaborativeFiltering.item_based_recommend(user, n * 2)
+        generators = RecommendationPipeline.generators({'user_based': user_weight, 'item_based': item_weight})
+        return RecommendationPipeline.run(user, n, min_similarity, generators).recommendations
 
-        # 合并推荐结果
-        combined = defaultdict(float)
-        reasons = defaultdict(list)
+    @staticmethod
+    def mf_recommend(
+        user: User,
+        n: int = 10
+    ) -> List[Tuple[Question, float, str]]:
+        """
+        矩阵分解推荐：用户因子与所有题目因子做一次点积，argpartition 取前 n 个
 
-        # 添加基于用户的推荐
-        for question, score, reason in user_based:
-            combined[question.id] += score * user_weight
-            reasons[question.id].append(f"用户推荐: {reason}")
+        模型由 train_mf_model 命令训练发布；没有模型或用户不在模型中（训练后才开始答题）时使用热门题目
 
-        # 添加基于物品的推荐
-        for question, score, reason in item_based:
-            combined[question.id] += score * item_weight
-            reasons[question.id].append(f"物品推荐: {reason}")
+        Args:
+            user: 目标用户
+            n: 推荐题目数量
 
-        # 排序并返回前 n 个推荐
-        sorted_recommendations = sorted(
-            combined.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )[:n]
+        Returns:
+            list: 推荐的题目列表 [(question, score, reason), ...]
+        """
+        logger.info(f"Generating MF recommendations for user {user.id}")
+        ServingTelemetry.record_run('mf')
 
-        # 构建推荐结果
-        result = []
-        for question_id, score in sorted_recommendations:
-            question = Question.objects.get(id=question_id)
-            reason = "; ".join(reasons[question_id])
-            result.append((question, score, reason))
+        answered_questions = AnsweredSet.for_user(user.id)
 
-        return result
+        model = ALSModel.current()
+        if model is None:
+            logger.info("No MF model published, using popular questions")
+            return CollaborativeFiltering._popular_fallback(user, n, answered_questions, 'mf')
+
+        question_ids, scores = model.recommend(user.id, n, answered_questions)
+        if not len(question_ids):
+            logger.info(f"User {user.id} is not in the MF model, using popular questions")
+            return CollaborativeFiltering._popular_fallback(user, n, answered_questions, 'mf')
+
+        questions = Question.objects.in_bulk(question_ids.tolist())
+        return [
+            (questions[question_id], score, f"预测得分 {score * 100:.0f}")
+            for question_id, score in zip(question_ids.tolist(), scores.tolist())
+            if question_id in questions
+        ]
 
     @staticmethod
-    def update_user_preferences(user):
+    def content_based_recommend(
+        user: User,
+        n: int = 10
+    ) -> List[Tuple[Question, float, str]]:
         """
-        更新用户偏好分析
+        基于内容的推荐：已答题目嵌入按得分加权得到用户画像，与题目嵌入矩阵做一次矩阵-向量乘法
+
+        嵌入矩阵由 build_question_embeddings 命令预计算；没有嵌入矩阵或用户没有已评分的答题时使用热门题目
 
         Args:
             user: 目标用户
+            n: 推荐题目数量
+
+        Returns:
+            list: 推荐的题目列表 [(question, score, reason), ...]
         """
-        # 获取用户答题记录
-        interactions = Interaction.objects.filter(
-            user=user,
-            score__isnull=False,
-            is_submitted=True
+        logger.info(f"Generating content-based recommendations for user {user.id}")
+        ServingTelemetry.record_run('content_based')
+
+        answered_questions = AnsweredSet.for_user(user.id)
+        scored = [
+            (question_id, score / 100)
+            for question_id, score in Interaction.objects.filter(
+                user=user,
+                is_submitted=True
+            ).values_list('question_id', 'score')
+            if score is not None
+        ]
+
+        embeddings = QuestionEmbeddings.current()
+        profile = None
+        if embeddings is not None and scored:
+            profile = embeddings.profile(*zip(*scored))
+        if profile is None:
+            logger.info(f"No content profile for user {user.id}, using popular questions")
+            return CollaborativeFiltering._popular_fallback(user, n, answered_questions, 'content_based')
+
+        question_ids, scores = embeddings.recommend(profile, n, answered_questions)
+        questions = Question.objects.in_bulk(question_ids.tolist())
+
+        # 推荐理由：与每道推荐题目内容最接近的已答题目（只对最终结果计算）
+        source_ids = np.array([question_id for question_id, _ in scored], dtype=np.int64)
+        source_ids = source_ids[embeddings.positions(source_ids) >= 0]
+        similarity = (
+            embeddings.vectors[embeddings.positions(question_ids)]
+            @ embeddings.vectors[embeddings.positions(source_ids)].T
         )
+        closest = source_ids[similarity.argmax(axis=1)].tolist()
 
-        if not interactions.exists():
-            return
+        return [
+            (questions[question_id], score, f"与已答题 Q{source_id} 内容相似")
+            for question_id, score, source_id in zip(question_ids.tolist(), scores.tolist(), closest)
+            if question_id in questions
+        ]
 
-        # 计算平均分数
-        avg_score = interactions.aggregate(avg=Avg('score'))['avg'] or 0
-        total_answered = interactions.count()
+    @staticmethod
+    def graph_recommend(
+        user: User,
+        n: int = 10
+    ) -> List[Tuple[Question, float, str]]:
+        """
+        图随机游走推荐：从用户出发在用户-题目二部图上做带重启的随机游走，按停留概率排序
 
-        # 计算分类偏好
-        category_stats = interactions.values('question__category__name').annotate(
-            avg_score=Avg('score'),
-            count=Count('id')
-        )
+        二部图由 build_walk_graph 命令构建发布；没有二部图或用户不在图中时使用热门题目
 
-        preferred_categories = {}
-        weak_areas = []
-        strong_areas = []
-
-        for stat in category_stats:
-            category_name = stat['question__category__name']
-            if category_name:
-                preferred_categories[category_name] = {
-                    'avg_score': stat['avg_score'],
-                    'count': stat['count'],
-                    'weight': stat['avg_score'] / 100
-                }
-
-                # 判断强弱项
-                if stat['avg_score'] < 60:
-                    weak_areas.append(category_name)
-                elif stat['avg_score'] >= 80:
-                    strong_areas.append(category_name)
-
-        # 计算难度偏好
-        difficulty_stats = interactions.values('question__difficulty').annotate(
-            avg_score=Avg('score'),
-            count=Count('id')
-        )
+        Args:
+            user: 目标用户
+            n: 推荐题目数量
 
-        preferred_difficulty = {}
-        for stat in difficulty_stats:
-            difficulty = stat['question__difficulty']
-            preferred_difficulty[str(difficulty)] = {
-                'avg_score': stat['avg_score'],
-                'count': stat['count'],
-                'weight': stat['avg_score'] / 100
-            }
+        Returns:
+            list: 推荐的题目列表 [(question, score, reason), ...]
+        """
+        return CollaborativeFiltering.graph_recommend_many([user], n)[user.id]
+
+    @staticmethod
+    def graph_recommend_many(
+        users: List[User],
+        n: int = 10
+    ) -> Dict[int, List[Tuple[Question, float, str]]]:
+        """
+        为一批用户同时做随机游走（离线物化使用），题目一次查询取出
 
-        # 更新或创建用户偏好
-        UserPreference.objects.update_or_create(
-            user=user,
-            defaults={
-                'preferred_categories': preferred_categories,
-                'preferred_difficulty': preferred_difficulty,
-                'weak_areas': weak_areas,
-                'strong_areas': strong_areas,
-                'avg_score': avg_score,
-                'total_answered': total_answered
+        Returns:
+            dict: 用户 ID -> 推荐的题目列表
+        """
+        logger.info(f"Generating graph recommendations for {len(users)} users")
+        ServingTelemetry.record_run('graph', len(users))
+
+        answered = {user.id: AnsweredSet.for_user(user.id) for user in users}
+        graph = WalkGraph.current()
+        ranked = {}
+        if graph is not None:
+            options = walk_settings()
+            ranked = {
+                user_id: (question_ids, scores)
+                for user_id, question_ids, scores in graph.recommend_many(
+                    list(answered), n, answered,
+                    restart=options['restart'], iterations=options['iterations']
+                )
+                if len(question_ids)
             }
+        questions = Question.objects.in_bulk(
+            [question_id for question_ids, _ in ranked.values() for question_id in question_ids.tolist()]
         )
+
+        result = {}
+        for user in users:
+            if user.id not in ranked:
+                logger.info(f"User {user.id} is not in the walk graph, using popular questions")
+                result[user.id] = CollaborativeFiltering._popular_fallback(user, n, answered[user.id], 'graph')
+                continue
+            question_ids, scores = ranked[user.id]
+            result[user.id] = [
+                (questions[question_id], score, f"图游走相关度 {score:.4f}")
+                for question_id, score in zip(question_ids.tolist(), scores.tolist())
+                if question_id in questions
+            ]
+        return result
+
+    @staticmethod
+    def recommend(
+        user: User,
+        recommendation_type: str = 'hybrid',
+        n: int = 10,
+        min_similarity: float = 0.1
+    ) -> List[Tuple[Question, float, str]]:
+        """
+        按推荐类型生成推荐
+
+        Args:
+            user: 目标用户
+            recommendation_type: 推荐类型 (user_based, item_based, hybrid, mf, content_based, graph)
+            n: 推荐题目数量
+            min_similarity: 最小相似度阈值（只用于 user_based、item_based 与 hybrid）
+
+        Returns:
+            list: 推荐的题目列表 [(question, score, reason), ...]
+
+        Raises:
+            ValueError: 不支持的推荐类型
+        """
+        if recommendation_type == 'user_based':
+            return CollaborativeFiltering.user_based_recommend(user, n, min_similarity)
+        if recommendation_type == 'item_based':
+            return CollaborativeFiltering.item_based_recommend(user, n, min_similarity)
+        if recommendation_type == 'hybrid':
+            return CollaborativeFiltering.hybrid_recommend(user, n, min_similarity=min_similarity)
+        if recommendation_type == 'mf':
+            return CollaborativeFiltering.mf_recommend(user, n)
+        if recommendation_type == 'content_based':
+            return CollaborativeFiltering.content_based_recommend(user, n)
+        if recommendation_type == 'graph':
+            return CollaborativeFiltering.graph_recommend(user, n)
+        raise ValueError(f"Unsupported recommendation type: {recommendation_type}")
+
+    @staticmethod
+    def update_user_preferences(user):
+        """
+        更新用户偏好分析（没有评分答题记录时不写入）
+
+        Args:
+            user: 目标用户
+        """
+        UserPreferenceBuilder.build([user.id])
+
+
+def _lookup_neighbors(kind: str, owner_id: int, min_similarity: float) -> Tuple[np.ndarray, np.ndarray]:
+    if getattr(settings, 'RECOMMENDER_USE_ARTIFACT', False):
+        artifact = ArtifactStore.get(kind)
+        if artifact is not None:
+            return artifact.lookup(owner_id, min_similarity)
+
+    tables = ARTIFACT_TABLES[kind]
+    rows = list(
+        tables.neighbor_model.objects.active().filter(
+            **{f'{tables.owner_field}_id': owner_id},
+            similarity_score__gte=min_similarity
+        ).order_by('rank').values_list('neighbor_id', 'similarity_score')
+    )
+    return (
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([row[1] for row in rows], dtype=np.float64),
+    )
+
+
+def _lookup_neighbors_many(kind: str, owner_ids, min_similarity: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if getattr(settings, 'RECOMMENDER_USE_ARTIFACT', False):
+        artifact = ArtifactStore.get(kind)
+        if artifact is not None:
+            return artifact.lookup_many(owner_ids, min_similarity)
+
+    tables = ARTIFACT_TABLES[kind]
+    owner_field = f'{tables.owner_field}_id'
+    rows = list(
+        tables.neighbor_model.objects.active().filter(
+            **{f'{owner_field}__in': list(owner_ids)},
+            similarity_score__gte=min_similarity
+        ).order_by(owner_field, 'rank').values_list(owner_field, 'neighbor_id', 'similarity_score')
+    )
+    return (
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([row[1] for row in rows], dtype=np.int64),
+        np.array([row[2] for row in rows], dtype=np.float64),
+    )
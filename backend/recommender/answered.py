@@ -0,0 +1,158 @@
+"""
+用户已答题目的位图
+
+每个推荐路径都要跳过用户已答的题目。逐次从数据库取出已答题目 ID 组成 Python set，再用 exclude(id__in=...)
+或逐个候选判断，对答题多的用户意味着很长的 NOT IN 和重复的内存分配。这里把已答题目保存为以题目 ID 为下标的位图：
+
+- 题目 ID 是自增主键，本身就是稠密下标，无需维护 ID -> 下标的全局映射（新增题目不会使已有位图失效）；
+- 位图按字节打包（np.packbits），缓存时再用 zlib 压缩，未答区间的全零字节几乎不占空间；
+- 候选过滤是一次向量化查表：bits[ids >> 3] >> (ids & 7) & 1，与候选数量成正比、与已答数量无关；
+- 答题记录提交时在缓存中置位（见 signals.py），撤回提交或删除时丢弃缓存，下次读取重新构建；
+  两者都在事务提交后执行，回滚的答题不会留在位图中。
+
+同一用户的两次提交几乎同时到达时，置位可能丢失其中一次；缓存条目在 RECOMMENDER_CACHE_TIMEOUT 后过期重建。
+"""
+import zlib
+from typing import Iterable
+from django.core.cache import cache
+from practice.models import Interaction
+from .caching import cache_timeout
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_key(user_id: int) -> str:
+    return f'answered_bitmap_{user_id}'
+
+
+class AnsweredSet:
+    """
+    已答题目 ID 的位图（第 i 位表示题目 ID i）
+    """
+    __slots__ = ('bits', 'count')
+
+    def __init__(self, bits: np.ndarray, count: int):
+        self.bits = bits
+        self.count = count
+
+    @staticmethod
+    def from_ids(question_ids: Iterable[int]) -> 'AnsweredSet':
+        """
+        由题目 ID 构建位图
+        """
+        question_ids = np.unique(np.fromiter(question_ids, dtype=np.int64))
+        if not len(question_ids):
+            return AnsweredSet(np.zeros(0, dtype=np.uint8), 0)
+        flags = np.zeros(int(question_ids[-1]) + 1, dtype=bool)
+        flags[question_ids] = True
+        return AnsweredSet(np.packbits(flags, bitorder='little'), len(question_ids))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, question_id: int) -> bool:
+        return bool(self.contains(np.array([question_id], dtype=np.int64))[0])
+
+    def contains(self, question_ids: np.ndarray) -> np.ndarray:
+        """
+        向量化判断每个题目是否已答
+
+        Args:
+            question_ids: 题目 ID 数组
+
+        Returns:
+            np.ndarray: 与 question_ids 等长的布尔数组
+        """
+        question_ids = np.asarray(question_ids, dtype=np.int64)
+        byte_index = question_ids >> 3
+        inside = (question_ids >= 0) & (byte_index < len(self.bits))
+        result = np.zeros(len(question_ids), dtype=bool)
+        result[inside] = (self.bits[byte_index[inside]] >> (question_ids[inside] & 7)) & 1 == 1
+        return result
+
+    def ids(self) -> np.ndarray:
+        """
+        已答题目 ID（升序）
+        """
+        return np.flatnonzero(np.unpackbits(self.bits, bitorder='little'))
+
+    def add(self, question_id: int) -> bool:
+        """
+        置位，位图长度不够时扩展
+
+        Returns:
+            bool: 是否新增（原来未置位）
+        """
+        byte_index, bit = question_id >> 3, question_id & 7
+        if byte_index >= len(self.bits):
+            self.bits = np.concatenate([self.bits, np.zeros(byte_index + 1 - len(self.bits), dtype=np.uint8)])
+        elif self.bits[byte_index] >> bit & 1:
+            return False
+        self.bits[byte_index] |= np.uint8(1 << bit)
+        self.count += 1
+        return True
+
+    def dumps(self) -> tuple:
+        return self.count, zlib.compress(self.bits.tobytes())
+
+    @staticmethod
+    def loads(data: tuple) -> 'AnsweredSet':
+        count, compressed = data
+        return AnsweredSet(np.frombuffer(zlib.decompress(compressed), dtype=np.uint8).copy(), count)
+
+    @staticmethod
+    def for_user(user_id: int) -> 'AnsweredSet':
+        """
+        用户已提交答题的题目位图（优先读缓存，未命中时一次查询构建）
+        """
+        data = cache.get(_cache_key(user_id))
+        if data is not None:
+            return AnsweredSet.loads(data)
+
+        answered = AnsweredSet.from_ids(
+            Interaction.objects.filter(
+                user_id=user_id,
+                is_submitted=True
+            ).values_list('question_id', flat=True)
+        )
+        cache.set(_cache_key(user_id), answered.dumps(), timeout=cache_timeout())
+        return answered
+
+    @staticmethod
+    def record(user_id: int, question_id: int):
+        """
+        用户提交答题后增量置位（没有缓存时不处理，下次读取时构建）
+        """
+        data = cache.get(_cache_key(user_id))
+        if data is None:
+            return
+        answered = AnsweredSet.loads(data)
+        if answered.add(question_id):
+            cache.set(_cache_key(user_id), answered.dumps(), timeout=cache_timeout())
+
+    @staticmethod
+    def invalidate(user_id: int):
+        """
+        丢弃用户的位图缓存（撤回提交或删除答题记录时，同一题目可能还有其他已提交记录，需要重新构建）
+        """
+        cache.delete(_cache_key(user_id))
+
+
+def exclusion_mask(question_ids: np.ndarray, exclude) -> np.ndarray:
+    """
+    候选题目中需要跳过的位置
+
+    Args:
+        question_ids: 候选题目 ID 数组
+        exclude: AnsweredSet，或任意题目 ID 集合
+
+    Returns:
+        np.ndarray: 与 question_ids 等长的布尔数组
+    """
+    if isinstance(exclude, AnsweredSet):
+        return exclude.contains(question_ids)
+    exclude = np.fromiter(exclude, dtype=np.int64, count=len(exclude))
+    return np.isin(question_ids, exclude)
+
@@ -0,0 +1,254 @@
+"""
+内存映射的近邻矩阵文件
+
+把 Top-K 近邻表导出为只读的 CSR 数组（.npy），各 worker 进程用 np.load(mmap_mode='r')
+映射同一份文件，共享操作系统页缓存；读取某个用户/题目的近邻只是数组切片，无需查询数据库。
+
+目录结构（RECOMMENDER_ARTIFACT_DIR 下）：
+    user_neighbors-<version>/          每次导出一个版本目录
+        ids.npy        owner ID（升序，int64）
+        indptr.npy     CSR 行指针（int64，长度 len(ids) + 1）
+        neighbors.npy  近邻 ID（int64，每行按 rank 排列）
+        scores.npy     相似度（float32）
+        common.npy     共同答题数/用户数（int32）
+    user_neighbors.current -> user_neighbors-<version>
+
+版本目录先写到临时目录再整体 rename，指针用符号链接 + os.replace 原子切换，
+读取方发现指针变化时重新映射，实现热更新；旧版本目录删除后，已映射的进程仍可继续读取。
+"""
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from django.conf import settings
+from django.utils import timezone
+from .matrix import USER_TABLES, QUESTION_TABLES
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_TABLES = {
+    'user': USER_TABLES,
+    'question': QUESTION_TABLES,
+}
+
+ARRAY_NAMES = ['ids', 'indptr', 'neighbors', 'scores', 'common']
+
+# 导出后保留的历史版本数（含当前版本）
+DEFAULT_KEEP_VERSIONS = 2
+
+
+def artifact_dir() -> Path:
+    return Path(getattr(settings, 'RECOMMENDER_ARTIFACT_DIR', Path(settings.BASE_DIR) / 'data' / 'similarity'))
+
+
+def _pointer(directory: Path, name: str) -> Path:
+    return directory / f'{name}.current'
+
+
+class NeighborArtifact:
+    """
+    一个已映射的近邻矩阵版本
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / 'manifest.json', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        arrays = {name: np.load(self.path / f'{name}.npy', mmap_mode='r') for name in ARRAY_NAMES}
+        self.ids = arrays['ids']
+        self.indptr = arrays['indptr']
+        self.neighbors = arrays['neighbors']
+        self.scores = arrays['scores']
+        self.common = arrays['common']
+
+    @property
+    def version(self) -> str:
+        return self.manifest['version']
+
+    def lookup(self, owner_id: int, min_similarity: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        获取某个用户/题目的近邻（按相似度降序）
+
+        Args:
+            owner_id: 用户/题目 ID
+            min_similarity: 最小相似度阈值
+
+        Returns:
+            (neighbor_ids, scores): 映射数组上的切片（不复制数据）
+        """
+        pos = int(np.searchsorted(self.ids, owner_id))
+        if pos >= len(self.ids) or self.ids[pos] != owner_id:
+            return self.neighbors[:0], self.scores[:0]
+
+        start, end = int(self.indptr[pos]), int(self.indptr[pos + 1])
+        scores = self.scores[start:end]
+        # 每行已按相似度降序排列，满足阈值的是一个前缀
+        cut = int(np.count_nonzero(scores >= min_similarity))
+        return self.neighbors[start:start + cut], scores[:cut]
+
+    def lookup_many(self, owner_ids, min_similarity: float = 0.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        一次获取多个用户/题目的近邻
+
+        Args:
+            owner_ids: 用户/题目 ID 列表
+            min_similarity: 最小相似度阈值
+
+        Returns:
+            (owners, neighbor_ids, scores): 三个等长数组，按 owner_ids 顺序、每个 owner 内按相似度降序
+        """
+        owner_ids = np.asarray(owner_ids, dtype=np.int64)
+        pos = np.searchsorted(self.ids, owner_ids)
+        found = pos < len(self.ids)
+        found[found] = self.ids[pos[found]] == owner_ids[found]
+        owner_ids, pos = owner_ids[found], pos[found]
+
+        starts = np.asarray(self.indptr[pos])
+        lengths = np.asarray(self.indptr[pos + 1]) - starts
+        # 把多个 [start, end) 区间展开成一个下标数组
+        offsets = np.cumsum(lengths) - lengths
+        index = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+        owners = np.repeat(owner_ids, lengths)
+        scores = self.scores[index]
+        keep = scores >= min_similarity
+        return owners[keep], self.neighbors[index][keep], scores[keep]
+
+
+def export_artifact(kind: str, directory: Optional[Path] = None, keep_versions: int = DEFAULT_KEEP_VERSIONS) -> Path:
+    """
+    把近邻表导出为新版本的内存映射文件，并原子切换当前版本
+
+    Args:
+        kind: 'user' 或 'question'
+        directory: 输出目录，默认取 RECOMMENDER_ARTIFACT_DIR
+        keep_versions: 保留的版本数
+
+    Returns:
+        Path: 新版本目录
+    """
+    tables = ARTIFACT_TABLES[kind]
+
+    owner_field = f'{tables.owner_field}_id'
+    rows = tables.neighbor_model.objects.active().order_by(owner_field, 'rank').values_list(
+        owner_field, 'neighbor_id', 'similarity_score', tables.common_field
+    )
+    owners, neighbors, scores, common = [], [], [], []
+    for owner_id, neighbor_id, similarity, count in rows.iterator(chunk_size=10000):
+        owners.append(owner_id)
+        neighbors.append(neighbor_id)
+        scores.append(similarity)
+        common.append(count)
+
+    owners = np.asarray(owners, dtype=np.int64)
+    ids, counts = np.unique(owners, return_counts=True)
+    indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    target = publish(directory or artifact_dir(), f'{kind}_neighbors', {
+        'ids': ids,
+        'indptr': indptr,
+        'neighbors': np.asarray(neighbors, dtype=np.int64),
+        'scores': np.asarray(scores, dtype=np.float32),
+        'common': np.asarray(common, dtype=np.int32),
+    }, {'kind': kind, 'owners': len(ids), 'entries': len(owners)}, keep_versions)
+
+    logger.info(f"Exported {kind} neighbour artifact {target.name} ({len(ids)} owners, {len(owners)} entries)")
+    return target
+
+
+def publish(directory: Path, name: str, arrays: Dict[str, np.ndarray], manifest: dict,
+            keep_versions: int = DEFAULT_KEEP_VERSIONS) -> Path:
+    """
+    把一组数组发布为 <name>-<version> 目录，并原子切换 <name>.current 指针
+
+    Args:
+        directory: 输出目录
+        name: 文件名前缀
+        arrays: 数组名 -> 数组，每个保存为一个 .npy
+        manifest: 写入 manifest.json 的附加信息（会补充 version）
+        keep_versions: 保留的版本数
+
+    Returns:
+        Path: 新版本目录
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    version = timezone.now().strftime('%Y%m%d%H%M%S%f')
+    versioned = f'{name}-{version}'
+    staging = directory / f'.{versioned}.tmp'
+    staging.mkdir()
+    for array_name, array in arrays.items():
+        np.save(staging / f'{array_name}.npy', array)
+    with open(staging / 'manifest.json', 'w', encoding='utf-8') as f:
+        json.dump({**manifest, 'version': version}, f)
+
+    target = directory / versioned
+    os.rename(staging, target)
+
+    # 先建临时符号链接再 replace，读取方不会看到指针缺失的中间状态
+    link = directory / f'.{versioned}.link'
+    os.symlink(versioned, link)
+    os.replace(link, _pointer(directory, name))
+
+    _prune(directory, name, keep_versions)
+    return target
+
+
+def _prune(directory: Path, name: str, keep_versions: int):
+    versions = sorted(path for path in directory.glob(f'{name}-*') if path.is_dir())
+    for path in versions[:-max(1, keep_versions)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class ArtifactStore:
+    """
+    进程内的映射文件缓存，指针切换后自动重新映射
+    """
+
+    _loaded: Dict[str, tuple] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, kind: str, directory: Optional[Path] = None) -> Optional[NeighborArtifact]:
+        """
+        获取当前版本的近邻矩阵，没有导出过时返回 None
+        """
+        return cls.load(f'{kind}_neighbors', NeighborArtifact, directory)
+
+    @classmethod
+    def load(cls, name: str, loader: Callable[[Path], Any], directory: Optional[Path] = None):
+        """
+        获取 <name>.current 指向的版本，用 loader(path) 映射并缓存
+
+        Returns:
+            loader 的返回值，没有发布过或映射失败时返回 None
+        """
+        directory = Path(directory or artifact_dir())
+        try:
+            current = os.readlink(_pointer(directory, name))
+        except OSError:
+            return None
+
+        key = f'{directory}:{name}'
+        loaded = cls._loaded.get(key)
+        if loaded and loaded[0] == current:
+            return loaded[1]
+
+        with cls._lock:
+            loaded = cls._loaded.get(key)
+            if loaded and loaded[0] == current:
+                return loaded[1]
+            try:
+                artifact = loader(directory / current)
+            except OSError as e:
+                logger.warning(f"Failed to map artifact {current}: {e}")
+                return None
+            cls._loaded[key] = (current, artifact)
+            logger.info(f"Mapped artifact {current}")
+            return artifact
@@ -0,0 +1,7 @@
+"""
+推荐系统性能测试：合成数据集生成与计时报告
+"""
+from .dataset import DatasetSpec, clear_dataset, generate_dataset
+from .runner import run_benchmark
+
+__all__ = ['DatasetSpec', 'clear_dataset', 'generate_dataset', 'run_benchmark']
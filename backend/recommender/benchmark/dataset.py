@@ -0,0 +1,185 @@
+"""
+参数化的合成数据集
+
+所有对象都用 bulk_create 分批写入（不逐条 exists() 检查），答题记录按用户分块生成，内存占用与总量无关：
+- 用户活跃度服从幂律分布：第 r 活跃的用户权重 ∝ r^-activity_alpha，答题总数按权重多项分布分配
+  （每个用户至多答全部题目，超出部分分给其他用户）；
+- 题目热度同样服从幂律分布（popularity_alpha），每个用户按热度无放回抽取题目，
+  因此每个 (用户, 题目) 至多一条已提交记录；
+- 得分 = 基础分 + 用户能力 - 难度 + 用户口味与题目主题的内积 + 噪声，截断到 [0, 100]，
+  使协同过滤能学到结构。
+
+生成的对象都带有 prefix 前缀（用户名、题目与分类的 slug），可用 clear_dataset 按前缀删除。
+"""
+import time
+from typing import NamedTuple
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from practice.models import Interaction
+from questions.models import Category, Question
+from users.models import User
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIX = 'bench'
+
+# 每次 bulk_create 的行数
+INSERT_BATCH_SIZE = 5000
+
+# 口味/主题隐向量维数
+TASTE_DIM = 4
+
+
+class DatasetSpec(NamedTuple):
+    """
+    数据集参数
+    """
+    users: int = 10000
+    questions: int = 2000
+    interactions: int = 1000000
+    categories: int = 20
+    activity_alpha: float = 1.0
+    popularity_alpha: float = 0.8
+    seed: int = 0
+    prefix: str = DEFAULT_PREFIX
+
+
+def _power_law(n: int, alpha: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    随机打乱顺序的幂律权重（和为 1）
+    """
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -alpha
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _activity(spec: DatasetSpec, rng: np.random.Generator) -> np.ndarray:
+    """
+    每个用户的答题数：按幂律权重多项分布分配，至少 1 道、至多全部题目；
+    超出题目数的部分重新分配给未饱和的用户，使总数尽量接近 spec.interactions
+    """
+    weights = _power_law(spec.users, spec.activity_alpha, rng)
+    counts = np.clip(rng.multinomial(spec.interactions, weights), 1, spec.questions)
+    excess = spec.interactions - int(counts.sum())
+    while excess > 0:
+        open_users = counts < spec.questions
+        if not open_users.any():
+            break
+        extra = rng.multinomial(excess, weights * open_users / (weights * open_users).sum())
+        counts = np.minimum(counts + extra, spec.questions)
+        excess = spec.interactions - int(counts.sum())
+    return counts
+
+
+def generate_dataset(spec: DatasetSpec) -> dict:
+    """
+    生成并写入合成数据集
+
+    Args:
+        spec: 数据集参数
+
+    Returns:
+        dict: 实际写入的对象数与耗时
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(spec.seed)
+    prefix = spec.prefix
+
+    with transaction.atomic():
+        Category.objects.bulk_create([
+            Category(name=f'{prefix} category {i}', slug=f'{prefix}-c{i}')
+            for i in range(spec.categories)
+        ])
+        category_ids = list(
+            Category.objects.filter(slug__startswith=f'{prefix}-c').order_by('id').values_list('id', flat=True)
+        )
+
+        question_categories = rng.integers(0, spec.categories, spec.questions)
+        difficulties = rng.integers(1, 5, spec.questions)
+        Question.objects.bulk_create([
+            Question(
+                title=f'{prefix} question {i}',
+                slug=f'{prefix}-q{i}',
+                content=f'{prefix} question {i}',
+                category_id=category_ids[question_categories[i]],
+                difficulty=int(difficulties[i]),
+                is_approved=True
+            )
+            for i in range(spec.questions)
+        ], batch_size=INSERT_BATCH_SIZE)
+        question_ids = np.array(
+            Question.objects.filter(slug__startswith=f'{prefix}-q').order_by('id').values_list('id', flat=True)
+        )
+
+        # 所有用户共用一个密码哈希，避免逐个计算
+        password = make_password('password123')
+        User.objects.bulk_create([
+            User(username=f'{prefix}_user{i}', email=f'{prefix}_user{i}@example.com', password=password)
+            for i in range(spec.users)
+        ], batch_size=INSERT_BATCH_SIZE)
+        user_ids = np.array(
+            User.objects.filter(username__startswith=f'{prefix}_user').order_by('id').values_list('id', flat=True)
+        )
+
+    counts = _activity(spec, rng)
+    popularity = _power_law(spec.questions, spec.popularity_alpha, rng)
+
+    skill = rng.normal(0, 8, spec.users)
+    taste = rng.normal(0, 1, (spec.users, TASTE_DIM))
+    topics = rng.normal(0, 1, (spec.categories, TASTE_DIM))[question_categories]
+
+    created = 0
+    batch = []
+    for user_index, (user_id, count) in enumerate(zip(user_ids.tolist(), counts.tolist())):
+        picked = rng.choice(spec.questions, count, replace=False, p=popularity)
+        scores = (
+            65 + skill[user_index] - 5 * (difficulties[picked] - 2.5)
+            + 6 * topics[picked] @ taste[user_index] + rng.normal(0, 8, count)
+        )
+        scores = np.clip(np.round(scores, 1), 0, 100)
+        batch.extend(
+            Interaction(
+                user_id=user_id,
+                question_id=question_id,
+                score=score,
+                time_spent=60,
+                is_submitted=True,
+                status='scored'
+            )
+            for question_id, score in zip(question_ids[picked].tolist(), scores.tolist())
+        )
+        if len(batch) >= INSERT_BATCH_SIZE:
+            Interaction.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        Interaction.objects.bulk_create(batch)
+        created += len(batch)
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Generated dataset '{prefix}': {len(user_ids)} users, {len(question_ids)} questions, "
+        f"{created} interactions ({elapsed:.1f}s)"
+    )
+    return {
+        'users': len(user_ids),
+        'questions': len(question_ids),
+        'interactions': created,
+        'seconds': elapsed,
+    }
+
+
+def clear_dataset(prefix: str = DEFAULT_PREFIX) -> int:
+    """
+    删除带有 prefix 前缀的合成数据（答题记录随用户和题目级联删除）
+
+    Returns:
+        int: 删除的对象数
+    """
+    deleted = 0
+    deleted += User.objects.filter(username__startswith=f'{prefix}_user').delete()[0]
+    deleted += Question.all_objects.filter(slug__startswith=f'{prefix}-q').delete()[0]
+    deleted += Category.all_objects.filter(slug__startswith=f'{prefix}-c').delete()[0]
+    return deleted
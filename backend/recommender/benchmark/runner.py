@@ -0,0 +1,178 @@
+"""
+推荐系统性能测试
+
+依次计时：用户/题目相似度全量重建，以及对抽样用户逐个调用 user_based / item_based / hybrid 推荐，
+记录每次调用的耗时与 SQL 查询数，汇总为 p50/p95 等统计量；另记录进程的峰值常驻内存（RSS）。
+hybrid 的候选生成器在流水线线程池中执行，查询数只统计调用线程（合并阶段）的查询。
+结果是可直接 json.dump 的字典，便于在不同版本之间对比回归。
+"""
+import platform
+import sys
+import time
+from typing import Callable, List, Optional
+import django
+from django.db import connection
+from django.utils import timezone
+from practice.models import Interaction
+from questions.models import Question
+from users.models import User
+from ..algorithms import CollaborativeFiltering
+from ..matrix import SimilarityEngine
+import numpy as np
+import scipy
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 报告格式版本，字段变化时递增
+REPORT_VERSION = 1
+
+RECOMMENDERS = {
+    'user_based': lambda user, n: CollaborativeFiltering.user_based_recommend(user, n),
+    'item_based': lambda user, n: CollaborativeFiltering.item_based_recommend(user, n),
+    'hybrid': lambda user, n: CollaborativeFiltering.hybrid_recommend(user, n),
+}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    进程的峰值常驻内存（MB），平台不支持时返回 None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _measure(func: Callable[[], object]) -> tuple:
+    """
+    执行一次并返回 (结果, 耗时毫秒, 查询数)
+    """
+    # 用 execute_wrapper 计数：connection.queries_log 最多保留 9000 条，重建相似度时会溢出
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+    return result, elapsed, queries[0]
+
+
+def summarize(latencies: List[float], query_counts: List[int]) -> dict:
+    """
+    汇总多次调用的耗时（毫秒）与查询数
+    """
+    latencies = np.asarray(latencies, dtype=np.float64)
+    query_counts = np.asarray(query_counts, dtype=np.int64)
+    if not len(latencies):
+        return {'samples': 0}
+    return {
+        'samples': int(len(latencies)),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'mean_ms': float(latencies.mean()),
+        'max_ms': float(latencies.max()),
+        'queries_p50': float(np.percentile(query_counts, 50)),
+        'queries_max': int(query_counts.max()),
+    }
+
+
+def sample_users(sample: int, seed: int = 0, prefix: Optional[str] = None) -> List[User]:
+    """
+    随机抽取有已提交答题记录的用户
+
+    Args:
+        sample: 抽样数量
+        seed: 随机种子
+        prefix: 只抽取用户名以该前缀开头的用户（合成数据集）
+    """
+    users = Interaction.objects.filter(is_submitted=True)
+    if prefix:
+        users = users.filter(user__username__startswith=prefix)
+    user_ids = np.array(sorted(set(users.values_list('user_id', flat=True))), dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(user_ids, min(sample, len(user_ids)), replace=False) if len(user_ids) else user_ids
+    by_id = User.objects.in_bulk(picked.tolist())
+    return [by_id[user_id] for user_id in picked.tolist()]
+
+
+def run_benchmark(
+    sample: int = 200,
+    n: int = 10,
+    min_common: int = 2,
+    workers: int = 1,
+    seed: int = 0,
+    prefix: Optional[str] = None,
+    recommenders: Optional[List[str]] = None,
+    rebuild: bool = True
+) -> dict:
+    """
+    运行性能测试
+
+    Args:
+        sample: 每种推荐抽样的用户数
+        n: 每次推荐的数量
+        min_common: 重建相似度时的最小共同评分数
+        workers: 重建相似度的进程数
+        seed: 抽样随机种子
+        prefix: 只抽取该前缀的用户
+        recommenders: 要测试的推荐类型，默认全部
+        rebuild: 是否先计时重建相似度（不重建时使用现有的近邻表）
+
+    Returns:
+        dict: 测试报告
+    """
+    report = {
+        'version': REPORT_VERSION,
+        'started_at': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'database': connection.vendor,
+            'platform': platform.platform(),
+        },
+        'parameters': {
+            'sample': sample, 'n': n, 'min_common': min_common, 'workers': workers,
+            'seed': seed, 'prefix': prefix,
+        },
+        'dataset': {
+            'users': User.objects.count(),
+            'questions': Question.objects.count(),
+            'interactions': Interaction.objects.count(),
+        },
+        'similarity': {},
+        'recommenders': {},
+    }
+
+    if rebuild:
+        for kind, rebuild_func in (
+            ('user', lambda: SimilarityEngine.rebuild_user_similarities(min_common_questions=min_common, workers=workers)),
+            ('question', lambda: SimilarityEngine.rebuild_question_similarities(min_common_users=min_common, workers=workers)),
+        ):
+            logger.info(f"Benchmarking {kind} similarity rebuild")
+            pairs, elapsed, queries = _measure(rebuild_func)
+            report['similarity'][kind] = {'seconds': elapsed / 1000, 'pairs': pairs, 'queries': queries}
+
+    users = sample_users(sample, seed, prefix)
+    for name in recommenders or list(RECOMMENDERS):
+        recommend = RECOMMENDERS[name]
+        logger.info(f"Benchmarking {name} recommendations for {len(users)} users")
+        latencies, query_counts = [], []
+        for user in users:
+            _, elapsed, queries = _measure(lambda: recommend(user, n))
+            latencies.append(elapsed)
+            query_counts.append(queries)
+        report['recommenders'][name] = summarize(latencies, query_counts)
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    report['finished_at'] = timezone.now().isoformat()
+    return report
@@ -0,0 +1,129 @@
+"""
+批量分块写入工具
+
+先把待写入的模型实例缓存起来，每攒满一块就用
+bulk_create(update_conflicts=True) 写入，每块一个事务：
+- 相比逐行 update_or_create，每块只需一次往返；
+- 单块失败只回滚该块，已提交的块不受影响；
+- 结束时记录写入行数与速率（行/秒）。
+"""
+import logging
+import time
+from typing import Iterable, List, Optional
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def default_chunk_size() -> int:
+    return max(1, int(getattr(settings, 'RECOMMENDER_BULK_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)))
+
+
+class BulkUpserter:
+    """
+    按唯一键批量插入或更新模型记录
+
+    用法：
+        with BulkUpserter(UserSimilarity, ['user_a', 'user_b'], ['similarity_score']) as writer:
+            for row in rows:
+                writer.add(row)
+        writer.rows, writer.rows_per_second
+    """
+
+    def __init__(
+        self,
+        model,
+        unique_fields: List[str],
+        update_fields: List[str],
+        chunk_size: Optional[int] = None,
+        label: Optional[str] = None
+    ):
+        """
+        Args:
+            model: 要写入的模型类
+            unique_fields: 冲突判断所用的唯一键字段（需有对应的唯一约束）
+            update_fields: 冲突时要更新的字段
+            chunk_size: 每块行数，默认取 RECOMMENDER_BULK_CHUNK_SIZE
+            label: 日志中显示的名称，默认为模型名
+        """
+        self.model = model
+        self.unique_fields = list(unique_fields)
+        self.update_fields = list(update_fields)
+        self.chunk_size = max(1, chunk_size or default_chunk_size())
+        self.label = label or model.__name__
+        self.rows = 0
+        self.chunks = 0
+        self.elapsed = 0.0
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        return False
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def add(self, obj) -> int:
+        """
+        缓存一条记录，攒满一块时写入
+
+        Returns:
+            int: 本次写入的行数（未触发写入时为 0）
+        """
+        self._buffer.append(obj)
+        if len(self._buffer) >= self.chunk_size:
+            return self.flush()
+        return 0
+
+    def extend(self, objs: Iterable) -> int:
+        written = 0
+        for obj in objs:
+            written += self.add(obj)
+        return written
+
+    def flush(self) -> int:
+        """
+        在一个事务中写入缓存的记录
+
+        Returns:
+            int: 写入的行数
+        """
+        if not self._buffer:
+            return 0
+
+        batch, self._buffer = self._buffer, []
+        started = time.perf_counter()
+        with transaction.atomic():
+            self.model.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=self.unique_fields,
+                update_fields=self.update_fields
+            )
+        self.elapsed += time.perf_counter() - started
+        self.rows += len(batch)
+        self.chunks += 1
+        return len(batch)
+
+    def close(self) -> int:
+        """
+        写入剩余记录并记录吞吐量
+
+        Returns:
+            int: 累计写入的行数
+        """
+        self.flush()
+        if self.rows:
+            logger.info(
+                f"Upserted {self.rows} {self.label} rows in {self.chunks} chunks "
+                f"({self.elapsed:.2f}s, {self.rows_per_second:.0f} rows/s)"
+            )
+        return self.rows
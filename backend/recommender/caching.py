@@ -0,0 +1,110 @@
+"""
+推荐结果缓存：按用户的缓存代数（generation）失效，并合并并发的重复计算
+
+每个用户有一个缓存代数，用户提交或评分答题时加一（见 signals.py）；推荐结果的缓存键包含当前代数，
+代数变化后旧键不再被读取，自然过期，无需逐个删除。代数键本身不过期；被淘汰后用当前毫秒时间戳重新初始化，
+保证不会回到已用过的值。
+
+single_flight 用 cache.add 作为分布式锁：同一个键同时未命中时只有一个请求计算，其余请求等待结果写入缓存。
+"""
+import time
+from typing import Any, Callable, Optional
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_TIMEOUT = 86400
+
+# 计算锁的超时时间（秒），应大于一次推荐计算的最长耗时
+DEFAULT_LOCK_TIMEOUT = 30
+
+# 等待其他请求计算结果时的轮询间隔（秒）
+POLL_INTERVAL = 0.05
+
+
+def cache_timeout() -> int:
+    return getattr(settings, 'RECOMMENDER_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT)
+
+
+def _generation_key(user_id: int) -> str:
+    return f'recommendations_gen_{user_id}'
+
+
+def generation(user_id: int) -> int:
+    """
+    获取用户当前的缓存代数（不存在时初始化）
+    """
+    key = _generation_key(user_id)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump_generation(user_id: int) -> int:
+    """
+    用户的缓存代数加一，使该用户已缓存的推荐结果全部失效
+
+    Returns:
+        int: 新的代数
+    """
+    key = _generation_key(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # 键不存在（从未读取或已被淘汰）：初始化为新的值即可使旧键失效
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        return cache.get(key)
+
+
+def recommendation_cache_key(user_id: int, recommendation_type: str, n: int, min_similarity: float) -> str:
+    """
+    推荐结果的缓存键（包含用户当前的缓存代数）
+    """
+    return f'recommendations_{user_id}_g{generation(user_id)}_{recommendation_type}_{n}_{min_similarity}'
+
+
+def single_flight(
+    key: str,
+    compute: Callable[[], Any],
+    timeout: Optional[int] = None,
+    lock_timeout: int = DEFAULT_LOCK_TIMEOUT
+) -> Any:
+    """
+    计算并缓存 key 对应的值；并发未命中时只有一个调用方执行 compute
+
+    Args:
+        key: 缓存键
+        compute: 计算函数
+        timeout: 结果的缓存时间（秒），默认取 RECOMMENDER_CACHE_TIMEOUT
+        lock_timeout: 计算锁的超时时间，等待超过该时间后自行计算
+
+    Returns:
+        缓存中或计算得到的值
+    """
+    timeout = cache_timeout() if timeout is None else timeout
+    lock_key = f'{key}:lock'
+
+    deadline = time.monotonic() + lock_timeout
+    while not cache.add(lock_key, 1, timeout=lock_timeout):
+        # 其他请求正在计算，等待其写入结果
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if time.monotonic() >= deadline:
+            logger.warning(f"Timed out waiting for {key}, computing it again")
+            return compute()
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        # 拿到锁之前结果可能刚好被写入
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, timeout=timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,164 @@
+"""
+基于内容的推荐：预计算的题目嵌入矩阵
+
+用评分子系统已加载的 SentenceTransformer 模型（ScoringStrategyFactory 中的 embedding 策略）
+把所有已审核题目的文本编码为单位向量，按题目 ID 升序存成一个连续的 float32 矩阵，
+以与近邻矩阵相同的方式发布为内存映射文件。
+
+在线推荐时：用户画像 = 已答题目嵌入按得分加权求和后归一化，
+所有题目的得分 = 嵌入矩阵 · 画像（一次矩阵-向量乘法），再 argpartition 取前 n 个；
+请求路径上不调用模型。新题目只要重新构建嵌入即可被推荐，不依赖答题记录（解决新题目冷启动）。
+"""
+import json
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+from .answered import exclusion_mask
+from .artifact import ArtifactStore, artifact_dir, publish
+from questions.models import Question
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_NAME = 'question_embeddings'
+
+# 每批编码的题目数
+DEFAULT_ENCODE_BATCH_SIZE = 64
+
+
+def question_text(title: str, content: str, tags) -> str:
+    """
+    拼接用于编码的题目文本
+    """
+    parts = [title, content]
+    if tags:
+        parts.append(' '.join(str(tag) for tag in tags))
+    return '\n'.join(part for part in parts if part)
+
+
+def _default_encoder():
+    from scoring.factory import ScoringStrategyFactory
+    return ScoringStrategyFactory.get_strategy('embedding').get_model()
+
+
+class QuestionEmbeddings:
+    """
+    题目嵌入矩阵
+
+    Attributes:
+        question_ids: 题目 ID（升序）
+        vectors: 单位嵌入向量，形状 (题目数, dim)，float32
+    """
+
+    ARRAYS = ['question_ids', 'vectors']
+
+    def __init__(self, question_ids, vectors, manifest: Optional[dict] = None):
+        self.question_ids = question_ids
+        self.vectors = vectors
+        self.manifest = manifest or {}
+
+    @classmethod
+    def build(cls, encoder=None, batch_size: int = DEFAULT_ENCODE_BATCH_SIZE) -> 'QuestionEmbeddings':
+        """
+        编码所有已审核题目
+
+        Args:
+            encoder: 带 encode(texts, batch_size=...) 方法的模型，默认使用评分子系统的嵌入模型
+            batch_size: 每批编码的题目数
+
+        Returns:
+            QuestionEmbeddings: 嵌入矩阵
+        """
+        started = time.perf_counter()
+        encoder = encoder or _default_encoder()
+        rows = list(
+            Question.objects.filter(is_approved=True).order_by('id').values_list('id', 'title', 'content', 'tags')
+        )
+        question_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        texts = [question_text(title, content, tags) for _, title, content, tags in rows]
+
+        if texts:
+            vectors = np.asarray(encoder.encode(texts, batch_size=batch_size), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = np.ascontiguousarray(vectors / np.where(norms > 0, norms, 1))
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+
+        logger.info(
+            f"Encoded {len(question_ids)} questions into {vectors.shape[1]}-d embeddings "
+            f"({time.perf_counter() - started:.1f}s)"
+        )
+        return cls(question_ids, vectors, {'questions': len(question_ids), 'dim': int(vectors.shape[1])})
+
+    def save(self, directory: Optional[Path] = None) -> Path:
+        """
+        发布为新版本（目录见 RECOMMENDER_ARTIFACT_DIR），并原子切换当前版本
+        """
+        return publish(directory or artifact_dir(), EMBEDDINGS_NAME, {
+            'question_ids': np.asarray(self.question_ids, dtype=np.int64),
+            'vectors': np.ascontiguousarray(self.vectors, dtype=np.float32),
+        }, self.manifest)
+
+    @classmethod
+    def open(cls, path: Path) -> 'QuestionEmbeddings':
+        """
+        以内存映射方式打开某个版本目录
+        """
+        path = Path(path)
+        with open(path / 'manifest.json', encoding='utf-8') as f:
+            manifest = json.load(f)
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in cls.ARRAYS}
+        return cls(manifest=manifest, **arrays)
+
+    @classmethod
+    def current(cls, directory: Optional[Path] = None) -> Optional['QuestionEmbeddings']:
+        """
+        获取当前发布的嵌入矩阵（进程内缓存，发布新版本后自动重新加载），没有时返回 None
+        """
+        return ArtifactStore.load(EMBEDDINGS_NAME, cls.open, directory)
+
+    def positions(self, question_ids) -> np.ndarray:
+        """
+        题目 ID 在矩阵中的行号，不在矩阵中的记为 -1
+        """
+        question_ids = np.asarray(question_ids, dtype=np.int64)
+        pos = np.searchsorted(self.question_ids, question_ids)
+        found = pos < len(self.question_ids)
+        found[found] = self.question_ids[pos[found]] == question_ids[found]
+        return np.where(found, pos, -1)
+
+    def profile(self, question_ids, weights) -> Optional[np.ndarray]:
+        """
+        按权重加权已答题目的嵌入得到用户画像（单位向量）
+
+        Returns:
+            np.ndarray: 画像向量；没有可用题目或权重全为 0 时返回 None
+        """
+        pos = self.positions(question_ids)
+        found = pos >= 0
+        weights = np.asarray(weights, dtype=np.float32)[found]
+        if not found.any() or not weights.any():
+            return None
+        vector = weights @ self.vectors[pos[found]]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def recommend(self, profile: np.ndarray, n: int = 10, exclude=()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        取与画像余弦相似度最高的 n 道题目
+
+        Args:
+            profile: 用户画像向量
+            n: 推荐数量
+            exclude: 需要跳过的题目（AnsweredSet 或题目 ID 集合）
+
+        Returns:
+            (question_ids, scores): 按相似度降序
+        """
+        scores = self.vectors @ profile
+        candidates = np.flatnonzero(~exclusion_mask(self.question_ids, exclude))
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+        order = candidates[np.lexsort((self.question_ids[candidates], -scores[candidates]))]
+        return np.asarray(self.question_ids[order]), scores[order]
@@ -0,0 +1,247 @@
+"""
+交替最小二乘（ALS）矩阵分解
+
+把评分矩阵 R（用户 × 题目，score / 100 减去全局均值）分解为 X · Yᵀ，
+X 为用户潜在因子、Y 为题目潜在因子，交替固定一方、对另一方每一行求解带正则的最小二乘：
+    (Y_uᵀ Y_u + λ · n_u · I) x_u = Y_uᵀ r_u
+其中 Y_u 是用户 u 评过分的题目因子，n_u 是评分数。每批行的 Gram 矩阵用 np.add.reduceat 一次累加，
+再用 np.linalg.solve 对整批方程组求解；各批之间相互独立，可在线程池中并行（NumPy 计算时释放 GIL）。
+
+训练好的因子按与近邻矩阵相同的方式发布为内存映射文件，在线推荐只需一次矩阵-向量乘法加 argpartition。
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+from django.conf import settings
+from .answered import exclusion_mask
+from .artifact import ArtifactStore, artifact_dir, publish
+from .matrix import RatingMatrix
+import numpy as np
+from scipy import sparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+MF_NAME = 'mf_factors'
+
+DEFAULT_FACTORS = 32
+DEFAULT_EPOCHS = 15
+DEFAULT_REGULARIZATION = 0.01
+DEFAULT_THREADS = 1
+
+# 每批累加 Gram 矩阵时外积数组的内存上限（字节）
+BATCH_BYTES = 64 * 1024 * 1024
+
+
+def _batches(indptr: np.ndarray, factors: int) -> Iterator[Tuple[int, int]]:
+    """
+    按非零元个数切分行区间，使每批外积数组 (nnz, f, f) 不超过 BATCH_BYTES
+    """
+    max_nnz = max(1, BATCH_BYTES // (factors * factors * 8))
+    n_rows = len(indptr) - 1
+    start = 0
+    while start < n_rows:
+        end = int(np.searchsorted(indptr, indptr[start] + max_nnz, side='right')) - 1
+        end = min(max(end, start + 1), n_rows)
+        yield start, end
+        start = end
+
+
+def _solve_rows(
+    ratings: sparse.csr_matrix,
+    fixed: np.ndarray,
+    target: np.ndarray,
+    regularization: float,
+    start: int,
+    end: int
+):
+    """
+    固定另一方因子，求解 ratings[start:end] 对应的因子行（写入 target）
+    """
+    indptr = ratings.indptr[start:end + 1]
+    lo, hi = int(indptr[0]), int(indptr[-1])
+    counts = np.diff(indptr)
+    rated = np.flatnonzero(counts)
+    if not len(rated):
+        return
+
+    factors = fixed[ratings.indices[lo:hi]]
+    values = ratings.data[lo:hi]
+    segments = (indptr[:-1] - lo)[rated]
+
+    gram = np.add.reduceat(factors[:, :, None] * factors[:, None, :], segments, axis=0)
+    rhs = np.add.reduceat(factors * values[:, None], segments, axis=0)
+    gram += regularization * counts[rated][:, None, None] * np.eye(fixed.shape[1])
+
+    target[start + rated] = np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+
+
+class ALSModel:
+    """
+    矩阵分解模型
+
+    Attributes:
+        user_ids: 用户 ID（升序）
+        question_ids: 题目 ID（升序）
+        user_factors: 用户潜在因子，形状 (用户数, factors)
+        question_factors: 题目潜在因子，形状 (题目数, factors)
+        manifest: 训练参数与指标（mean 为全局均值）
+    """
+
+    ARRAYS = ['user_ids', 'question_ids', 'user_factors', 'question_factors']
+
+    def __init__(self, user_ids, question_ids, user_factors, question_factors, manifest: Optional[dict] = None):
+        self.user_ids = user_ids
+        self.question_ids = question_ids
+        self.user_factors = user_factors
+        self.question_factors = question_factors
+        self.manifest = manifest or {}
+
+    @property
+    def mean(self) -> float:
+        return self.manifest.get('mean', 0.0)
+
+    @classmethod
+    def train(
+        cls,
+        matrix: RatingMatrix,
+        factors: int = DEFAULT_FACTORS,
+        epochs: int = DEFAULT_EPOCHS,
+        regularization: float = DEFAULT_REGULARIZATION,
+        threads: int = DEFAULT_THREADS,
+        seed: int = 0
+    ) -> 'ALSModel':
+        """
+        用 ALS 训练潜在因子
+
+        Args:
+            matrix: 评分矩阵
+            factors: 潜在因子维数
+            epochs: 迭代轮数（每轮依次更新用户因子和题目因子）
+            regularization: 正则化系数 λ（按评分数加权）
+            threads: 并行求解的线程数
+            seed: 初始化随机种子
+
+        Returns:
+            ALSModel: 训练好的模型
+        """
+        started = time.perf_counter()
+        ratings = matrix.ratings.tocsr().astype(np.float64)
+        ratings.data = ratings.data / 100
+        mean = float(ratings.data.mean()) if ratings.nnz else 0.0
+        ratings.data -= mean
+        ratings_t = ratings.T.tocsr()
+
+        rng = np.random.default_rng(seed)
+        user_factors = rng.normal(0, 1 / np.sqrt(factors), (ratings.shape[0], factors))
+        question_factors = rng.normal(0, 1 / np.sqrt(factors), (ratings.shape[1], factors))
+
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+            def half_step(csr, fixed, target):
+                # list() 等待所有批次完成并抛出其中的异常
+                list(pool.map(
+                    lambda bounds: _solve_rows(csr, fixed, target, regularization, *bounds),
+                    _batches(csr.indptr, factors)
+                ))
+
+            rmse = 0.0
+            for epoch in range(epochs):
+                half_step(ratings, question_factors, user_factors)
+                half_step(ratings_t, user_factors, question_factors)
+                rmse = cls._rmse(ratings, user_factors, question_factors)
+                logger.info(f"ALS epoch {epoch + 1}/{epochs}: train RMSE {rmse * 100:.2f}")
+
+        logger.info(
+            f"Trained ALS model: {ratings.shape[0]} users, {ratings.shape[1]} questions, "
+            f"{factors} factors ({time.perf_counter() - started:.1f}s)"
+        )
+        return cls(
+            matrix.user_ids, matrix.question_ids,
+            user_factors.astype(np.float32), question_factors.astype(np.float32),
+            {
+                'users': ratings.shape[0], 'questions': ratings.shape[1], 'ratings': int(ratings.nnz),
+                'factors': factors, 'epochs': epochs, 'regularization': regularization,
+                'mean': mean, 'rmse': rmse,
+            }
+        )
+
+    @staticmethod
+    def _rmse(ratings: sparse.csr_matrix, user_factors: np.ndarray, question_factors: np.ndarray) -> float:
+        if not ratings.nnz:
+            return 0.0
+        rows = np.repeat(np.arange(ratings.shape[0]), np.diff(ratings.indptr))
+        predicted = np.einsum('ij,ij->i', user_factors[rows], question_factors[ratings.indices])
+        return float(np.sqrt(np.mean((ratings.data - predicted) ** 2)))
+
+    def save(self, directory: Optional[Path] = None) -> Path:
+        """
+        发布为新版本（目录见 RECOMMENDER_ARTIFACT_DIR），并原子切换当前版本
+        """
+        return publish(directory or artifact_dir(), MF_NAME, {
+            'user_ids': np.asarray(self.user_ids, dtype=np.int64),
+            'question_ids': np.asarray(self.question_ids, dtype=np.int64),
+            'user_factors': np.asarray(self.user_factors, dtype=np.float32),
+            'question_factors': np.asarray(self.question_factors, dtype=np.float32),
+        }, self.manifest)
+
+    @classmethod
+    def open(cls, path: Path) -> 'ALSModel':
+        """
+        以内存映射方式打开某个版本目录
+        """
+        path = Path(path)
+        with open(path / 'manifest.json', encoding='utf-8') as f:
+            manifest = json.load(f)
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in cls.ARRAYS}
+        return cls(manifest=manifest, **arrays)
+
+    @classmethod
+    def current(cls, directory: Optional[Path] = None) -> Optional['ALSModel']:
+        """
+        获取当前发布的模型（进程内缓存，发布新版本后自动重新加载），没有时返回 None
+        """
+        return ArtifactStore.load(MF_NAME, cls.open, directory)
+
+    def user_vector(self, user_id: int) -> Optional[np.ndarray]:
+        pos = int(np.searchsorted(self.user_ids, user_id))
+        if pos >= len(self.user_ids) or self.user_ids[pos] != user_id:
+            return None
+        return self.user_factors[pos]
+
+    def recommend(self, user_id: int, n: int = 10, exclude=()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        为用户预测所有题目的得分，取前 n 个
+
+        Args:
+            user_id: 用户 ID
+            n: 推荐数量
+            exclude: 需要跳过的题目（AnsweredSet 或题目 ID 集合）
+
+        Returns:
+            (question_ids, scores): 按预测得分降序，得分为 0-1 尺度的预测评分；
+            用户不在模型中时为空数组
+        """
+        vector = self.user_vector(user_id)
+        if vector is None or n <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        scores = self.question_factors @ vector + np.float32(self.mean)
+        candidates = np.flatnonzero(~exclusion_mask(self.question_ids, exclude))
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+        order = candidates[np.lexsort((self.question_ids[candidates], -scores[candidates]))]
+        return np.asarray(self.question_ids[order]), scores[order]
+
+
+def train_settings() -> dict:
+    """
+    训练参数的默认值（来自 settings）
+    """
+    return {
+        'factors': getattr(settings, 'RECOMMENDER_MF_FACTORS', DEFAULT_FACTORS),
+        'epochs': getattr(settings, 'RECOMMENDER_MF_EPOCHS', DEFAULT_EPOCHS),
+        'regularization': getattr(settings, 'RECOMMENDER_MF_REGULARIZATION', DEFAULT_REGULARIZATION),
+        'threads': getattr(settings, 'RECOMMENDER_MF_THREADS', DEFAULT_THREADS),
+    }
@@ -0,0 +1,110 @@
+"""
+推荐结果的生成流程（同步接口与异步任务共用）
+
+读取顺序：缓存（键含用户缓存代数）→ 离线物化列表（物化后用户又提交或评分答题时跳过）→ 实时计算。
+用户答题后两层都会失效，不会再返回刚答过的题目。
+实时计算在 single_flight 中执行并写入缓存，同时把推荐记录批量写入 Recommendation。
+"""
+from typing import Optional
+from django.core.cache import cache
+from .algorithms import CollaborativeFiltering
+from .bulk import BulkUpserter
+from .caching import recommendation_cache_key, single_flight
+from .materialize import RecommendationMaterializer
+from .models import Recommendation
+from .pipeline import RecommendationPipeline
+from .serializers import RecommendationSerializer
+from .telemetry import ServingTelemetry
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_TYPES = ('user_based', 'item_based', 'hybrid', 'mf', 'content_based', 'graph')
+
+
+def lookup_recommendations(user, recommendation_type: str, n: int, min_similarity: float) -> Optional[dict]:
+    """
+    不计算、只读取已有的结果：先查缓存，再查离线物化的推荐列表
+
+    Returns:
+        dict: 响应数据；都没有时返回 None
+    """
+    cached_result = cache.get(recommendation_cache_key(user.id, recommendation_type, n, min_similarity))
+    if cached_result:
+        logger.info(f"Returning cached recommendations for user {user.id}")
+        ServingTelemetry.record_lookup(recommendation_type, 'cache')
+        return cached_result
+
+    materialized = RecommendationMaterializer.serve(user, recommendation_type, n, min_similarity)
+    if materialized:
+        logger.info(f"Returning materialized recommendations for user {user.id}")
+        ServingTelemetry.record_lookup(recommendation_type, 'materialized')
+        return materialized
+
+    ServingTelemetry.record_lookup(recommendation_type, 'miss')
+    return None
+
+
+def generate_recommendations(user, recommendation_type: str, n: int, min_similarity: float) -> dict:
+    """
+    实时计算推荐并写入缓存（同一用户的并发未命中只计算一次）
+
+    Returns:
+        dict: 响应数据
+    """
+    return single_flight(
+        recommendation_cache_key(user.id, recommendation_type, n, min_similarity),
+        lambda: _compute(user, recommendation_type, n, min_similarity)
+    )
+
+
+def _compute(user, recommendation_type: str, n: int, min_similarity: float) -> dict:
+    # 混合推荐直接运行流水线，以便在响应中返回各阶段耗时
+    pipeline = None
+    if recommendation_type == 'hybrid':
+        pipeline = RecommendationPipeline.run(user, n, min_similarity)
+        recommendations = pipeline.recommendations
+    else:
+        recommendations = CollaborativeFiltering.recommend(
+            user, recommendation_type, n, min_similarity
+        )
+
+    # 保存推荐记录（按 (user, question, recommendation_type) 批量插入或更新）
+    with BulkUpserter(
+        Recommendation,
+        ['user', 'question', 'recommendation_type'],
+        ['score', 'reason']
+    ) as writer:
+        writer.extend(
+            Recommendation(
+                user=user,
+                question=question,
+                recommendation_type=recommendation_type,
+                score=score,
+                reason=reason
+            )
+            for question, score, reason in recommendations
+        )
+
+    # 重新读取已保存的记录（保留 is_viewed 等原有字段），按推荐顺序返回
+    question_ids = [question.id for question, _, _ in recommendations]
+    saved = {
+        rec.question_id: rec
+        for rec in Recommendation.objects.filter(
+            user=user,
+            recommendation_type=recommendation_type,
+            question_id__in=question_ids
+        ).select_related('question')
+    }
+    saved_recommendations = [saved[question_id] for question_id in question_ids]
+
+    logger.info(f"Generated {len(saved_recommendations)} recommendations for user {user.id}")
+    result = {
+        'recommendations': RecommendationSerializer(saved_recommendations, many=True).data,
+        'count': len(saved_recommendations),
+        'type': recommendation_type,
+        'source': 'live'
+    }
+    if pipeline is not None:
+        result['pipeline'] = pipeline.metadata()
+    return result
@@ -0,0 +1,160 @@
+"""
+相似度矩阵的代数切换
+
+全量重建原来直接在线上的相似度表与近邻表中逐块覆盖：重建期间读取方看到的是新旧混合、只建了一半的矩阵，
+清空后重建（fix_recommender）时更是整张表暂时为空。现在每行带一个代数（generation），
+SimilarityGeneration 为用户 / 题目矩阵各记录一个当前生效的代数：
+
+1. begin：对指针行加行锁并登记重建租约（building_since），同一类矩阵已有未过期的租约时
+   抛出 RebuildInProgress，第二个重建立即失败而不是删掉第一个重建正在写入的代数；
+   然后清理上次失败的重建留下的未生效代数，分配新代数（当前代数 + 1）；
+2. 重建把整个矩阵按块批量写入新代数，每块一个短事务，读取方仍然只读当前代数；
+3. activate：单行 UPDATE 切换指针并释放租约。读取方通过 objects.active() 以子查询内联读取指针，
+   切换对之后的每一次查询立即生效，同一次查询内不会读到两个代数；
+4. collect：按主键分块删除旧代数的行，每块一个短事务，不会长时间持有写锁。
+
+重建失败时 rebuilding() 释放租约；进程崩溃留下的租约在 RECOMMENDER_REBUILD_LEASE_SECONDS 后过期。
+只重建单个用户 / 题目与增量更新仍然在当前代数上原地修改。全量重建期间的增量更新写入旧代数，
+切换后由 matrix._rebuild 按租约开始时间重放这段时间内评分有变化的用户 / 题目（见 incremental.replay）。
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .bulk import default_chunk_size
+from .models import SimilarityGeneration
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RebuildInProgress(RuntimeError):
+    """
+    同一类相似度矩阵已有一个全量重建正在进行
+    """
+
+
+def lease_seconds() -> int:
+    return getattr(settings, 'RECOMMENDER_REBUILD_LEASE_SECONDS', 6 * 3600)
+
+
+class SimilarityGenerations:
+    """
+    相似度矩阵代数的分配、切换与清理
+    """
+
+    @staticmethod
+    def active(kind: str) -> int:
+        """
+        当前生效的代数（还没有指针时为第 0 代）
+
+        Args:
+            kind: 'user' 或 'question'
+        """
+        return SimilarityGeneration.objects.filter(kind=kind).values_list('active', flat=True).first() or 0
+
+    @staticmethod
+    def begin(tables) -> int:
+        """
+        开始一次全量重建：登记重建租约，清理未生效的代数并分配新代数
+
+        Args:
+            tables: matrix.USER_TABLES 或 matrix.QUESTION_TABLES
+
+        Returns:
+            int: 新代数
+
+        Raises:
+            RebuildInProgress: 同一类矩阵已有未过期的重建租约
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            pointer, _ = SimilarityGeneration.objects.select_for_update().get_or_create(kind=tables.kind)
+            if pointer.building_since and pointer.building_since > now - timedelta(seconds=lease_seconds()):
+                raise RebuildInProgress(
+                    f"A full {tables.kind} similarity rebuild has been running since {pointer.building_since}"
+                )
+            pointer.building_since = now
+            pointer.save(update_fields=['building_since'])
+            active = pointer.active
+
+        SimilarityGenerations.collect(tables, active)
+        return active + 1
+
+    @staticmethod
+    def activate(kind: str, generation: int) -> Optional[datetime]:
+        """
+        原子切换当前生效的代数并释放重建租约
+
+        Returns:
+            datetime: 本次重建租约的开始时间（之后的评分变化需要重放），没有租约时为 None
+        """
+        with transaction.atomic():
+            pointer, _ = SimilarityGeneration.objects.select_for_update().get_or_create(kind=kind)
+            started = pointer.building_since
+            pointer.active = generation
+            pointer.activated_at = timezone.now()
+            pointer.building_since = None
+            pointer.save(update_fields=['active', 'activated_at', 'building_since'])
+        logger.info(f"Activated {kind} similarity generation {generation}")
+        return started
+
+    @staticmethod
+    def release(kind: str):
+        """
+        释放重建租约（重建失败时调用，未生效的代数留给下一次 begin 清理）
+        """
+        SimilarityGeneration.objects.filter(kind=kind).update(building_since=None)
+
+    @staticmethod
+    @contextmanager
+    def rebuilding(tables, enabled: bool = True) -> Iterator[Optional[int]]:
+        """
+        在租约内执行一次全量重建，重建失败时释放租约
+
+        Args:
+            tables: matrix.USER_TABLES 或 matrix.QUESTION_TABLES
+            enabled: 为 False 时不登记租约（只重建单个目标时），返回 None
+
+        Yields:
+            int: 新代数
+        """
+        if not enabled:
+            yield None
+            return
+
+        generation = SimilarityGenerations.begin(tables)
+        try:
+            yield generation
+        except BaseException:
+            SimilarityGenerations.release(tables.kind)
+            raise
+
+    @staticmethod
+    def collect(tables, keep: int, chunk_size: Optional[int] = None) -> int:
+        """
+        分块删除 keep 以外所有代数的相似度行与近邻行
+
+        Args:
+            tables: matrix.USER_TABLES 或 matrix.QUESTION_TABLES
+            keep: 保留的代数
+            chunk_size: 每个事务删除的行数，默认取 RECOMMENDER_BULK_CHUNK_SIZE
+
+        Returns:
+            int: 删除的行数
+        """
+        chunk_size = chunk_size or default_chunk_size()
+        deleted = 0
+        for model in (tables.pair_model, tables.neighbor_model):
+            while True:
+                pks = list(model.objects.exclude(generation=keep).values_list('pk', flat=True)[:chunk_size])
+                if not pks:
+                    break
+                with transaction.atomic():
+                    deleted += model.objects.filter(pk__in=pks).delete()[0]
+
+        if deleted:
+            logger.info(f"Collected {deleted} rows from stale {tables.kind} similarity generations")
+        return deleted
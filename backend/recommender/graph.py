@@ -0,0 +1,308 @@
+"""
+用户-题目二部图上的随机游走（带重启的随机游走 / 个性化 PageRank）
+
+近邻协同过滤只看一跳（相似用户答过的题、与已答题相似的题），每一跳都要查询数据库。
+这里把答题记录建成二部图：用户与题目之间的边权 = 得分 / 100（已提交未评分记为 UNSCORED_WEIGHT），
+可选加上收藏与答题用时的权重；按行归一化得到 用户 -> 题目 与 题目 -> 用户 两个转移矩阵，
+以与近邻矩阵相同的方式发布为内存映射文件。
+
+从目标用户出发，每一步以 restart 的概率回到起点，否则沿边走一步（用户 -> 题目 -> 用户）；
+迭代若干次后游走停留在各题目上的概率就是推荐分数，能覆盖多跳关系。
+多个用户的游走拼成一个稠密矩阵（每列一个用户），每次迭代只是两次稀疏矩阵乘法，离线物化时按批计算。
+"""
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from django.conf import settings
+from django.db.models import Q
+from practice.models import Interaction
+from .answered import exclusion_mask
+from .artifact import ArtifactStore, artifact_dir, publish
+import numpy as np
+from scipy import sparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+GRAPH_NAME = 'walk_graph'
+
+# 每步回到起点的概率
+DEFAULT_RESTART = 0.15
+
+# 迭代次数上限（每次迭代走 用户 -> 题目 -> 用户 两步）与收敛阈值（相邻两次迭代概率分布的 L1 距离）
+DEFAULT_ITERATIONS = 10
+DEFAULT_TOLERANCE = 1e-4
+
+# 收藏额外增加的边权；答题用时的权重（用时按 TIME_SPENT_CAP 截断后线性映射到 [0, 1]），0 表示不使用
+DEFAULT_FAVORITE_WEIGHT = 0.5
+DEFAULT_TIME_WEIGHT = 0.0
+TIME_SPENT_CAP = 1800
+
+# 已提交但尚未评分的答题记录的边权
+UNSCORED_WEIGHT = 0.5
+
+# 离线批量游走时每批的用户数
+DEFAULT_WALK_BATCH_SIZE = 256
+
+
+def walk_settings() -> dict:
+    """
+    构建与游走参数的默认值（来自 settings）
+    """
+    return {
+        'restart': getattr(settings, 'RECOMMENDER_GRAPH_RESTART', DEFAULT_RESTART),
+        'iterations': getattr(settings, 'RECOMMENDER_GRAPH_ITERATIONS', DEFAULT_ITERATIONS),
+        'favorite_weight': getattr(settings, 'RECOMMENDER_GRAPH_FAVORITE_WEIGHT', DEFAULT_FAVORITE_WEIGHT),
+        'time_weight': getattr(settings, 'RECOMMENDER_GRAPH_TIME_WEIGHT', DEFAULT_TIME_WEIGHT),
+    }
+
+
+def _normalize_rows(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    """
+    按行归一化为转移概率（没有出边的行保持全 0）
+    """
+    totals = np.asarray(matrix.sum(axis=1)).ravel()
+    scale = np.divide(1.0, totals, out=np.zeros_like(totals), where=totals > 0)
+    return sparse.csr_matrix(sparse.diags(scale) @ matrix)
+
+
+class WalkGraph:
+    """
+    用户-题目二部图的转移矩阵
+
+    Attributes:
+        user_ids: 用户 ID（升序）
+        question_ids: 题目 ID（升序）
+        user_to_question: 用户 -> 题目 的转移概率，CSR，形状 (用户数, 题目数)
+        question_to_user: 题目 -> 用户 的转移概率，CSR，形状 (题目数, 用户数)
+    """
+
+    ARRAYS = [
+        'user_ids', 'question_ids',
+        'uq_indptr', 'uq_indices', 'uq_data',
+        'qu_indptr', 'qu_indices', 'qu_data',
+    ]
+
+    def __init__(self, user_ids, question_ids, user_to_question, question_to_user, manifest: Optional[dict] = None):
+        self.user_ids = user_ids
+        self.question_ids = question_ids
+        self.user_to_question = user_to_question
+        self.question_to_user = question_to_user
+        self.manifest = manifest or {}
+
+    @classmethod
+    def build(
+        cls,
+        favorite_weight: float = DEFAULT_FAVORITE_WEIGHT,
+        time_weight: float = DEFAULT_TIME_WEIGHT
+    ) -> 'WalkGraph':
+        """
+        从答题记录构建二部图（单次 values_list 流式读取；同一用户同一题目有多条记录时取最大边权）
+
+        Args:
+            favorite_weight: 收藏额外增加的边权，0 表示不使用收藏（未提交的收藏也不会成为边）
+            time_weight: 答题用时的权重，0 表示不使用
+
+        Returns:
+            WalkGraph: 二部图
+        """
+        started = time.perf_counter()
+        interactions = Interaction.objects.filter(question__is_approved=True, question__is_deleted=False)
+        if favorite_weight > 0:
+            interactions = interactions.filter(Q(is_submitted=True) | Q(is_favorite=True))
+        else:
+            interactions = interactions.filter(is_submitted=True)
+        rows = interactions.values_list('user_id', 'question_id', 'score', 'is_submitted', 'is_favorite', 'time_spent')
+
+        user_col = []
+        question_col = []
+        weight_col = []
+        for user_id, question_id, score, is_submitted, is_favorite, time_spent in rows.iterator(chunk_size=10000):
+            weight = 0.0
+            if is_submitted:
+                weight += score / 100 if score is not None else UNSCORED_WEIGHT
+                weight += time_weight * min(max(time_spent, 0), TIME_SPENT_CAP) / TIME_SPENT_CAP
+            if is_favorite:
+                weight += favorite_weight
+            user_col.append(user_id)
+            question_col.append(question_id)
+            weight_col.append(weight)
+
+        user_ids, row_idx = np.unique(np.asarray(user_col, dtype=np.int64), return_inverse=True)
+        question_ids, col_idx = np.unique(np.asarray(question_col, dtype=np.int64), return_inverse=True)
+        weights = np.asarray(weight_col, dtype=np.float64)
+
+        # 重复的 (用户, 题目) 取最大边权
+        if len(weights):
+            keys = row_idx.astype(np.int64) * len(question_ids) + col_idx
+            order = np.argsort(keys, kind='stable')
+            keys, weights = keys[order], weights[order]
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            weights = np.maximum.reduceat(weights, starts)
+            row_idx, col_idx = np.divmod(keys[starts], len(question_ids))
+
+        adjacency = sparse.csr_matrix(
+            (weights, (row_idx, col_idx)),
+            shape=(len(user_ids), len(question_ids))
+        )
+        adjacency.eliminate_zeros()
+
+        logger.info(
+            f"Built walk graph: {adjacency.shape[0]} users, {adjacency.shape[1]} questions, "
+            f"{adjacency.nnz} edges ({time.perf_counter() - started:.1f}s)"
+        )
+        return cls(
+            user_ids, question_ids,
+            _normalize_rows(adjacency).astype(np.float32),
+            _normalize_rows(adjacency.T.tocsr()).astype(np.float32),
+            {
+                'users': adjacency.shape[0], 'questions': adjacency.shape[1], 'edges': int(adjacency.nnz),
+                'favorite_weight': favorite_weight, 'time_weight': time_weight,
+            }
+        )
+
+    def save(self, directory: Optional[Path] = None) -> Path:
+        """
+        发布为新版本（目录见 RECOMMENDER_ARTIFACT_DIR），并原子切换当前版本
+        """
+        user_to_question = self.user_to_question.tocsr()
+        question_to_user = self.question_to_user.tocsr()
+        return publish(directory or artifact_dir(), GRAPH_NAME, {
+            'user_ids': np.asarray(self.user_ids, dtype=np.int64),
+            'question_ids': np.asarray(self.question_ids, dtype=np.int64),
+            'uq_indptr': user_to_question.indptr.astype(np.int64),
+            'uq_indices': user_to_question.indices.astype(np.int32),
+            'uq_data': user_to_question.data.astype(np.float32),
+            'qu_indptr': question_to_user.indptr.astype(np.int64),
+            'qu_indices': question_to_user.indices.astype(np.int32),
+            'qu_data': question_to_user.data.astype(np.float32),
+        }, self.manifest)
+
+    @classmethod
+    def open(cls, path: Path) -> 'WalkGraph':
+        """
+        以内存映射方式打开某个版本目录
+        """
+        path = Path(path)
+        with open(path / 'manifest.json', encoding='utf-8') as f:
+            manifest = json.load(f)
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in cls.ARRAYS}
+        users, questions = len(arrays['user_ids']), len(arrays['question_ids'])
+        return cls(
+            arrays['user_ids'], arrays['question_ids'],
+            sparse.csr_matrix(
+                (arrays['uq_data'], arrays['uq_indices'], arrays['uq_indptr']), shape=(users, questions)
+            ),
+            sparse.csr_matrix(
+                (arrays['qu_data'], arrays['qu_indices'], arrays['qu_indptr']), shape=(questions, users)
+            ),
+            manifest
+        )
+
+    @classmethod
+    def current(cls, directory: Optional[Path] = None) -> Optional['WalkGraph']:
+        """
+        获取当前发布的二部图（进程内缓存，发布新版本后自动重新加载），没有时返回 None
+        """
+        return ArtifactStore.load(GRAPH_NAME, cls.open, directory)
+
+    def positions(self, user_ids) -> np.ndarray:
+        """
+        用户 ID 在图中的行号，不在图中的记为 -1
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        pos = np.searchsorted(self.user_ids, user_ids)
+        found = pos < len(self.user_ids)
+        found[found] = self.user_ids[pos[found]] == user_ids[found]
+        return np.where(found, pos, -1)
+
+    def walk(
+        self,
+        positions: np.ndarray,
+        restart: float = DEFAULT_RESTART,
+        iterations: int = DEFAULT_ITERATIONS,
+        tolerance: float = DEFAULT_TOLERANCE
+    ) -> np.ndarray:
+        """
+        从一批用户同时出发的带重启随机游走
+
+        Args:
+            positions: 起点用户的行号
+            restart: 每步回到起点的概率
+            iterations: 迭代次数上限
+            tolerance: 每个起点的平均 L1 变化小于该值时提前结束
+
+        Returns:
+            np.ndarray: 形状 (题目数, 起点数)，第 j 列为从第 j 个起点出发停留在各题目上的概率
+        """
+        batch = len(positions)
+        start = np.zeros((len(self.user_ids), batch), dtype=np.float32)
+        start[positions, np.arange(batch)] = 1
+        # CSR 的转置是不复制数据的 CSC 视图
+        uq_t = self.user_to_question.T
+        qu_t = self.question_to_user.T
+
+        users = start
+        for iteration in range(iterations):
+            questions = uq_t @ users
+            next_users = restart * start + (1 - restart) * (qu_t @ questions)
+            change = float(np.abs(next_users - users).sum()) / max(batch, 1)
+            users = next_users
+            if change < tolerance:
+                logger.debug(f"Walk converged after {iteration + 1} iterations")
+                break
+        return uq_t @ users
+
+    def recommend_many(
+        self,
+        user_ids: Iterable[int],
+        n: int = 10,
+        exclude: Optional[Dict[int, object]] = None,
+        batch_size: int = DEFAULT_WALK_BATCH_SIZE,
+        **walk_options
+    ) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """
+        为多个用户按批游走并各取前 n 个题目
+
+        Args:
+            user_ids: 用户 ID（不在图中的用户跳过）
+            n: 每个用户的推荐数量
+            exclude: 用户 ID -> 需要跳过的题目（AnsweredSet 或题目 ID 集合），默认跳过用户在图中的邻居
+            batch_size: 每批游走的用户数
+            walk_options: 传给 walk 的参数
+
+        Yields:
+            (user_id, question_ids, scores): 按分数降序
+        """
+        user_ids = np.asarray(list(user_ids), dtype=np.int64)
+        positions = self.positions(user_ids)
+        user_ids, positions = user_ids[positions >= 0], positions[positions >= 0]
+
+        for offset in range(0, len(positions), batch_size):
+            batch = positions[offset:offset + batch_size]
+            scores = self.walk(batch, **walk_options)
+            for column, (user_id, position) in enumerate(zip(user_ids[offset:offset + batch_size].tolist(), batch.tolist())):
+                column_scores = scores[:, column]
+                if exclude is not None:
+                    keep = ~exclusion_mask(self.question_ids, exclude.get(user_id, ()))
+                else:
+                    keep = np.ones(len(self.question_ids), dtype=bool)
+                    row = slice(self.user_to_question.indptr[position], self.user_to_question.indptr[position + 1])
+                    keep[self.user_to_question.indices[row]] = False
+                candidates = np.flatnonzero(keep & (column_scores > 0))
+                if len(candidates) > n:
+                    candidates = candidates[np.argpartition(-column_scores[candidates], n - 1)[:n]]
+                order = candidates[np.lexsort((self.question_ids[candidates], -column_scores[candidates]))]
+                yield user_id, np.asarray(self.question_ids[order]), column_scores[order]
+
+    def recommend(self, user_id: int, n: int = 10, exclude=(), **walk_options) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        为单个用户游走并取前 n 个题目
+
+        Returns:
+            (question_ids, scores): 按分数降序；用户不在图中时为空数组
+        """
+        for _, question_ids, scores in self.recommend_many([user_id], n, {user_id: exclude}, **walk_options):
+            return question_ids, scores
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
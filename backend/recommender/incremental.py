@@ -0,0 +1,503 @@
+"""
+相似度矩阵增量维护
+
+相似度表只保存出现在任一方 Top-K 近邻中的行对及其充分统计量（评分和、平方和、乘积和、共同数），
+见 matrix._rebuild。某条答题记录的评分发生变化时：
+1. 把新旧评分之差作为增量累加到该用户（题目）已保存、且对方在这条评分上有共同维度的行对的统计量上；
+2. 用新的评分均值重新计算该用户（题目）所有已保存行对的相似度，并重建它的 Top-K 近邻列表；
+3. 只保留仍在它的 Top-K 中、或出现在对方近邻列表中的行对，其余删除，行对表保持有界。
+以上与该实体的近邻数成正比，不读取评分明细。只有近邻列表未满 K 个（新用户 / 新题目）时，
+缺少行对的其他实体才从评分记录重新计算统计量；否则未保存的行对要到下一次全量重建才会重新评估。
+
+对方的评分（partners）在保存时读取（只读，只涉及已保存的行对），加行锁、累加与重算在事务提交后
+由 RecommendationJobs.enqueue 放到后台单线程中按提交顺序依次应用（apply_partners），不占用请求。
+rescan_user / rescan_question 从评分记录重新计算已保存行对的统计量，结果与执行次数、顺序无关，
+全量重建切换代数后由 replay 用它补上重建期间的评分变化（见 matrix._rebuild）。
+
+说明：均值按评分记录聚合计算，同一用户对同一题目存在多条已评分提交时，
+结果可能与全量重建略有差异，下一次全量重建会校正。增量更新只修改当前生效代数的行（见 generations.py）。
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from practice.models import Interaction
+from questions.models import Question
+from .generations import SimilarityGenerations
+from .matrix import STATS_FIELDS, USER_TABLES, QUESTION_TABLES, neighbor_k, similarity_from_stats
+from .models import UserSimilarity, QuestionSimilarity
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMMIT_LAG_SECONDS = 300
+
+
+def commit_lag_seconds() -> float:
+    return getattr(settings, 'RECOMMENDER_COMMIT_LAG_SECONDS', DEFAULT_COMMIT_LAG_SECONDS)
+
+
+class _PairTable:
+    """
+    相似度表的字段映射（用户表与题目表结构对称）
+    """
+
+    def __init__(
+        self, model, field_a: str, field_b: str, common_field: str, entity_field: str, other_field: str,
+        approved_only: bool, tables
+    ):
+        self.model = model
+        self.tables = tables
+        self.field_a = field_a
+        self.field_b = field_b
+        self.common_field = common_field
+        self.entity_field = entity_field
+        # 共同维度：用户表是题目，题目表是用户
+        self.other_field = other_field
+        self.approved_only = approved_only
+
+    def rated(self):
+        interactions = Interaction.objects.filter(score__isnull=False, is_submitted=True)
+        if self.approved_only:
+            interactions = interactions.filter(question__is_approved=True, question__is_deleted=False)
+        return interactions
+
+    def pairs_of(self, entity_id: int, generation: int):
+        return self.model.objects.select_for_update().filter(
+            Q(**{self.field_a: entity_id}) | Q(**{self.field_b: entity_id}),
+            generation=generation
+        )
+
+    def ratings_of(self, entity_ids, others=None) -> Dict[int, Dict[int, float]]:
+        """
+        读取实体在各共同维度上的评分，同一位置有多条记录时与 RatingMatrix 一致：按默认排序最后出现的生效
+        """
+        rows = self.rated().filter(**{f'{self.entity_field}__in': list(entity_ids)})
+        if others is not None:
+            rows = rows.filter(**{f'{self.other_field}__in': list(others)})
+        ratings = {}
+        for entity_id, other_id, score in rows.values_list(self.entity_field, self.other_field, 'score'):
+            ratings.setdefault(entity_id, {})[other_id] = score
+        return ratings
+
+    def partner_scores(self, entity_id: int, shared_id: int) -> Dict[int, float]:
+        """
+        entity 已保存行对（当前代数）的对方在 shared_id 上的评分
+        """
+        generation = SimilarityGenerations.active(self.tables.kind)
+        partner_ids = {
+            b if a == entity_id else a
+            for a, b in self.model.objects.filter(
+                Q(**{self.field_a: entity_id}) | Q(**{self.field_b: entity_id}),
+                generation=generation
+            ).values_list(self.field_a, self.field_b)
+        }
+        if not partner_ids:
+            return {}
+        return dict(self.rated().filter(
+            **{self.other_field: shared_id, f'{self.entity_field}__in': partner_ids}
+        ).values_list(self.entity_field, 'score'))
+
+    def means(self, entity_ids) -> Dict[int, float]:
+        stats = self.rated().filter(
+            **{f'{self.entity_field}__in': list(entity_ids)}
+        ).values(self.entity_field).annotate(total=Sum('score'), count=Count('id'))
+        return {row[self.entity_field]: row['total'] / row['count'] for row in stats}
+
+
+USER_PAIRS = _PairTable(
+    UserSimilarity, 'user_a_id', 'user_b_id', 'common_questions', 'user_id', 'question_id',
+    approved_only=False, tables=USER_TABLES
+)
+QUESTION_PAIRS = _PairTable(
+    QuestionSimilarity, 'question_a_id', 'question_b_id', 'common_users', 'question_id', 'user_id',
+    approved_only=True, tables=QUESTION_TABLES
+)
+
+
+def _effective(rows) -> Optional[float]:
+    """
+    与 RatingMatrix 去重规则一致：按默认排序最后出现的已评分提交生效
+    """
+    effective = None
+    for score, is_rated in rows:
+        if is_rated and score is not None:
+            effective = score
+    return effective
+
+
+class IncrementalSimilarity:
+    """
+    基于充分统计量的相似度增量维护
+    """
+
+    @staticmethod
+    def rating_change(instance: Interaction, previous: Optional[dict]):
+        """
+        计算一次保存前后 (用户, 题目) 的有效评分
+
+        Args:
+            instance: 刚保存的答题记录
+            previous: 保存前的 score / is_submitted / is_deleted，新建记录为 None
+
+        Returns:
+            (old_score, new_score)
+        """
+        rows = Interaction.all_objects.filter(
+            user_id=instance.user_id,
+            question_id=instance.question_id
+        ).order_by('-created_at').values_list('id', 'score', 'is_submitted', 'is_deleted')
+
+        new_rows = []
+        old_rows = []
+        for row_id, score, is_submitted, is_deleted in rows:
+            new_rows.append((score, is_submitted and not is_deleted))
+            if row_id == instance.id:
+                if previous is None:
+                    continue
+                old_rows.append((
+                    previous['score'],
+                    previous['is_submitted'] and not previous['is_deleted']
+                ))
+            else:
+                old_rows.append((score, is_submitted and not is_deleted))
+
+        return _effective(old_rows), _effective(new_rows)
+
+    @staticmethod
+    def apply_rating(
+        user_id: int,
+        question_id: int,
+        old_score: Optional[float],
+        new_score: Optional[float],
+        min_common: int = 2
+    ) -> int:
+        """
+        在当前线程内应用一次评分变化（读取共同评分后立即更新），更新用户相似度与题目相似度
+
+        Args:
+            user_id: 用户 ID
+            question_id: 题目 ID
+            old_score: 变化前的有效评分，没有则为 None
+            new_score: 变化后的有效评分，没有则为 None
+            min_common: 最小共同答题数/用户数
+
+        Returns:
+            int: 更新的相似度记录数
+        """
+        if old_score == new_score:
+            return 0
+        user_partners, question_partners = IncrementalSimilarity.partners(user_id, question_id)
+        return IncrementalSimilarity.apply_partners(
+            user_id, question_id, old_score, new_score, user_partners, question_partners, min_common
+        )
+
+    @staticmethod
+    def partners(user_id: int, question_id: int) -> Tuple[Dict[int, float], Optional[Dict[int, float]]]:
+        """
+        读取一次评分变化涉及的、已保存行对的对方在共同维度上的评分（只读，不加锁）
+
+        只读取 entity 已保存的行对（Top-K 近邻及指向它的近邻），与近邻数成正比。
+        需要在评分变化时立即读取：延后读取会把之后其他答题记录的评分也算作共同评分，
+        而那些记录自己的增量更新还会再累加一次。
+
+        Returns:
+            (user_partners, question_partners): 已保存行对中同样答过该题的其他用户的评分；
+            已保存行对中该用户答过的其他题目的评分，题目未审核或已删除时为 None
+        """
+        user_partners = USER_PAIRS.partner_scores(user_id, question_id)
+        question_partners = None
+        if Question.objects.filter(id=question_id, is_approved=True, is_deleted=False).exists():
+            question_partners = QUESTION_PAIRS.partner_scores(question_id, user_id)
+        return user_partners, question_partners
+
+    @staticmethod
+    def apply_partners(
+        user_id: int,
+        question_id: int,
+        old_score: Optional[float],
+        new_score: Optional[float],
+        user_partners: Dict[int, float],
+        question_partners: Optional[Dict[int, float]],
+        min_common: int = 2
+    ) -> int:
+        """
+        用 partners() 读取的评分更新用户相似度与题目相似度（加行锁、累加增量、重算、重建近邻）
+
+        Returns:
+            int: 更新的相似度记录数
+        """
+        # 用户相似度：与同样答过该题的其他用户
+        updated_count = IncrementalSimilarity._apply(
+            USER_PAIRS, user_id, question_id, user_partners, old_score, new_score, min_common
+        )
+
+        # 题目相似度：该用户答过的其他题目（题目需已审核且未删除）
+        if question_partners is not None:
+            updated_count += IncrementalSimilarity._apply(
+                QUESTION_PAIRS, question_id, user_id, question_partners, old_score, new_score, min_common
+            )
+
+        logger.info(
+            f"Incrementally updated {updated_count} similarities for user {user_id} question {question_id}"
+        )
+        return updated_count
+
+    @staticmethod
+    def _apply(
+        table: _PairTable,
+        entity_id: int,
+        shared_id: int,
+        partner_scores: Dict[int, float],
+        old_score: Optional[float],
+        new_score: Optional[float],
+        min_common: int
+    ) -> int:
+        """
+        把评分变化作为增量累加到已保存行对的统计量上，然后重新计算 entity 的所有行对
+
+        partner_scores 是 partners() 读取时已保存行对的对方在 shared_id 上的评分
+        （对用户表是同一道题的得分，对题目表是同一个用户的得分）。
+        entity 的近邻列表未满 K 个时，在 shared_id 上有评分但没有行对的其他实体从评分记录重新计算统计量，
+        使新用户 / 新题目不必等到下一次全量重建；列表已满时，未保存的行对在下一次全量重建时重新评估。
+        """
+        with transaction.atomic():
+            generation = SimilarityGenerations.active(table.tables.kind)
+            pairs = IncrementalSimilarity._stored(table, entity_id, generation)
+
+            for partner_id, partner_score in partner_scores.items():
+                pair = pairs.get(partner_id)
+                # 读取后才保存的行对已经由重新计算得到了这次变化，不再累加
+                if pair is None:
+                    continue
+                own, other = ('a', 'b') if getattr(pair, table.field_a) == entity_id else ('b', 'a')
+                for score, sign in ((old_score, -1), (new_score, 1)):
+                    if score is None:
+                        continue
+                    setattr(pair, table.common_field, getattr(pair, table.common_field) + sign)
+                    setattr(pair, f'sum_{own}', getattr(pair, f'sum_{own}') + sign * score)
+                    setattr(pair, f'sum_{other}', getattr(pair, f'sum_{other}') + sign * partner_score)
+                    setattr(pair, f'sum_sq_{own}', getattr(pair, f'sum_sq_{own}') + sign * score ** 2)
+                    setattr(pair, f'sum_sq_{other}', getattr(pair, f'sum_sq_{other}') + sign * partner_score ** 2)
+                    pair.sum_ab += sign * score * partner_score
+
+            if new_score is not None and len(pairs) < neighbor_k():
+                missing = set(table.rated().filter(
+                    **{table.other_field: shared_id}
+                ).exclude(
+                    **{f'{table.entity_field}__in': [entity_id, *pairs.keys()]}
+                ).values_list(table.entity_field, flat=True))
+                IncrementalSimilarity._recompute(table, entity_id, missing, pairs, generation)
+
+            updated_count = IncrementalSimilarity._rescore(table, entity_id, pairs, min_common, generation)
+        return updated_count
+
+    @staticmethod
+    def rescan_user(user_id: int, min_common: int = 2) -> int:
+        """
+        从评分记录重新计算某个用户已保存行对的统计量并刷新相似度（结果与执行次数、顺序无关）
+
+        Returns:
+            int: 更新的记录数
+        """
+        return IncrementalSimilarity._rescan(USER_PAIRS, user_id, min_common)
+
+    @staticmethod
+    def rescan_question(question_id: int, min_common: int = 2) -> int:
+        """
+        从评分记录重新计算某道题目已保存行对的统计量并刷新相似度
+
+        Returns:
+            int: 更新的记录数
+        """
+        return IncrementalSimilarity._rescan(QUESTION_PAIRS, question_id, min_common)
+
+    @staticmethod
+    def replay(kind: str, since: datetime, min_common: int = 2) -> int:
+        """
+        全量重建切换代数后，重新计算 since 之后评分有变化的用户（题目）
+
+        重建期间的增量更新写在旧代数上，切换后随旧代数一起被清理；这里用 rescan 补上。
+        since 向前多取 RECOMMENDER_COMMIT_LAG_SECONDS，覆盖保存早于租约开始、提交晚于重建读取评分的答题记录。
+
+        Args:
+            kind: 'user' 或 'question'
+            since: 重建租约的开始时间
+            min_common: 最小共同答题数/用户数
+
+        Returns:
+            int: 重新计算的用户（题目）数
+        """
+        table = USER_PAIRS if kind == 'user' else QUESTION_PAIRS
+        changed = set(Interaction.all_objects.filter(
+            updated_at__gte=since - timedelta(seconds=commit_lag_seconds())
+        ).values_list(table.entity_field, flat=True))
+        for entity_id in changed:
+            IncrementalSimilarity._rescan(table, entity_id, min_common)
+
+        if changed:
+            logger.info(f"Replayed {len(changed)} {kind} similarity rows changed since {since}")
+        return len(changed)
+
+    @staticmethod
+    def _rescan(table: _PairTable, entity_id: int, min_common: int) -> int:
+        with transaction.atomic():
+            generation = SimilarityGenerations.active(table.tables.kind)
+            pairs = IncrementalSimilarity._stored(table, entity_id, generation)
+            IncrementalSimilarity._recompute(table, entity_id, set(pairs), pairs, generation)
+            return IncrementalSimilarity._rescore(table, entity_id, pairs, min_common, generation)
+
+    @staticmethod
+    def _stored(table: _PairTable, entity_id: int, generation: int) -> dict:
+        """
+        加行锁读取 entity 已保存的行对：对方 ID -> 行
+        """
+        pairs = {}
+        for pair in table.pairs_of(entity_id, generation):
+            a, b = getattr(pair, table.field_a), getattr(pair, table.field_b)
+            pairs[b if a == entity_id else a] = pair
+        return pairs
+
+    @staticmethod
+    def _recompute(table: _PairTable, entity_id: int, partner_ids: set, pairs: dict, generation: int):
+        """
+        从评分记录重新计算 entity 与 partner_ids 之间的统计量，没有行对的新建（写回由 _rescore 完成）
+        """
+        if not partner_ids:
+            return
+        own = table.ratings_of([entity_id]).get(entity_id, {})
+        partner_ratings = table.ratings_of(partner_ids, own.keys()) if own else {}
+        for partner_id in partner_ids:
+            pair = pairs.get(partner_id)
+            if pair is None:
+                a, b = sorted((entity_id, partner_id))
+                pair = table.model(**{table.field_a: a, table.field_b: b}, generation=generation)
+                pairs[partner_id] = pair
+            IncrementalSimilarity._set_stats(table, pair, entity_id, own, partner_ratings.get(partner_id, {}))
+
+    @staticmethod
+    def _set_stats(table: _PairTable, pair, entity_id: int, own: Dict[int, float], partner: Dict[int, float]):
+        """
+        由双方的评分重新计算行对在共同评分上的充分统计量
+        """
+        common = sum_own = sum_other = sum_ab = sq_own = sq_other = 0.0
+        for other_id, partner_score in partner.items():
+            score = own[other_id]
+            common += 1
+            sum_own += score
+            sum_other += partner_score
+            sum_ab += score * partner_score
+            sq_own += score ** 2
+            sq_other += partner_score ** 2
+
+        own_side, other_side = ('a', 'b') if getattr(pair, table.field_a) == entity_id else ('b', 'a')
+        setattr(pair, table.common_field, int(common))
+        setattr(pair, f'sum_{own_side}', sum_own)
+        setattr(pair, f'sum_{other_side}', sum_other)
+        setattr(pair, f'sum_sq_{own_side}', sq_own)
+        setattr(pair, f'sum_sq_{other_side}', sq_other)
+        pair.sum_ab = sum_ab
+
+    @staticmethod
+    def _rescore(table: _PairTable, entity_id: int, pairs: dict, min_common: int, generation: int) -> int:
+        """
+        用当前均值重新计算 entity 所有行对的相似度并写回
+
+        只保留 entity 的 Top-K 近邻以及近邻列表中包含 entity 的那些行对，其余已保存的删除、新算出的不写入。
+        """
+        means = table.means([entity_id, *pairs.keys()])
+        entity_mean = means.get(entity_id, 0.0)
+
+        stale = []
+        for partner_id, pair in list(pairs.items()):
+            common = getattr(pair, table.common_field)
+            if common <= 0:
+                if pair.pk:
+                    stale.append(pair.pk)
+                pairs.pop(partner_id)
+                continue
+
+            partner_mean = means.get(partner_id, 0.0)
+            is_a = getattr(pair, table.field_a) == entity_id
+            mean_a, mean_b = (entity_mean, partner_mean) if is_a else (partner_mean, entity_mean)
+            pair.similarity_score = similarity_from_stats(
+                common, pair.sum_a, pair.sum_b, pair.sum_ab, pair.sum_sq_a, pair.sum_sq_b,
+                mean_a, mean_b, min_common
+            )
+
+        ranked = sorted(
+            ((pair.similarity_score, partner_id, getattr(pair, table.common_field))
+             for partner_id, pair in pairs.items() if pair.similarity_score > 0),
+            key=lambda item: (-item[0], item[1])
+        )[:neighbor_k()]
+        keep = {partner_id for _, partner_id, _ in ranked} | table.tables.incoming(entity_id, generation)
+        for partner_id in [partner_id for partner_id in pairs if partner_id not in keep]:
+            pair = pairs.pop(partner_id)
+            if pair.pk:
+                stale.append(pair.pk)
+        if stale:
+            table.model.objects.filter(pk__in=stale).delete()
+
+        new_pairs = [pair for pair in pairs.values() if pair.pk is None]
+        existing = [pair for pair in pairs.values() if pair.pk]
+        now = timezone.now()
+        for pair in existing:
+            # bulk_update 不会触发 auto_now
+            pair.last_updated = now
+        table.model.objects.bulk_create(new_pairs)
+        table.model.objects.bulk_update(
+            existing, ['similarity_score', table.common_field, *STATS_FIELDS, 'last_updated']
+        )
+
+        IncrementalSimilarity._refresh_neighbors(table, entity_id, pairs, ranked, generation)
+        return len(new_pairs) + len(existing)
+
+    @staticmethod
+    def _refresh_neighbors(table: _PairTable, entity_id: int, pairs: dict, ranked: list, generation: int):
+        """
+        用排好序的 (相似度, 对方 ID, 共同数) 重建 entity 自己的 Top-K 近邻列表，并更新其他列表中指向 entity 的相似度
+
+        其他实体列表的成员只在全量重建时重新裁剪。
+        """
+        tables = table.tables
+        tables.replace_neighbors([entity_id], [
+            tables.neighbor(entity_id, rank, partner_id, similarity, common, generation)
+            for rank, (similarity, partner_id, common) in enumerate(ranked)
+        ], generation)
+
+        incoming = list(tables.neighbor_model.objects.filter(neighbor_id=entity_id, generation=generation))
+        now = timezone.now()
+        for neighbor in incoming:
+            pair = pairs.get(getattr(neighbor, f'{tables.owner_field}_id'))
+            neighbor.similarity_score = pair.similarity_score if pair else 0.0
+            neighbor.last_updated = now
+        tables.neighbor_model.objects.bulk_update(incoming, ['similarity_score', 'last_updated'])
+
+    @staticmethod
+    def refresh_user(user_id: int, min_common: int = 2) -> int:
+        """
+        用已保存的统计量和当前均值刷新某个用户的相似度（不读取评分明细）
+
+        Returns:
+            int: 更新的记录数
+        """
+        return IncrementalSimilarity._refresh(USER_PAIRS, user_id, min_common)
+
+    @staticmethod
+    def refresh_question(question_id: int, min_common: int = 2) -> int:
+        """
+        用已保存的统计量和当前均值刷新某道题目的相似度（不读取评分明细）
+
+        Returns:
+            int: 更新的记录数
+        """
+        return IncrementalSimilarity._refresh(QUESTION_PAIRS, question_id, min_common)
+
+    @staticmethod
+    def _refresh(table: _PairTable, entity_id: int, min_common: int) -> int:
+        with transaction.atomic():
+            generation = SimilarityGenerations.active(table.tables.kind)
+            pairs = IncrementalSimilarity._stored(table, entity_id, generation)
+            return IncrementalSimilarity._rescore(table, entity_id, pairs, min_common, generation)
@@ -0,0 +1,207 @@
+"""
+异步推荐生成任务
+
+未命中缓存的实时推荐可能耗时数秒，同步请求会一直占用一个 gunicorn worker。异步模式下请求只提交任务并立即返回任务 ID，
+推荐在进程内的线程池中计算（矩阵运算在 numpy/scipy 中释放 GIL），客户端轮询任务状态取回结果。
+
+- 任务记录保存在默认缓存中（RECOMMENDER_JOB_TTL 秒后过期）。只有缓存由所有 worker 进程共享时
+  （例如 USE_REDIS=True 时的 Redis），轮询请求落到其他进程才能查到任务；默认缓存只在本进程内可见
+  （LocMemCache、DummyCache）时 shared_cache() 为 False，generate_recommendations 拒绝 async=true；
+- 同一用户、同一组推荐参数（含缓存代数）同时只有一个任务：用 cache.add 占位去重，重复提交返回已有任务；
+- 已有缓存或物化结果时直接创建已完成的任务，不进入线程池；
+- RECOMMENDER_JOB_WORKERS 为 0 时在当前线程内同步执行（测试与调试使用）。
+
+enqueue 用于请求路径上不需要等待结果的后台维护（例如答题后的相似度增量更新）：
+在单独的单线程执行器中按提交顺序依次执行，不占用推荐任务的线程池。
+"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from .caching import recommendation_cache_key
+from .generation import generate_recommendations, lookup_recommendations
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_TTL = 3600
+
+# 只在本进程内可见的缓存后端：任务记录无法被其他 worker 进程查询
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _job_key(job_id: str) -> str:
+    return f'recommendation_job_{job_id}'
+
+
+class RecommendationJobs:
+    """
+    推荐生成任务队列（每个进程一个线程池，首次提交时创建）
+    """
+    _executor: Optional[ThreadPoolExecutor] = None
+    _background: Optional[ThreadPoolExecutor] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def workers() -> int:
+        return getattr(settings, 'RECOMMENDER_JOB_WORKERS', DEFAULT_JOB_WORKERS)
+
+    @staticmethod
+    def ttl() -> int:
+        return getattr(settings, 'RECOMMENDER_JOB_TTL', DEFAULT_JOB_TTL)
+
+    @staticmethod
+    def shared_cache() -> bool:
+        """
+        默认缓存能否被其他 worker 进程读取（异步模式的前提）
+        """
+        return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.workers(),
+                    thread_name_prefix='recommendation-job'
+                )
+            return cls._executor
+
+    @classmethod
+    def enqueue(cls, task: Callable, *args):
+        """
+        提交一个后台维护任务（按提交顺序依次执行，出错只记录日志）
+
+        Args:
+            task: 要执行的函数
+            args: 位置参数
+        """
+        if cls.workers() <= 0:
+            cls._run_background(task, *args)
+            return
+        with cls._lock:
+            if cls._background is None:
+                cls._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommender-background')
+        cls._background.submit(cls._run_background_in_thread, task, *args)
+
+    @staticmethod
+    def _run_background(task: Callable, *args):
+        try:
+            task(*args)
+        except Exception as e:
+            logger.error(f"Background task {getattr(task, '__qualname__', task)} failed: {e}", exc_info=True)
+
+    @staticmethod
+    def _run_background_in_thread(task: Callable, *args):
+        try:
+            RecommendationJobs._run_background(task, *args)
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def get(job_id: str) -> Optional[dict]:
+        """
+        获取任务记录，不存在或已过期时返回 None
+        """
+        return cache.get(_job_key(job_id))
+
+    @staticmethod
+    def _save(job: dict) -> dict:
+        cache.set(_job_key(job['job_id']), job, timeout=RecommendationJobs.ttl())
+        return job
+
+    @staticmethod
+    def _update(job_id: str, **fields) -> Optional[dict]:
+        job = RecommendationJobs.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        return RecommendationJobs._save(job)
+
+    @staticmethod
+    def submit(user, recommendation_type: str, n: int, min_similarity: float) -> dict:
+        """
+        提交推荐生成任务；同一用户同一组参数已有未失败的任务时直接返回该任务
+
+        Args:
+            user: 用户对象
+            recommendation_type: 推荐类型
+            n: 推荐数量
+            min_similarity: 最小相似度
+
+        Returns:
+            dict: 任务记录
+        """
+        dedupe_key = f'{recommendation_cache_key(user.id, recommendation_type, n, min_similarity)}:job'
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'status': PENDING,
+            'user_id': user.id,
+            'type': recommendation_type,
+            'n': n,
+            'min_similarity': min_similarity,
+            'result': None,
+            'error': None,
+            'created_at': timezone.now().isoformat(),
+            'finished_at': None,
+        }
+
+        if not cache.add(dedupe_key, job['job_id'], timeout=RecommendationJobs.ttl()):
+            existing = RecommendationJobs.get(cache.get(dedupe_key) or '')
+            if existing is not None and existing['status'] != FAILED:
+                logger.info(f"Reusing recommendation job {existing['job_id']} for user {user.id}")
+                return existing
+            # 已有任务失败或已过期：由本次提交接替
+            cache.set(dedupe_key, job['job_id'], timeout=RecommendationJobs.ttl())
+
+        result = lookup_recommendations(user, recommendation_type, n, min_similarity)
+        if result is not None:
+            job.update(status=DONE, result=result, finished_at=timezone.now().isoformat())
+            return RecommendationJobs._save(job)
+
+        RecommendationJobs._save(job)
+        logger.info(f"Submitted recommendation job {job['job_id']} for user {user.id}")
+        if RecommendationJobs.workers() <= 0:
+            RecommendationJobs._run(job['job_id'], user, dedupe_key)
+        else:
+            RecommendationJobs.executor().submit(RecommendationJobs._run_in_thread, job['job_id'], user, dedupe_key)
+        return RecommendationJobs.get(job['job_id']) or job
+
+    @staticmethod
+    def _run_in_thread(job_id: str, user, dedupe_key: str):
+        try:
+            RecommendationJobs._run(job_id, user, dedupe_key)
+        finally:
+            # 数据库连接按线程持有，任务结束后关闭，避免线程池长期占用连接
+            connections.close_all()
+
+    @staticmethod
+    def _run(job_id: str, user, dedupe_key: str):
+        job = RecommendationJobs._update(job_id, status=RUNNING)
+        if job is None:
+            logger.warning(f"Recommendation job {job_id} expired before it started")
+            return
+        try:
+            result = generate_recommendations(user, job['type'], job['n'], job['min_similarity'])
+        except Exception as e:
+            logger.error(f"Recommendation job {job_id} failed for user {user.id}: {e}", exc_info=True)
+            RecommendationJobs._update(job_id, status=FAILED, error=str(e), finished_at=timezone.now().isoformat())
+            # 释放去重占位，允许重新提交
+            if cache.get(dedupe_key) == job_id:
+                cache.delete(dedupe_key)
+            return
+        RecommendationJobs._update(job_id, status=DONE, result=result, finished_at=timezone.now().isoformat())
+        logger.info(f"Recommendation job {job_id} finished for user {user.id}")
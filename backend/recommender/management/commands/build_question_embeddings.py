@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from recommender.content import DEFAULT_ENCODE_BATCH_SIZE, QuestionEmbeddings
+from recommender.telemetry import BuildTelemetry
+
+
+class Command(BaseCommand):
+    help = '用评分子系统的嵌入模型预计算所有已审核题目的嵌入矩阵（基于内容的推荐使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_ENCODE_BATCH_SIZE,
+            help='每批编码的题目数'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('开始计算题目嵌入...'))
+
+        try:
+            with BuildTelemetry.record('embeddings') as run:
+                embeddings = QuestionEmbeddings.build(batch_size=options['batch_size'])
+                if not len(embeddings.question_ids):
+                    self.stdout.write(self.style.WARNING('没有已审核的题目'))
+                    return
+
+                path = embeddings.save()
+                run.rows_written = len(embeddings.question_ids)
+                run.details = dict(embeddings.manifest, path=str(path))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'✗ 嵌入计算失败: {str(e)}'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 嵌入矩阵已发布: {path}（{len(embeddings.question_ids)} 道题目，{embeddings.manifest["dim"]} 维）'
+        ))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from recommender.sequence import TransitionModel, sequence_settings
+from recommender.telemetry import BuildTelemetry
+
+
+class Command(BaseCommand):
+    help = '按答题顺序构建下一题转移模型（默认从当前模型的水位线增量更新），并发布为内存映射文件'
+
+    def add_arguments(self, parser):
+        defaults = sequence_settings()
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='忽略当前模型，从全部答题记录重新构建'
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=defaults['top_k'],
+            help='每道题保留的后继数'
+        )
+        parser.add_argument(
+            '--session-gap-minutes',
+            type=int,
+            default=defaults['session_gap_minutes'],
+            help='同一会话内相邻两题的最大间隔（分钟）'
+        )
+
+    def handle(self, *args, **options):
+        previous = None if options['full'] else TransitionModel.current()
+        if previous is not None and (
+            previous.manifest.get('top_k') != options['top_k']
+            or previous.manifest.get('session_gap_minutes') != options['session_gap_minutes']
+        ):
+            self.stdout.write(self.style.WARNING('参数与当前模型不同，改为全量重建'))
+            previous = None
+
+        if previous is not None:
+            self.stdout.write(self.style.SUCCESS(f'开始增量更新转移模型（水位线 {previous.watermark}）...'))
+        else:
+            self.stdout.write(self.style.SUCCESS('开始全量构建转移模型...'))
+
+        with BuildTelemetry.record('transitions') as run:
+            model = TransitionModel.build(
+                previous,
+                top_k=options['top_k'],
+                session_gap_minutes=options['session_gap_minutes']
+            )
+            path = model.save()
+            run.rows_written = model.manifest['new_interactions']
+            run.details = dict(model.manifest, path=str(path), incremental=previous is not None)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 转移模型已发布: {path}（{model.manifest["transitions"]} 次转移，'
+            f'{model.manifest["questions"]} 道题目，新读取 {model.manifest["new_interactions"]} 条答题记录）'
+        ))
@@ -4,16 +4,29 @@ from practice.models import Interaction
 from questions.models import Question
 from users.models import User
 from recommender.models import UserSimilarity, QuestionSimilarity
+from recommender.telemetry import LATENCY_BUCKETS_MS, BuildTelemetry, ServingTelemetry
 
 
 class Command(BaseCommand):
     help = '检查推荐系统数据状态'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--telemetry-only',
+            action='store_true',
+            help='只输出构建与服务遥测，跳过数据统计'
+        )
+
     def handle(self, *args, **options):
+        if options['telemetry_only']:
+            self.show_build_telemetry()
+            self.show_serving_telemetry()
+            return
+
         self.stdout.write(self.style.SUCCESS('=== 推荐系统数据状态检查 ===\n'))
 
-        users = User.objects.filter(interaction__isnull=False).distinct()
-        questions = Question.objects.filter(interaction__isnull=False, is_approved=True).distinct()
+        users = User.objects.filter(interactions__isnull=False).distinct()
+        questions = Question.objects.filter(interactions__isnull=False, is_approved=True).distinct()
         interactions = Interaction.objects.filter(is_submitted=True, score__isnull=False)
 
         self.stdout.write(f'📊 基础数据:')
@@ -35,8 +48,8 @@ class Command(BaseCommand):
         high_score_count = interactions.filter(score__gte=60).count()
         self.stdout.write(f'  高分记录(>=60): {high_score_count}')
 
-        user_similarities = UserSimilarity.objects.all()
-        question_similarities = QuestionSimilarity.objects.all()
+        user_similarities = UserSimilarity.objects.active()
+        question_similarities = QuestionSimilarity.objects.active()
 
         self.stdout.write(f'\n🔗 相似度矩阵:')
         self.stdout.write(f'  用户相似度记录: {user_similarities.count()}')
@@ -89,4 +102,75 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.WARNING('    - 用户相似度矩阵为空'))
             if question_similarities.count() == 0:
                 self.stdout.write(self.style.WARNING('    - 题目相似度矩阵为空'))
-            self.stdout.write(self.style.WARNING('  请运行: python manage.py update_similarity_matrix')
+            self.stdout.write(self.style.WARNING('  请运行: python manage.py update_similarity_matrix'))
+
+        self.show_build_telemetry()
+        self.show_serving_telemetry()
+
+    def show_build_telemetry(self):
+        self.stdout.write(f'\n🛠  离线构建:')
+        for kind, entry in BuildTelemetry.status().items():
+            last = entry['last_build']
+            if last is None:
+                if entry['last_status'] == 'failed':
+                    self.stdout.write(self.style.ERROR(f'  {kind}: 从未成功，最近一次失败: {entry["last_error"]}'))
+                else:
+                    self.stdout.write(f'  {kind}: 尚无构建记录')
+                continue
+
+            line = f'  {kind}: {_format_age(entry["age_seconds"])}前, 耗时 {last["duration_ms"] / 1000:.1f}s'
+            if last['rows_written'] is not None:
+                line += f', 写入 {last["rows_written"]} 行'
+            if last['pairs_evaluated'] is not None:
+                min_common = last['details'].get('min_common')
+                line += f', 计算 {last["pairs_evaluated"]} 对 / 共同评分不足 {min_common} 跳过 {last["pairs_pruned"]} 对'
+            if last['peak_memory_mb'] is not None:
+                line += f', 峰值内存 {last["peak_memory_mb"]:.0f}MB'
+            line += f', 之后新增 {entry["interactions_since"]} 条答题记录'
+            self.stdout.write(line)
+
+            if entry['last_status'] == 'failed':
+                self.stdout.write(self.style.ERROR(f'    ✗ 最近一次构建失败: {entry["last_error"]}'))
+            if entry['slow']:
+                self.stdout.write(self.style.WARNING(
+                    f'    ⚠ 构建变慢: 之前构建耗时中位数 {entry["median_duration_ms"] / 1000:.1f}s'
+                ))
+            if entry['stale']:
+                self.stdout.write(self.style.WARNING(
+                    f'    ⚠ 数据已过期: 落后最新答题记录 {_format_age(entry["lag_seconds"] or 0)}'
+                ))
+
+    def show_serving_telemetry(self):
+        self.stdout.write(f'\n📡 在线服务（计数器保存在缓存中）:')
+        served = False
+        for recommendation_type, stats in ServingTelemetry.snapshot().items():
+            if not stats['lookups'] and not stats['runs']:
+                continue
+            served = True
+            line = f'  {recommendation_type}: {stats["requests"]} 次请求'
+            if stats['cache_hit_ratio'] is not None:
+                line += (
+                    f', 缓存命中 {stats["cache_hit_ratio"] * 100:.1f}%'
+                    f', 物化命中 {stats["materialized_hit_ratio"] * 100:.1f}%'
+                )
+            if stats['avg_latency_ms'] is not None:
+                line += f', 平均 {stats["avg_latency_ms"]:.1f}ms'
+                line += f', p50 {_format_bound(stats["p50_ms"])}, p95 {_format_bound(stats["p95_ms"])}'
+            if stats['fallback_rate'] is not None:
+                line += f', 回退热门 {stats["fallback_rate"] * 100:.1f}%（{stats["fallbacks"]}/{stats["runs"]}）'
+            self.stdout.write(line)
+
+        if not served:
+            self.stdout.write('  暂无服务统计')
+
+
+def _format_age(seconds: float) -> str:
+    if seconds < 3600:
+        return f'{seconds / 60:.0f} 分钟'
+    if seconds < 86400:
+        return f'{seconds / 3600:.1f} 小时'
+    return f'{seconds / 86400:.1f} 天'
+
+
+def _format_bound(bound) -> str:
+    return f'<={bound:.0f}ms' if bound is not None else f'>{LATENCY_BUCKETS_MS[-1]}ms'
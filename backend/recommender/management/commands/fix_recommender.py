@@ -3,7 +3,7 @@ from practice.models import Interaction
 from questions.models import Question
 from users.models import User
 from recommender.algorithms import CollaborativeFiltering
-from recommender.models import UserSimilarity, QuestionSimilarity, Recommendation
+from recommender.models import UserSimilarity, QuestionSimilarity, Recommendation, MaterializedRecommendation
 
 
 class Command(BaseCommand):
@@ -38,16 +38,16 @@ class Command(BaseCommand):
 
         self.stdout.write('🔧 步骤 1/5: 清理旧数据...')
         try:
-            UserSimilarity.objects.all().delete()
-            QuestionSimilarity.objects.all().delete()
+            # 相似度矩阵不再预先清空：全量重建写入新的代数后原子切换，重建期间仍读取旧矩阵
             Recommendation.objects.all().delete()
+            MaterializedRecommendation.objects.all().delete()
             self.stdout.write(self.style.SUCCESS('  ✓ 旧数据清理完成'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'  ✗ 清理失败: {str(e)}'))
             return
 
         self.stdout.write('\n📊 步骤 2/5: 检查基础数据...')
-        users_count = User.objects.filter(interaction__isnull=False).distinct().count()
+        users_count = User.objects.filter(interactions__isnull=False).distinct().count()
         questions_count = Question.objects.filter(is_approved=True).count()
         interactions_count = Interaction.objects.filter(is_submitted=True, score__isnull=False).count()
 
@@ -93,8 +93,8 @@ class Command(BaseCommand):
             return
 
         self.stdout.write('\n✅ 步骤 5/5: 验证修复结果...')
-        user_sim_count = UserSimilarity.objects.count()
-        question_sim_count = QuestionSimilarity.objects.count()
+        user_sim_count = UserSimilarity.objects.active().count()
+        question_sim_count = QuestionSimilarity.objects.active().count()
 
         if user_sim_count > 0 and question_sim_count > 0:
             self.stdout.write(self.style.SUCCESS('\n🎉 推荐系统修复成功！'))
@@ -0,0 +1,77 @@
+import time
+from django.core.management.base import BaseCommand
+from recommender.materialize import RecommendationMaterializer, DEFAULT_USER_BATCH_SIZE
+from recommender.models import MaterializedRecommendation
+from recommender.telemetry import BuildTelemetry
+
+
+class Command(BaseCommand):
+    help = '为活跃用户离线批量生成推荐列表（可由 cron 等定时执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type',
+            type=str,
+            default='hybrid',
+            choices=['all', 'user_based', 'item_based', 'hybrid', 'mf', 'content_based', 'graph'],
+            help='推荐类型：all-近邻推荐三种类型, user_based, item_based, hybrid, mf, content_based, graph'
+        )
+        parser.add_argument(
+            '--n',
+            type=int,
+            default=10,
+            help='每个用户的推荐数量'
+        )
+        parser.add_argument(
+            '--min-similarity',
+            type=float,
+            default=0.1,
+            help='最小相似度阈值'
+        )
+        parser.add_argument(
+            '--active-days',
+            type=int,
+            default=None,
+            help='只处理最近 N 天内有答题的用户，默认处理所有有答题记录的用户'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_USER_BATCH_SIZE,
+            help='每批处理的用户数'
+        )
+
+    def handle(self, *args, **options):
+        types = ['user_based', 'item_based', 'hybrid'] if options['type'] == 'all' else [options['type']]
+        users = list(RecommendationMaterializer.active_users(options['active_days']))
+
+        self.stdout.write(self.style.SUCCESS('开始离线生成推荐列表...'))
+        self.stdout.write(f'  活跃用户: {len(users)}')
+
+        if not users:
+            self.stdout.write(self.style.WARNING('没有需要生成推荐的用户'))
+            return
+
+        for recommendation_type in types:
+            self.stdout.write(f'\n正在生成 {recommendation_type} 推荐...')
+            started = time.perf_counter()
+            try:
+                with BuildTelemetry.record(f'materialized_{recommendation_type}') as run:
+                    count = RecommendationMaterializer.materialize(
+                        users,
+                        recommendation_type=recommendation_type,
+                        n=options['n'],
+                        min_similarity=options['min_similarity'],
+                        batch_size=options['batch_size']
+                    )
+                    run.rows_written = count
+                    run.details = {'users': len(users), 'n': options['n'], 'min_similarity': options['min_similarity']}
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ {recommendation_type}: {count} 个用户，耗时 {elapsed:.1f}s'
+                ))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'✗ {recommendation_type} 生成失败: {str(e)}'))
+
+        self.stdout.write(self.style.SUCCESS('\n生成完成!'))
+        self.stdout.write(f'  物化推荐记录: {MaterializedRecommendation.objects.count()}')
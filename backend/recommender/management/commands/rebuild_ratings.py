@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from recommender.ratings import OnlineRatings
+from recommender.telemetry import BuildTelemetry
+
+
+class Command(BaseCommand):
+    help = '重建能力评分与题目难度评分：按标注难度设初值，再按时间顺序重放全部已评分的答题记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed-only',
+            action='store_true',
+            help='只为还没有难度评分的题目创建初值（例如上线前的存量题目），不改动已有评分'
+        )
+
+    def handle(self, *args, **options):
+        if options['seed_only']:
+            self.stdout.write(self.style.SUCCESS('开始为存量题目创建难度评分...'))
+        else:
+            self.stdout.write(self.style.SUCCESS('开始重放答题记录重建评分...'))
+
+        with BuildTelemetry.record('ratings') as run:
+            stats = OnlineRatings.rebuild(seed_only=options['seed_only'])
+            run.rows_written = stats['questions'] + stats['skills']
+            run.details = dict(stats, seed_only=options['seed_only'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 评分已重建: {stats["questions"]} 道题目，{stats["skills"]} 条用户能力评分，'
+            f'重放 {stats["interactions"]} 条答题记录'
+        ))
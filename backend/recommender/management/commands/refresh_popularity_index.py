@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from recommender.popularity import PopularityIndex
+from recommender.telemetry import BuildTelemetry
+
+
+class Command(BaseCommand):
+    help = '刷新按时间衰减的热门题目索引（可由 cron 等定时执行，使请求路径不承担刷新）'
+
+    def handle(self, *args, **options):
+        with BuildTelemetry.record('popularity') as run:
+            index = PopularityIndex.refresh()
+            run.rows_written = len(index.question_ids)
+            run.details = {'interaction_watermark': index.watermark}
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 热度索引已刷新: {len(index.question_ids)} 道题目，已计入答题记录至 ID {index.watermark}'
+        ))
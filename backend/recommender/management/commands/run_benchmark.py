@@ -0,0 +1,106 @@
+import json
+from django.core.management.base import BaseCommand
+from recommender.benchmark import DatasetSpec, clear_dataset, generate_dataset, run_benchmark
+from recommender.benchmark.runner import RECOMMENDERS
+
+
+class Command(BaseCommand):
+    help = '推荐系统性能测试：可选生成合成数据集，计时相似度重建与各类推荐，输出 JSON 报告'
+
+    def add_arguments(self, parser):
+        defaults = DatasetSpec()
+        parser.add_argument(
+            '--generate',
+            action='store_true',
+            help='测试前生成合成数据集（建议使用单独的数据库）'
+        )
+        parser.add_argument('--users', type=int, default=defaults.users, help='合成用户数')
+        parser.add_argument('--questions', type=int, default=defaults.questions, help='合成题目数')
+        parser.add_argument('--interactions', type=int, default=defaults.interactions, help='合成答题记录数')
+        parser.add_argument('--categories', type=int, default=defaults.categories, help='合成分类数')
+        parser.add_argument(
+            '--activity-alpha',
+            type=float,
+            default=defaults.activity_alpha,
+            help='用户活跃度幂律指数'
+        )
+        parser.add_argument(
+            '--popularity-alpha',
+            type=float,
+            default=defaults.popularity_alpha,
+            help='题目热度幂律指数'
+        )
+        parser.add_argument('--seed', type=int, default=defaults.seed, help='随机种子')
+        parser.add_argument(
+            '--prefix',
+            type=str,
+            default=defaults.prefix,
+            help='合成数据的名称前缀，同时用于抽样用户'
+        )
+        parser.add_argument('--sample', type=int, default=200, help='每种推荐抽样的用户数')
+        parser.add_argument('--n', type=int, default=10, help='每次推荐的数量')
+        parser.add_argument('--workers', type=int, default=1, help='重建相似度的进程数')
+        parser.add_argument(
+            '--types',
+            nargs='+',
+            choices=list(RECOMMENDERS),
+            default=list(RECOMMENDERS),
+            help='要测试的推荐类型'
+        )
+        parser.add_argument(
+            '--no-rebuild',
+            action='store_true',
+            help='不重建相似度，直接使用现有的近邻表'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help='JSON 报告的输出文件，默认输出到标准输出'
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='测试结束后删除合成数据集'
+        )
+
+    def handle(self, *args, **options):
+        dataset = None
+        if options['generate']:
+            spec = DatasetSpec(
+                users=options['users'],
+                questions=options['questions'],
+                interactions=options['interactions'],
+                categories=options['categories'],
+                activity_alpha=options['activity_alpha'],
+                popularity_alpha=options['popularity_alpha'],
+                seed=options['seed'],
+                prefix=options['prefix']
+            )
+            self.stderr.write(f'生成合成数据集: {spec._asdict()}')
+            dataset = {'spec': spec._asdict(), **generate_dataset(spec)}
+
+        try:
+            report = run_benchmark(
+                sample=options['sample'],
+                n=options['n'],
+                workers=options['workers'],
+                seed=options['seed'],
+                prefix=options['prefix'] if options['generate'] else None,
+                recommenders=options['types'],
+                rebuild=not options['no_rebuild']
+            )
+        finally:
+            if options['clear'] and options['generate']:
+                clear_dataset(options['prefix'])
+
+        if dataset:
+            report['generated'] = dataset
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            self.stderr.write(self.style.SUCCESS(f'✓ 报告已写入 {options["output"]}'))
+        else:
+            self.stdout.write(output)
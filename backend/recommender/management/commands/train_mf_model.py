@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from recommender.factorization import ALSModel, train_settings
+from recommender.matrix import RatingMatrix
+from recommender.telemetry import BuildTelemetry
+
+
+class Command(BaseCommand):
+    help = '用 ALS 训练矩阵分解推荐模型，并发布为内存映射文件'
+
+    def add_arguments(self, parser):
+        defaults = train_settings()
+        parser.add_argument(
+            '--factors',
+            type=int,
+            default=defaults['factors'],
+            help='潜在因子维数'
+        )
+        parser.add_argument(
+            '--epochs',
+            type=int,
+            default=defaults['epochs'],
+            help='训练轮数'
+        )
+        parser.add_argument(
+            '--regularization',
+            type=float,
+            default=defaults['regularization'],
+            help='正则化系数'
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=defaults['threads'],
+            help='并行求解的线程数'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('开始训练矩阵分解模型...'))
+
+        with BuildTelemetry.record('mf') as run:
+            matrix = RatingMatrix.from_interactions(approved_only=True)
+            if not matrix.ratings.nnz:
+                self.stdout.write(self.style.WARNING('没有评分记录，无法训练模型'))
+                return
+
+            model = ALSModel.train(
+                matrix,
+                factors=options['factors'],
+                epochs=options['epochs'],
+                regularization=options['regularization'],
+                threads=options['threads']
+            )
+            path = model.save()
+            run.rows_written = int(matrix.ratings.nnz)
+            run.details = dict(model.manifest, path=str(path))
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 模型已发布: {path}（{matrix.shape[0]} 个用户，{matrix.shape[1]} 道题目，'
+            f'训练 RMSE {model.manifest["rmse"] * 100:.2f}）'
+        ))
@@ -2,7 +2,8 @@ from django.core.management.base import BaseCommand
 from practice.models import Interaction
 from questions.models import Question
 from users.models import User
-from recommender.algorithms import CollaborativeFiltering
+from recommender.artifact import export_artifact
+from recommender.matrix import SimilarityEngine
 from recommender.models import UserSimilarity, QuestionSimilarity
 
 
@@ -23,19 +24,39 @@ class Command(BaseCommand):
             default=2,
             help='最小共同答题数/用户数'
         )
+        parser.add_argument(
+            '--memory-mb',
+            type=int,
+            default=None,
+            help='分块计算的内存预算（MB），默认读取 RECOMMENDER_SIMILARITY_MEMORY_MB'
+        )
+
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='全量重建时并行计算的进程数，默认 1（单进程）'
+        )
+        parser.add_argument(
+            '--export-artifact',
+            action='store_true',
+            help='重建后把近邻表导出为内存映射文件（目录见 RECOMMENDER_ARTIFACT_DIR）'
+        )
 
     def handle(self, *args, **options):
         update_type = options['type']
         min_common = options['min_common']
+        memory_mb = options['memory_mb']
+        workers = max(1, options['workers'])
 
         self.stdout.write(self.style.SUCCESS('开始更新推荐系统相似度矩阵...'))
 
         stats = {
-            'users': User.objects.filter(interaction__isnull=False).distinct().count(),
-            'questions': Question.objects.filter(interaction__isnull=False, is_approved=True).distinct().count(),
+            'users': User.objects.filter(interactions__isnull=False).distinct().count(),
+            'questions': Question.objects.filter(interactions__isnull=False, is_approved=True).distinct().count(),
             'interactions': Interaction.objects.filter(is_submitted=True, score__isnull=False).count(),
-            'user_similarities': UserSimilarity.objects.count(),
-            'question_similarities': QuestionSimilarity.objects.count(),
+            'user_similarities': UserSimilarity.objects.active().count(),
+            'question_similarities': QuestionSimilarity.objects.active().count(),
         }
 
         self.stdout.write(f'当前数据统计:')
@@ -59,8 +80,10 @@ class Command(BaseCommand):
         if update_type in ['all', 'user']:
             self.stdout.write('\n正在更新用户相似度矩阵...')
             try:
-                user_count = CollaborativeFiltering.update_user_similarities(
-                    min_common_questions=min_common
+                user_count = SimilarityEngine.rebuild_user_similarities(
+                    min_common_questions=min_common,
+                    memory_budget_mb=memory_mb,
+                    workers=workers
                 )
                 self.stdout.write(self.style.SUCCESS(f'✓ 用户相似度矩阵更新完成: {user_count} 条记录'))
             except Exception as e:
@@ -69,16 +92,27 @@ class Command(BaseCommand):
         if update_type in ['all', 'question']:
             self.stdout.write('\n正在更新题目相似度矩阵...')
             try:
-                question_count = CollaborativeFiltering.update_question_similarities(
-                    min_common_users=min_common
+                question_count = SimilarityEngine.rebuild_question_similarities(
+                    min_common_users=min_common,
+                    memory_budget_mb=memory_mb,
+                    workers=workers
                 )
                 self.stdout.write(self.style.SUCCESS(f'✓ 题目相似度矩阵更新完成: {question_count} 条记录'))
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f'✗ 题目相似度矩阵更新失败: {str(e)}'))
 
+        if options['export_artifact']:
+            kinds = {'all': ['user', 'question'], 'user': ['user'], 'question': ['question']}[update_type]
+            for kind in kinds:
+                try:
+                    path = export_artifact(kind)
+                    self.stdout.write(self.style.SUCCESS(f'✓ 近邻矩阵文件已导出: {path}'))
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'✗ 近邻矩阵文件导出失败: {str(e)}'))
+
         new_stats = {
-            'user_similarities': UserSimilarity.objects.count(),
-            'question_similarities': QuestionSimilarity.objects.count(),
+            'user_similarities': UserSimilarity.objects.active().count(),
+            'question_similarities': QuestionSimilarity.objects.active().count(),
         }
 
         self.stdout.write(self.style.SUCCESS('\n更新完成!'))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from recommender.preferences import UserPreferenceBuilder
+
+
+class Command(BaseCommand):
+    help = '批量重新计算所有用户的偏好分析（两次分组查询 + 分块批量写入）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='每个写入事务的行数，默认取 RECOMMENDER_BULK_CHUNK_SIZE'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('开始计算用户偏好...'))
+
+        started = time.perf_counter()
+        count = UserPreferenceBuilder.build(chunk_size=options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 已更新 {count} 个用户的偏好分析，耗时 {time.perf_counter() - started:.1f}s'
+        ))
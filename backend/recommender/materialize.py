@@ -0,0 +1,243 @@
+"""
+离线推荐物化
+
+materialize_recommendations 命令批量为活跃用户预先计算 Top-N 推荐，
+把序列化后的整份列表写入 MaterializedRecommendation（每个用户每种类型一行）。
+在线接口先读物化结果（一次查询），只有没有物化记录的用户才实时计算。
+
+物化时记录用户最新一条已提交答题记录的更新时间（answered_at）。用户之后提交或评分答题时
+该时间变化，读取时与当前值不一致即视为未命中，与缓存代数的失效条件相同；
+返回前再用已答位图去掉已答题目，剩余不足时同样视为未命中，改为实时计算。
+"""
+from datetime import timedelta
+from typing import Iterable, List, Optional
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+from practice.models import Interaction
+from users.models import User
+from .algorithms import CollaborativeFiltering
+from .answered import AnsweredSet, exclusion_mask
+from .bulk import BulkUpserter
+from .models import Recommendation, MaterializedRecommendation
+from .serializers import RecommendationSerializer
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 每批处理的用户数（推荐记录回读与序列化按批进行）
+DEFAULT_USER_BATCH_SIZE = 200
+
+
+class RecommendationMaterializer:
+    """
+    推荐列表的离线批量生成与在线读取
+    """
+
+    @staticmethod
+    def active_users(active_days: Optional[int] = None):
+        """
+        获取需要物化推荐的活跃用户（已启用且有已提交的答题记录）
+
+        Args:
+            active_days: 如果指定，只包含最近 N 天内有答题的用户
+
+        Returns:
+            QuerySet: 用户查询集
+        """
+        users = User.objects.filter(is_active=True, interactions__is_submitted=True)
+        if active_days:
+            users = users.filter(
+                interactions__created_at__gte=timezone.now() - timedelta(days=active_days)
+            )
+        return users.distinct().order_by('id')
+
+    @staticmethod
+    def materialize(
+        users: Optional[Iterable[User]] = None,
+        recommendation_type: str = 'hybrid',
+        n: int = 10,
+        min_similarity: float = 0.1,
+        batch_size: int = DEFAULT_USER_BATCH_SIZE
+    ) -> int:
+        """
+        为一批用户生成并保存推荐列表
+
+        Args:
+            users: 目标用户，默认为所有活跃用户
+            recommendation_type: 推荐类型 (user_based, item_based, hybrid, mf, content_based, graph)
+            n: 每个用户的推荐数量
+            min_similarity: 最小相似度阈值
+            batch_size: 每批处理的用户数
+
+        Returns:
+            int: 物化的用户数
+        """
+        if users is None:
+            users = RecommendationMaterializer.active_users().iterator()
+
+        logger.info(f"Materializing {recommendation_type} recommendations (n={n})")
+        materialized_count = 0
+        batch = []
+        with BulkUpserter(
+            MaterializedRecommendation,
+            ['user', 'recommendation_type'],
+            ['n', 'min_similarity', 'items', 'generated_at', 'answered_at']
+        ) as writer:
+            for user in users:
+                batch.append(user)
+                if len(batch) >= batch_size:
+                    materialized_count += RecommendationMaterializer._materialize_batch(
+                        writer, batch, recommendation_type, n, min_similarity
+                    )
+                    batch = []
+            if batch:
+                materialized_count += RecommendationMaterializer._materialize_batch(
+                    writer, batch, recommendation_type, n, min_similarity
+                )
+
+        logger.info(f"Materialized {recommendation_type} recommendations for {materialized_count} users")
+        return materialized_count
+
+    @staticmethod
+    def _materialize_batch(
+        writer: BulkUpserter,
+        users: List[User],
+        recommendation_type: str,
+        n: int,
+        min_similarity: float
+    ) -> int:
+        """
+        计算一批用户的推荐，写入推荐记录后一次性回读并序列化
+        """
+        # 在计算推荐之前读取，计算期间新提交的答题会使这批结果在读取时失效
+        answered_at = dict(
+            _latest_answers().filter(user_id__in=[user.id for user in users])
+            .values('user_id').annotate(latest=Max('updated_at')).values_list('user_id', 'latest')
+        )
+
+        ranked = {}
+        with BulkUpserter(
+            Recommendation,
+            ['user', 'question', 'recommendation_type'],
+            ['score', 'reason']
+        ) as recommendation_writer:
+            for user, recommendations in RecommendationMaterializer._recommend_batch(
+                users, recommendation_type, n, min_similarity
+            ):
+                ranked[user.id] = [question.id for question, _, _ in recommendations]
+                recommendation_writer.extend(
+                    Recommendation(
+                        user=user,
+                        question=question,
+                        recommendation_type=recommendation_type,
+                        score=score,
+                        reason=reason
+                    )
+                    for question, score, reason in recommendations
+                )
+
+        saved = {
+            (rec.user_id, rec.question_id): rec
+            for rec in Recommendation.objects.filter(
+                user_id__in=list(ranked),
+                recommendation_type=recommendation_type
+            ).select_related('question')
+        }
+
+        generated_at = timezone.now()
+        for user_id, question_ids in ranked.items():
+            records = [saved[(user_id, question_id)] for question_id in question_ids]
+            writer.add(MaterializedRecommendation(
+                user_id=user_id,
+                recommendation_type=recommendation_type,
+                n=n,
+                min_similarity=min_similarity,
+                items=RecommendationSerializer(records, many=True).data,
+                generated_at=generated_at,
+                answered_at=answered_at.get(user_id)
+            ))
+        return len(ranked)
+
+    @staticmethod
+    def _recommend_batch(users: List[User], recommendation_type: str, n: int, min_similarity: float):
+        """
+        逐个计算一批用户的推荐（图游走推荐整批一次游走），出错的用户跳过
+
+        Yields:
+            (user, recommendations)
+        """
+        if recommendation_type == 'graph':
+            try:
+                batch = CollaborativeFiltering.graph_recommend_many(users, n)
+            except Exception as e:
+                logger.error(f"Error materializing graph recommendations for {len(users)} users: {e}", exc_info=True)
+                return
+            for user in users:
+                yield user, batch[user.id]
+            return
+
+        for user in users:
+            try:
+                recommendations = CollaborativeFiltering.recommend(
+                    user, recommendation_type, n, min_similarity
+                )
+            except Exception as e:
+                logger.error(f"Error materializing recommendations for user {user.id}: {e}", exc_info=True)
+                continue
+            yield user, recommendations
+
+    @staticmethod
+    def serve(
+        user: User,
+        recommendation_type: str = 'hybrid',
+        n: int = 10,
+        min_similarity: float = 0.1
+    ) -> Optional[dict]:
+        """
+        读取物化的推荐列表（一次查询，最新答题时间以子查询同时取出）
+
+        物化时的推荐数量不少于 n 且最小相似度相同才可使用；物化之后用户又提交或评分了答题时不可使用。
+        已答题目从结果中去掉，剩余数量少于原列表能提供的数量时不可使用。
+
+        Returns:
+            dict: 与 generate_recommendations 相同结构的结果，没有可用的物化记录时返回 None
+        """
+        latest = _latest_answers().filter(user=OuterRef('user')).order_by('-updated_at').values('updated_at')[:1]
+        entry = MaterializedRecommendation.objects.filter(
+            user=user,
+            recommendation_type=recommendation_type,
+            n__gte=n,
+            min_similarity=min_similarity
+        ).annotate(current_answered_at=Subquery(latest)).values(
+            'items', 'generated_at', 'answered_at', 'current_answered_at'
+        ).first()
+
+        if entry is None:
+            return None
+        if entry['answered_at'] != entry['current_answered_at']:
+            logger.info(f"Materialized {recommendation_type} recommendations for user {user.id} are stale")
+            return None
+
+        question_ids = np.array([item['question'] for item in entry['items']], dtype=np.int64)
+        answered = exclusion_mask(question_ids, AnsweredSet.for_user(user.id))
+        items = [item for item, skip in zip(entry['items'], answered.tolist()) if not skip]
+        if len(items) < min(n, len(entry['items'])):
+            logger.info(f"Materialized {recommendation_type} recommendations for user {user.id} are exhausted")
+            return None
+
+        items = items[:n]
+        return {
+            'recommendations': items,
+            'count': len(items),
+            'type': recommendation_type,
+            'source': 'materialized',
+            'generated_at': entry['generated_at'],
+        }
+
+
+def _latest_answers():
+    """
+    已提交的答题记录（包括已删除的：删除同样会更新 updated_at，使物化结果失效）
+    """
+    return Interaction.all_objects.filter(is_submitted=True)
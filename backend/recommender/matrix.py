@@ -0,0 +1,721 @@
+"""
+稀疏评分矩阵与批量相似度计算引擎
+
+一次性把所有已提交且已评分的答题记录读入内存，构建 用户 × 题目 的 CSR 稀疏矩阵，
+再用分块矩阵乘法一次算出所有用户对（按行）或题目对（按列）的相似度，避免逐对查询数据库。
+"""
+from typing import Iterator, NamedTuple, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from practice.models import Interaction
+from questions.models import Question
+from users.models import User
+from .bulk import BulkUpserter
+from .generations import SimilarityGenerations
+from .models import UserSimilarity, QuestionSimilarity, UserNeighbor, QuestionNeighbor
+from .telemetry import BuildRun, BuildTelemetry
+import numpy as np
+from scipy import sparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 每批参与矩阵乘法的行数
+DEFAULT_BLOCK_SIZE = 256
+
+# 分块计算时的默认内存预算（MB）
+DEFAULT_MEMORY_BUDGET_MB = 256
+
+# 每个分块会生成一个 float64 稠密共同数矩阵，统计量矩阵逐个生成后立即取值，按每个单元 48 字节估算
+BYTES_PER_BLOCK_CELL = 48
+
+# 每个用户/题目默认保留的近邻数量
+DEFAULT_NEIGHBOR_K = 50
+
+# 相似度表中保存的充分统计量字段
+STATS_FIELDS = ['sum_a', 'sum_b', 'sum_ab', 'sum_sq_a', 'sum_sq_b']
+
+# 由统计量展开计算分母时判定为 0 的相对误差
+STATS_TOLERANCE = 1e-9
+
+
+class RatingMatrix:
+    """
+    用户 × 题目 稀疏评分矩阵
+
+    Attributes:
+        user_ids: 行号 -> 用户 ID
+        question_ids: 列号 -> 题目 ID
+        ratings: CSR 格式的评分矩阵，只存储有评分的位置
+    """
+
+    def __init__(self, user_ids: np.ndarray, question_ids: np.ndarray, ratings: sparse.csr_matrix):
+        self.user_ids = user_ids
+        self.question_ids = question_ids
+        self.ratings = ratings
+        self.user_index = {user_id: i for i, user_id in enumerate(user_ids.tolist())}
+        self.question_index = {question_id: i for i, question_id in enumerate(question_ids.tolist())}
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.ratings.shape
+
+    @classmethod
+    def from_interactions(cls, approved_only: bool = False) -> 'RatingMatrix':
+        """
+        从答题记录构建评分矩阵（单次 values_list 流式读取）
+
+        同一用户对同一题目有多条评分记录时，保留与逐对计算相同的那一条：
+        逐对计算用字典按默认排序依次覆盖，因此最后出现的记录生效。
+
+        Args:
+            approved_only: 是否只保留已审核且未删除的题目（题目相似度使用）
+
+        Returns:
+            RatingMatrix: 评分矩阵
+        """
+        interactions = Interaction.objects.filter(
+            score__isnull=False,
+            is_submitted=True
+        )
+        if approved_only:
+            # 与原来从 Question.objects（软删除管理器）取题目一致：已软删除的题目不参与
+            interactions = interactions.filter(
+                question__is_approved=True,
+                question__is_deleted=False
+            )
+        rows = interactions.values_list('user_id', 'question_id', 'score')
+
+        user_col = []
+        question_col = []
+        score_col = []
+        for user_id, question_id, score in rows.iterator(chunk_size=10000):
+            user_col.append(user_id)
+            question_col.append(question_id)
+            score_col.append(score)
+
+        user_ids, row_idx = np.unique(np.asarray(user_col, dtype=np.int64), return_inverse=True)
+        question_ids, col_idx = np.unique(np.asarray(question_col, dtype=np.int64), return_inverse=True)
+        scores = np.asarray(score_col, dtype=np.float64)
+
+        # 去重：对 (行, 列) 键反转后取首次出现位置，即原顺序中最后一次出现
+        if len(scores):
+            keys = row_idx.astype(np.int64) * len(question_ids) + col_idx
+            _, last = np.unique(keys[::-1], return_index=True)
+            keep = len(keys) - 1 - last
+            row_idx, col_idx, scores = row_idx[keep], col_idx[keep], scores[keep]
+
+        ratings = sparse.csr_matrix(
+            (scores, (row_idx, col_idx)),
+            shape=(len(user_ids), len(question_ids))
+        )
+        ratings.sort_indices()
+
+        logger.info(
+            f"Loaded rating matrix: {ratings.shape[0]} users x {ratings.shape[1]} questions, "
+            f"{ratings.nnz} ratings"
+        )
+        return cls(user_ids, question_ids, ratings)
+
+
+def _structure(matrix: sparse.csr_matrix, data: np.ndarray) -> sparse.csr_matrix:
+    """
+    复用稀疏结构构建新矩阵（保留显式 0，例如 0 分或恰好等于均值的评分）
+    """
+    return sparse.csr_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def block_size_for(n_columns: int, memory_budget_mb: Optional[int] = None) -> int:
+    """
+    根据内存预算计算每批参与矩阵乘法的行数
+
+    Args:
+        n_columns: 结果矩阵的列数（参与比较的实体总数）
+        memory_budget_mb: 内存预算（MB），为空时读取 RECOMMENDER_SIMILARITY_MEMORY_MB 配置
+
+    Returns:
+        int: 每批行数，至少为 1
+    """
+    if memory_budget_mb is None:
+        memory_budget_mb = getattr(settings, 'RECOMMENDER_SIMILARITY_MEMORY_MB', DEFAULT_MEMORY_BUDGET_MB)
+    budget = memory_budget_mb * 1024 * 1024
+    return max(1, int(budget // (max(n_columns, 1) * BYTES_PER_BLOCK_CELL)))
+
+
+class PairStats(NamedTuple):
+    """
+    一对实体的相似度及充分统计量
+
+    sum_* 只在共同评分上累加，a 对应 ID 较小的一方；
+    有了这些统计量和双方的评分均值即可重新计算去均值余弦相似度，供增量维护使用。
+    """
+    a: int
+    b: int
+    similarity: float
+    common: int
+    sum_a: float
+    sum_b: float
+    sum_ab: float
+    sum_sq_a: float
+    sum_sq_b: float
+
+    def swapped(self) -> 'PairStats':
+        return PairStats(
+            self.b, self.a, self.similarity, self.common,
+            self.sum_b, self.sum_a, self.sum_ab, self.sum_sq_b, self.sum_sq_a
+        )
+
+
+def similarity_from_stats(common, sum_a, sum_b, sum_ab, sum_sq_a, sum_sq_b, mean_a, mean_b, min_common: int = 2):
+    """
+    由充分统计量计算去均值余弦相似度（支持标量或 NumPy 数组）
+
+    展开 Σ(a - ā)(b - b̄) 与 Σ(a - ā)² 后只依赖共同评分上的和、平方和与乘积和，
+    因此某一方的均值变化时无需重新读取评分。
+
+    Returns:
+        相似度，范围 0-1；共同评分数不足或分母为 0 时为 0.0
+    """
+    common = np.asarray(common, dtype=np.float64)
+    numerator = sum_ab - mean_b * sum_a - mean_a * sum_b + common * mean_a * mean_b
+    denominator_a = sum_sq_a - 2 * mean_a * sum_a + common * mean_a ** 2
+    denominator_b = sum_sq_b - 2 * mean_b * sum_b + common * mean_b ** 2
+
+    # 展开式存在抵消误差，按平方和的相对量判断分母是否为 0
+    zero_a = denominator_a <= STATS_TOLERANCE * np.maximum(sum_sq_a, 1.0)
+    zero_b = denominator_b <= STATS_TOLERANCE * np.maximum(sum_sq_b, 1.0)
+    valid = (common >= min_common) & ~zero_a & ~zero_b
+
+    denominator = np.sqrt(np.where(valid, denominator_a, 1.0)) * np.sqrt(np.where(valid, denominator_b, 1.0))
+    similarity = np.where(valid, (np.clip(numerator / denominator, -1.0, 1.0) + 1) / 2, 0.0)
+    return similarity if similarity.ndim else float(similarity)
+
+
+class SimilarityBlock(NamedTuple):
+    """
+    一个分块的计算结果：targets 中每一行与所有其他行之间、至少有一个共同评分的行对
+    """
+    targets: np.ndarray
+    rows: np.ndarray
+    cols: np.ndarray
+    similarity: np.ndarray
+    common: np.ndarray
+    sum_a: np.ndarray
+    sum_b: np.ndarray
+    sum_ab: np.ndarray
+    sum_sq_a: np.ndarray
+    sum_sq_b: np.ndarray
+
+    def pairs(self, upper_only: bool) -> Iterator[PairStats]:
+        """
+        逐对输出，upper_only 为 True 时每对只输出一次（行号 < 列号）
+        """
+        keep = self.cols > self.rows if upper_only else np.ones(len(self.cols), dtype=bool)
+        for values in zip(
+            self.rows[keep].tolist(), self.cols[keep].tolist(), self.similarity[keep].tolist(),
+            self.common[keep].astype(int).tolist(), self.sum_a[keep].tolist(), self.sum_b[keep].tolist(),
+            self.sum_ab[keep].tolist(), self.sum_sq_a[keep].tolist(), self.sum_sq_b[keep].tolist()
+        ):
+            yield PairStats(*values)
+
+    def bounded(
+        self, k: int, min_common: int, upper_only: bool, extra_cols: Optional[np.ndarray] = None
+    ) -> Tuple['SimilarityBlock', tuple, int]:
+        """
+        裁剪到需要保存的行对：只保留出现在本分块各行 Top-K 近邻中的行对（完整统计量）
+
+        Args:
+            extra_cols: 额外保留的列号（单目标重建时，近邻列表中包含该目标的那些行）
+
+        Returns:
+            (block, top_k, evaluated): 裁剪后的分块、各行的 Top-K 近邻（同 top_k()），
+            以及共同评分数达到 min_common、实际计算了相似度的行对数（upper_only 时每对只计一次）
+        """
+        top = self.top_k(k)
+        owners, _, cols = top[0], top[1], top[2]
+        evaluated_mask = self.common >= min_common
+        if upper_only:
+            evaluated_mask &= self.cols > self.rows
+        size = int(max(self.rows.max(initial=0), self.cols.max(initial=0))) + 1
+        keep = np.isin(self.rows * size + self.cols, owners * size + cols)
+        if extra_cols is not None:
+            keep |= np.isin(self.cols, extra_cols)
+        kept = self._replace(**{
+            field: getattr(self, field)[keep] for field in self._fields if field != 'targets'
+        })
+        return kept, top, int(np.count_nonzero(evaluated_mask))
+
+    def top_k(self, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        每一行只保留相似度最高的 k 个邻居（相似度为 0 的无效行对不参与）
+
+        Returns:
+            (rows, ranks, cols, similarity, common)，按行号、名次排序，名次从 0 开始
+        """
+        valid = self.similarity > 0
+        rows, cols = self.rows[valid], self.cols[valid]
+        similarity, common = self.similarity[valid], self.common[valid]
+
+        # 行号升序、相似度降序、列号升序（保证结果稳定）
+        order = np.lexsort((cols, -similarity, rows))
+        rows, cols, similarity, common = rows[order], cols[order], similarity[order], common[order]
+
+        ranks = np.arange(len(rows)) - np.searchsorted(rows, rows, side='left')
+        keep = ranks < k
+        return rows[keep], ranks[keep], cols[keep], similarity[keep], common[keep]
+
+
+def similarity_blocks(
+    ratings: sparse.csr_matrix,
+    min_common: int = 2,
+    rows: Optional[np.ndarray] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE
+) -> Iterator[SimilarityBlock]:
+    """
+    按行分块计算去均值余弦相似度及其充分统计量
+
+    与 CollaborativeFiltering.calculate_user_similarity 的定义一致：
+    均值取该行全部评分的平均值，分子和分母只在共同评分的列上累加，
+    结果映射到 [0, 1]，共同评分数不足 min_common 或分母为 0 时为 0.0。
+
+    Args:
+        ratings: CSR 评分矩阵，每一行是一个待比较的实体
+        min_common: 最小共同评分数
+        rows: 只计算这些行；为空时计算所有行
+        block_size: 每批参与矩阵乘法的行数
+
+    Yields:
+        SimilarityBlock: 每个分块一个（没有任何行对的分块也会输出）
+    """
+    yield from SimilarityOperands(ratings).blocks(min_common, rows, block_size)
+
+
+class SimilarityOperands:
+    """
+    分块计算所需的派生矩阵（均值、平方矩阵、指示矩阵及其转置）
+
+    只依赖评分矩阵，构建一次后可用于任意多个分块（并行重建时每个进程构建一次）。
+    """
+
+    def __init__(self, ratings: sparse.csr_matrix):
+        self.ratings = ratings
+        counts = np.diff(ratings.indptr)
+        sums = np.asarray(ratings.sum(axis=1)).ravel()
+        self.means = np.divide(sums, counts, out=np.zeros_like(sums, dtype=np.float64), where=counts > 0)
+
+        # 平方矩阵 S、指示矩阵 B 与评分矩阵 R 共享同一稀疏结构
+        self.squared = _structure(ratings, np.asarray(ratings.data) ** 2)
+        self.indicator = _structure(ratings, np.ones_like(ratings.data))
+
+        self.ratings_t = ratings.T.tocsr()
+        self.squared_t = self.squared.T.tocsr()
+        self.indicator_t = self.indicator.T.tocsr()
+
+    def blocks(
+        self,
+        min_common: int = 2,
+        rows: Optional[np.ndarray] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE
+    ) -> Iterator[SimilarityBlock]:
+        targets = np.arange(self.ratings.shape[0]) if rows is None else np.asarray(rows)
+        for start in range(0, len(targets), block_size):
+            yield self.block(targets[start:start + block_size], min_common)
+
+    def block(self, block: np.ndarray, min_common: int = 2) -> SimilarityBlock:
+        ratings, indicator, squared = self.ratings, self.indicator, self.squared
+
+        common = (indicator[block] @ self.indicator_t).toarray()
+        mask = common > 0
+        mask[np.arange(len(block)), block] = False
+
+        local_i, cols = np.nonzero(mask)
+        pair_common = common[local_i, cols]
+        sum_a = (ratings[block] @ self.indicator_t).toarray()[local_i, cols]
+        sum_b = (indicator[block] @ self.ratings_t).toarray()[local_i, cols]
+        sum_ab = (ratings[block] @ self.ratings_t).toarray()[local_i, cols]
+        sum_sq_a = (squared[block] @ self.indicator_t).toarray()[local_i, cols]
+        sum_sq_b = (indicator[block] @ self.squared_t).toarray()[local_i, cols]
+
+        row_idx = block[local_i]
+        similarity = similarity_from_stats(
+            pair_common, sum_a, sum_b, sum_ab, sum_sq_a, sum_sq_b,
+            self.means[row_idx], self.means[cols], min_common
+        )
+
+        return SimilarityBlock(
+            block, row_idx, cols, np.atleast_1d(similarity), pair_common,
+            sum_a, sum_b, sum_ab, sum_sq_a, sum_sq_b
+        )
+
+
+def pairwise_similarities(
+    ratings: sparse.csr_matrix,
+    min_common: int = 2,
+    rows: Optional[np.ndarray] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE
+) -> Iterator[PairStats]:
+    """
+    逐对输出相似度及其充分统计量
+
+    Args:
+        ratings: CSR 评分矩阵，每一行是一个待比较的实体
+        min_common: 最小共同评分数
+        rows: 只计算这些行与其他所有行的相似度；为空时计算所有行对（只输出 i < j）
+        block_size: 每批参与矩阵乘法的行数
+
+    Yields:
+        PairStats: a、b 为行号，只输出至少有一个共同评分的行对
+    """
+    for block in similarity_blocks(ratings, min_common, rows, block_size):
+        yield from block.pairs(upper_only=rows is None)
+
+
+def _ordered_by_id(stats: PairStats, ids: np.ndarray) -> PairStats:
+    """
+    把行号换成实体 ID，并保证 a 为 ID 较小的一方
+    """
+    stats = stats._replace(a=int(ids[stats.a]), b=int(ids[stats.b]))
+    return stats if stats.a < stats.b else stats.swapped()
+
+
+class _Tables:
+    """
+    相似度表与近邻表的字段映射（用户与题目结构对称）
+    """
+
+    def __init__(self, pair_model, field_a: str, field_b: str, common_field: str, neighbor_model, owner_field: str):
+        self.pair_model = pair_model
+        self.field_a = field_a
+        self.field_b = field_b
+        self.common_field = common_field
+        self.neighbor_model = neighbor_model
+        self.owner_field = owner_field
+        # 代数指针的类别（'user' 或 'question'）
+        self.kind = pair_model.GENERATION_KIND
+
+    def pair(self, stats: PairStats, generation: int):
+        return self.pair_model(**{
+            f'{self.field_a}_id': stats.a,
+            f'{self.field_b}_id': stats.b,
+            'similarity_score': stats.similarity,
+            self.common_field: stats.common,
+            'generation': generation,
+        }, **_stats_fields(stats))
+
+    def pair_writer(self, chunk_size: Optional[int] = None) -> BulkUpserter:
+        return BulkUpserter(
+            self.pair_model, [self.field_a, self.field_b, 'generation'],
+            ['similarity_score', self.common_field, *STATS_FIELDS, 'last_updated'],
+            chunk_size=chunk_size
+        )
+
+    def replace_neighbors(self, owner_ids, neighbors, generation: int) -> int:
+        """
+        用新的近邻列表整体替换这些 owner 在该代数中的旧列表
+        """
+        with transaction.atomic():
+            self.neighbor_model.objects.filter(
+                **{f'{self.owner_field}_id__in': owner_ids},
+                generation=generation
+            ).delete()
+            self.neighbor_model.objects.bulk_create(neighbors)
+        return len(neighbors)
+
+    def incoming(self, entity_id: int, generation: int) -> set:
+        """
+        近邻列表中包含 entity 的那些 owner
+        """
+        return set(self.neighbor_model.objects.filter(
+            neighbor_id=entity_id, generation=generation
+        ).values_list(f'{self.owner_field}_id', flat=True))
+
+    def prune_pairs(self, entity_id: int, keep, generation: int) -> int:
+        """
+        删除 entity 的行对中对方既不在 keep 中、近邻列表中也不包含 entity 的那些（保持行对表有界）
+
+        Returns:
+            int: 删除的行数
+        """
+        keep = set(keep) | self.incoming(entity_id, generation)
+        stale = [
+            pk for pk, a, b in self.pair_model.objects.filter(
+                Q(**{f'{self.field_a}_id': entity_id}) | Q(**{f'{self.field_b}_id': entity_id}),
+                generation=generation
+            ).values_list('pk', f'{self.field_a}_id', f'{self.field_b}_id')
+            if (b if a == entity_id else a) not in keep
+        ]
+        if not stale:
+            return 0
+        return self.pair_model.objects.filter(pk__in=stale).delete()[0]
+
+    def neighbor(self, owner_id: int, rank: int, neighbor_id: int, similarity: float, common: int, generation: int):
+        return self.neighbor_model(**{
+            f'{self.owner_field}_id': owner_id,
+            'neighbor_id': neighbor_id,
+            'rank': rank,
+            'similarity_score': similarity,
+            self.common_field: common,
+            'generation': generation,
+        })
+
+
+USER_TABLES = _Tables(UserSimilarity, 'user_a', 'user_b', 'common_questions', UserNeighbor, 'user')
+QUESTION_TABLES = _Tables(QuestionSimilarity, 'question_a', 'question_b', 'common_users', QuestionNeighbor, 'question')
+
+
+def neighbor_k() -> int:
+    """
+    每个用户/题目保留的近邻数量
+    """
+    return getattr(settings, 'RECOMMENDER_NEIGHBOR_K', DEFAULT_NEIGHBOR_K)
+
+
+class SimilarityEngine:
+    """
+    基于稀疏矩阵的批量相似度计算引擎
+    """
+
+    @staticmethod
+    def user_similarities(
+        matrix: RatingMatrix,
+        min_common_questions: int = 2,
+        target_user_id: Optional[int] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE
+    ) -> Iterator[PairStats]:
+        """
+        计算用户相似度
+
+        Args:
+            matrix: 评分矩阵
+            min_common_questions: 最小共同答题数量
+            target_user_id: 如果指定，只计算该用户与其他用户的相似度
+            block_size: 每批参与矩阵乘法的行数
+
+        Yields:
+            PairStats: a、b 为用户 ID，其中 a < b
+        """
+        rows = None
+        if target_user_id is not None:
+            if target_user_id not in matrix.user_index:
+                return
+            rows = np.array([matrix.user_index[target_user_id]])
+
+        for stats in pairwise_similarities(matrix.ratings, min_common_questions, rows, block_size):
+            yield _ordered_by_id(stats, matrix.user_ids)
+
+    @staticmethod
+    def question_similarities(
+        matrix: RatingMatrix,
+        min_common_users: int = 2,
+        target_question_id: Optional[int] = None,
+        block_size: int = DEFAULT_BLOCK_SIZE
+    ) -> Iterator[PairStats]:
+        """
+        计算题目相似度（调整余弦：按题目列去均值）
+
+        Args:
+            matrix: 评分矩阵，应使用 approved_only=True 构建
+            min_common_users: 最小共同答题用户数
+            target_question_id: 如果指定，只计算该题目与其他题目的相似度
+            block_size: 每批参与矩阵乘法的题目数
+
+        Yields:
+            PairStats: a、b 为题目 ID，其中 a < b
+        """
+        rows = None
+        if target_question_id is not None:
+            if target_question_id not in matrix.question_index:
+                return
+            rows = np.array([matrix.question_index[target_question_id]])
+
+        for stats in pairwise_similarities(matrix.ratings.T.tocsr(), min_common_users, rows, block_size):
+            yield _ordered_by_id(stats, matrix.question_ids)
+
+    @staticmethod
+    def rebuild_user_similarities(
+        min_common_questions: int = 2,
+        target_user: Optional[User] = None,
+        memory_budget_mb: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        workers: int = 1
+    ) -> int:
+        """
+        重建用户相似度矩阵并写入 UserSimilarity，同时刷新每个用户的 Top-K 近邻
+
+        Args:
+            min_common_questions: 最小共同答题数量
+            target_user: 如果指定，只更新该用户与其他用户的相似度
+            memory_budget_mb: 分块计算的内存预算（MB）
+            batch_size: 每批写入的记录数，默认取 RECOMMENDER_BULK_CHUNK_SIZE
+            workers: 全量重建时并行计算的进程数
+
+        Returns:
+            int: 更新的相似度记录数
+        """
+        logger.info(f"Rebuilding user similarities for target_user: {target_user.id if target_user else 'all'}")
+
+        with SimilarityGenerations.rebuilding(USER_TABLES, enabled=target_user is None) as generation, \
+                BuildTelemetry.record('user_similarity', enabled=target_user is None) as run:
+            matrix = RatingMatrix.from_interactions()
+            target_row = None
+            if target_user is not None:
+                target_row = matrix.user_index.get(target_user.id)
+                if target_row is None:
+                    return 0
+
+            updated_count = _rebuild(
+                USER_TABLES, matrix.ratings, matrix.user_ids, min_common_questions, target_row,
+                block_size_for(matrix.shape[0], memory_budget_mb), batch_size, workers, run, generation
+            )
+
+        logger.info(f"Rebuilt {updated_count} user similarities")
+        return updated_count
+
+    @staticmethod
+    def rebuild_question_similarities(
+        min_common_users: int = 2,
+        target_question: Optional[Question] = None,
+        memory_budget_mb: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        workers: int = 1
+    ) -> int:
+        """
+        重建题目相似度矩阵并写入 QuestionSimilarity，同时刷新每道题目的 Top-K 近邻
+
+        只统计已审核且未删除的题目，题目对按 ID 升序存储。
+
+        Args:
+            min_common_users: 最小共同答题用户数
+            target_question: 如果指定，只更新该题目与其他题目的相似度
+            memory_budget_mb: 分块计算的内存预算（MB）
+            batch_size: 每批写入的记录数，默认取 RECOMMENDER_BULK_CHUNK_SIZE
+            workers: 全量重建时并行计算的进程数
+
+        Returns:
+            int: 更新的相似度记录数
+        """
+        logger.info(
+            f"Rebuilding question similarities for target_question: {target_question.id if target_question else 'all'}"
+        )
+
+        with SimilarityGenerations.rebuilding(QUESTION_TABLES, enabled=target_question is None) as generation, \
+                BuildTelemetry.record('question_similarity', enabled=target_question is None) as run:
+            matrix = RatingMatrix.from_interactions(approved_only=True)
+            target_row = None
+            if target_question is not None:
+                target_row = matrix.question_index.get(target_question.id)
+                if target_row is None:
+                    return 0
+
+            updated_count = _rebuild(
+                QUESTION_TABLES, matrix.ratings.T.tocsr(), matrix.question_ids, min_common_users, target_row,
+                block_size_for(matrix.shape[1], memory_budget_mb), batch_size, workers, run, generation
+            )
+
+        logger.info(f"Rebuilt {updated_count} question similarities")
+        return updated_count
+
+
+def _rebuild(
+    tables: _Tables,
+    ratings: sparse.csr_matrix,
+    ids: np.ndarray,
+    min_common: int,
+    target_row: Optional[int],
+    block_size: int,
+    batch_size: Optional[int],
+    workers: int = 1,
+    run: Optional[BuildRun] = None,
+    generation: Optional[int] = None
+) -> int:
+    """
+    单次扫描同时写入 Top-K 近邻和这些近邻行对的统计量
+
+    近邻在每个分块内直接裁剪到 K 个，不会先生成完整的相似度列表。行对表同样有界：
+    只保存出现在任一方 Top-K 近邻中的行对（最多 N×K 行），其余行对的统计量不保存，
+    增量维护需要时从评分记录重新计算（见 incremental.py）。
+    同一行对同时出现在双方的近邻中时会被两个分块各输出一次：写入缓冲内去重，
+    跨块的重复写入是相同值的 upsert。
+    workers > 1 且为全量重建时，分块在多个进程中计算，结果仍由当前进程统一写入。
+    全量重建写入 generation（由调用方在读取评分前通过 SimilarityGenerations.rebuilding 分配），
+    写完后切换、清理旧代数，并重放重建期间评分有变化的实体（见 generations.py）；
+    只重建单个目标时在当前代数上原地更新，并删除该目标已不再需要的行对。
+    指定 run 时填写构建遥测：写入行数、共同评分数达到 min_common 的实体对数（pairs_evaluated），
+    以及其余候选实体对数（pairs_pruned，共同评分数不足 min_common，含没有共同评分的），
+    全量重建还在 details['replayed'] 中记录重放的实体数。
+    """
+    rows = None if target_row is None else np.array([target_row])
+    k = neighbor_k()
+    incoming = None
+    if rows is not None:
+        generation = SimilarityGenerations.active(tables.kind)
+        # 其他实体近邻列表中的该目标仍需要行对统计量，一并刷新
+        incoming = np.flatnonzero(np.isin(ids, list(tables.incoming(int(ids[target_row]), generation))))
+
+    if workers > 1 and rows is None:
+        from .parallel import parallel_blocks
+        # 每个进程同时持有一个分块，按进程数分摊内存预算
+        results = parallel_blocks(ratings, min_common, max(1, block_size // workers), k, workers)
+    else:
+        results = (
+            block.bounded(k, min_common, upper_only=rows is None, extra_cols=incoming)
+            for block in similarity_blocks(ratings, min_common, rows, block_size)
+        )
+
+    writer = tables.pair_writer(batch_size)
+    evaluated = neighbor_rows = 0
+    buffered = set()
+    kept_partners = []
+    for block, (owners, ranks, cols, similarity, common), block_evaluated in results:
+        evaluated += block_evaluated
+        for stats in block.pairs(upper_only=False):
+            stats = _ordered_by_id(stats, ids)
+            if (stats.a, stats.b) in buffered:
+                continue
+            buffered.add((stats.a, stats.b))
+            if writer.add(tables.pair(stats, generation)):
+                buffered.clear()
+        if rows is not None:
+            kept_partners = ids[block.cols].tolist()
+
+        neighbors = [
+            tables.neighbor(owner, rank, neighbor, sim, n, generation)
+            for owner, rank, neighbor, sim, n in zip(
+                ids[owners].tolist(), ranks.tolist(), ids[cols].tolist(),
+                similarity.tolist(), common.astype(int).tolist()
+            )
+        ]
+        neighbor_rows += tables.replace_neighbors(ids[block.targets].tolist(), neighbors, generation)
+
+    written = writer.close()
+    replayed = None
+    if rows is None:
+        started = SimilarityGenerations.activate(tables.kind, generation)
+        SimilarityGenerations.collect(tables, generation)
+        if started is not None and getattr(settings, 'RECOMMENDER_INCREMENTAL_SIMILARITY', True):
+            # 重建期间的增量更新写在旧代数上，已随旧代数清理
+            from .incremental import IncrementalSimilarity
+            replayed = IncrementalSimilarity.replay(tables.kind, started, min_common)
+    else:
+        tables.prune_pairs(int(ids[rows[0]]), kept_partners, generation)
+
+    if run is not None:
+        n = len(ids)
+        # 候选实体对：全量重建为所有无序对，单目标重建为目标与其他所有实体
+        candidates = n * (n - 1) // 2 if rows is None else n - 1
+        run.rows_written = written
+        run.pairs_evaluated = evaluated
+        run.pairs_pruned = candidates - evaluated
+        run.details = {
+            'entities': n, 'nnz': int(ratings.nnz), 'generation': generation, 'neighbor_rows': neighbor_rows,
+            'block_size': block_size, 'workers': workers, 'min_common': min_common, 'neighbor_k': k,
+        }
+        if replayed is not None:
+            run.details['replayed'] = replayed
+    return written
+
+
+def _stats_fields(stats: PairStats) -> dict:
+    return {field: getattr(stats, field) for field in STATS_FIELDS}
+
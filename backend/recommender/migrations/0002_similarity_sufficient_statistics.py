@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommender", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="questionsimilarity",
+            name="sum_a",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="questionsimilarity",
+            name="sum_ab",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="questionsimilarity",
+            name="sum_b",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="questionsimilarity",
+            name="sum_sq_a",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="questionsimilarity",
+            name="sum_sq_b",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="usersimilarity",
+            name="sum_a",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="usersimilarity",
+            name="sum_ab",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="usersimilarity",
+            name="sum_b",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="usersimilarity",
+            name="sum_sq_a",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name="usersimilarity",
+            name="sum_sq_b",
+            field=models.FloatField(default=0.0),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("questions", "0003_alter_question_category_alter_question_creator"),
+        ("recommender", "0002_similarity_sufficient_statistics"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuestionNeighbor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("similarity_score", models.FloatField(default=0.0)),
+                ("common_users", models.IntegerField(default=0)),
+                ("last_updated", models.DateTimeField(auto_now=True)),
+                (
+                    "neighbor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="neighbor_of",
+                        to="questions.question",
+                    ),
+                ),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="neighbors",
+                        to="questions.question",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["question", "rank"],
+                "unique_together": {("question", "rank")},
+            },
+        ),
+        migrations.CreateModel(
+            name="UserNeighbor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("similarity_score", models.FloatField(default=0.0)),
+                ("common_questions", models.IntegerField(default=0)),
+                ("last_updated", models.DateTimeField(auto_now=True)),
+                (
+                    "neighbor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="neighbor_of",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="neighbors",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["user", "rank"],
+                "unique_together": {("user", "rank")},
+            },
+        ),
+    ]
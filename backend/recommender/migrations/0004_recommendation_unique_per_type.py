@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:20
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def remove_duplicate_recommendations(apps, schema_editor):
+    """
+    每个 (user, question, recommendation_type) 只保留最新的一条推荐记录
+    """
+    Recommendation = apps.get_model('recommender', 'Recommendation')
+    duplicates = (
+        Recommendation.objects.values('user_id', 'question_id', 'recommendation_type')
+        .annotate(latest_id=Max('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        Recommendation.objects.filter(
+            user_id=row['user_id'],
+            question_id=row['question_id'],
+            recommendation_type=row['recommendation_type'],
+        ).exclude(id=row['latest_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("questions", "0003_alter_question_category_alter_question_creator"),
+        ("recommender", "0003_userneighbor_questionneighbor"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_recommendations, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="recommendation",
+            unique_together={("user", "question", "recommendation_type")},
+        ),
+    ]
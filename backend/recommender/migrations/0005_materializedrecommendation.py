@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:10
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommender", "0004_recommendation_unique_per_type"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MaterializedRecommendation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "recommendation_type",
+                    models.CharField(
+                        choices=[
+                            ("user_based", "基于用户的协同过滤"),
+                            ("item_based", "基于物品的协同过滤"),
+                            ("hybrid", "混合推荐"),
+                            ("content_based", "基于内容的推荐"),
+                        ],
+                        default="hybrid",
+                        max_length=20,
+                    ),
+                ),
+                ("n", models.PositiveIntegerField(default=10)),
+                ("min_similarity", models.FloatField(default=0.1)),
+                (
+                    "items",
+                    models.JSONField(
+                        default=list,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                    ),
+                ),
+                ("generated_at", models.DateTimeField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="materialized_recommendations",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user", "recommendation_type")},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+RECOMMENDATION_TYPES = [
+    ("user_based", "基于用户的协同过滤"),
+    ("item_based", "基于物品的协同过滤"),
+    ("hybrid", "混合推荐"),
+    ("content_based", "基于内容的推荐"),
+    ("mf", "矩阵分解推荐"),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommender", "0005_materializedrecommendation"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recommendation",
+            name="recommendation_type",
+            field=models.CharField(
+                choices=RECOMMENDATION_TYPES,
+                default="hybrid",
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="materializedrecommendation",
+            name="recommendation_type",
+            field=models.CharField(
+                choices=RECOMMENDATION_TYPES,
+                default="hybrid",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommender", "0008_skillrating_questionrating"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarityGeneration",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("user", "用户相似度"), ("question", "题目相似度")],
+                        max_length=20,
+                        unique=True,
+                    ),
+                ),
+                ("active", models.IntegerField(default=0)),
+                ("activated_at", models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="usersimilarity",
+            name="generation",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="questionsimilarity",
+            name="generation",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="userneighbor",
+            name="generation",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="questionneighbor",
+            name="generation",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name="usersimilarity",
+            unique_together={("user_a", "user_b", "generation")},
+        ),
+        migrations.AlterUniqueTogether(
+            name="questionsimilarity",
+            unique_together={("question_a", "question_b", "generation")},
+        ),
+        migrations.AlterUniqueTogether(
+            name="userneighbor",
+            unique_together={("user", "generation", "rank")},
+        ),
+        migrations.AlterUniqueTogether(
+            name="questionneighbor",
+            unique_together={("question", "generation", "rank")},
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:20
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommender", "0009_similarity_generation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BuildRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=40)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("ok", "成功"), ("failed", "失败")],
+                        default="ok",
+                        max_length=10,
+                    ),
+                ),
+                ("started_at", models.DateTimeField()),
+                ("duration_ms", models.FloatField(default=0.0)),
+                ("rows_written", models.BigIntegerField(null=True)),
+                ("pairs_evaluated", models.BigIntegerField(null=True)),
+                ("pairs_pruned", models.BigIntegerField(null=True)),
+                ("peak_memory_mb", models.FloatField(null=True)),
+                ("watermark", models.DateTimeField(null=True)),
+                (
+                    "details",
+                    models.JSONField(
+                        default=dict,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+            ],
+            options={
+                "ordering": ["-started_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "-started_at"],
+                        name="recommender_kind_d80310_idx",
+                    )
+                ],
+            },
+        ),
+    ]
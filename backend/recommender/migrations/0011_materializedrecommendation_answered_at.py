@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommender", "0010_buildrecord"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="materializedrecommendation",
+            name="answered_at",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
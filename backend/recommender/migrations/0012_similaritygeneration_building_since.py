@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-20 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommender", "0011_materializedrecommendation_answered_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="similaritygeneration",
+            name="building_since",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -1,21 +1,63 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import Coalesce
 from users.models import User
-from questions.models import Question
+from questions.models import Category, Question
+
+
+class GenerationQuerySet(models.QuerySet):
+    """
+    相似度表与近邻表的查询集：active() 只返回当前生效代数的行
+    """
+
+    def active(self):
+        # 代数指针以子查询内联在同一条 SQL 中，读取不增加往返；还没有指针时为第 0 代
+        pointer = SimilarityGeneration.objects.filter(kind=self.model.GENERATION_KIND).values('active')[:1]
+        return self.filter(generation=Coalesce(models.Subquery(pointer), 0))
+
+
+class SimilarityGeneration(models.Model):
+    """
+    相似度矩阵代数指针 - 全量重建写入新的代数，完成后原子切换 active，再分块清理旧代数
+    """
+    KINDS = [
+        ('user', '用户相似度'),
+        ('question', '题目相似度'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KINDS, unique=True)
+    active = models.IntegerField(default=0)  # 当前生效的代数
+    activated_at = models.DateTimeField(null=True)  # 最近一次切换时间
+    building_since = models.DateTimeField(null=True)  # 正在进行的全量重建的租约开始时间
+
+    def __str__(self):
+        return f"{self.kind}: generation {self.active}"
 
 
 class UserSimilarity(models.Model):
     """
     用户相似度模型 - 用于基于用户的协同过滤
-    存储用户之间的相似度分数
+    存储用户之间的相似度分数；只保存出现在任一方 Top-K 近邻中的用户对（最多约 用户数×K 行）
     """
+    GENERATION_KIND = 'user'
+
     user_a = models.ForeignKey(User, on_delete=models.CASCADE, related_name='similarity_as_a')
     user_b = models.ForeignKey(User, on_delete=models.CASCADE, related_name='similarity_as_b')
     similarity_score = models.FloatField(default=0.0)  # 相似度分数，范围 0-1
     common_questions = models.IntegerField(default=0)  # 共同答题数量
+    # 充分统计量（只在共同答题上累加），用于增量维护相似度
+    sum_a = models.FloatField(default=0.0)  # user_a 评分和
+    sum_b = models.FloatField(default=0.0)  # user_b 评分和
+    sum_ab = models.FloatField(default=0.0)  # 评分乘积和
+    sum_sq_a = models.FloatField(default=0.0)  # user_a 评分平方和
+    sum_sq_b = models.FloatField(default=0.0)  # user_b 评分平方和
+    generation = models.IntegerField(default=0)  # 矩阵代数，见 SimilarityGeneration
     last_updated = models.DateTimeField(auto_now=True)
 
+    objects = GenerationQuerySet.as_manager()
+
     class Meta:
-        unique_together = ['user_a', 'user_b']
+        unique_together = ['user_a', 'user_b', 'generation']
         indexes = [
             models.Index(fields=['user_a']),
             models.Index(fields=['user_b']),
@@ -29,16 +71,27 @@ class UserSimilarity(models.Model):
 class QuestionSimilarity(models.Model):
     """
     题目相似度模型 - 用于基于物品的协同过滤
-    存储题目之间的相似度分数
+    存储题目之间的相似度分数；只保存出现在任一方 Top-K 近邻中的题目对（最多约 题目数×K 行）
     """
+    GENERATION_KIND = 'question'
+
     question_a = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='similarity_as_a')
     question_b = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='similarity_as_b')
     similarity_score = models.FloatField(default=0.0)  # 相似度分数，范围 0-1
     common_users = models.IntegerField(default=0)  # 共同答题用户数量
+    # 充分统计量（只在共同答题用户上累加），用于增量维护相似度
+    sum_a = models.FloatField(default=0.0)  # question_a 评分和
+    sum_b = models.FloatField(default=0.0)  # question_b 评分和
+    sum_ab = models.FloatField(default=0.0)  # 评分乘积和
+    sum_sq_a = models.FloatField(default=0.0)  # question_a 评分平方和
+    sum_sq_b = models.FloatField(default=0.0)  # question_b 评分平方和
+    generation = models.IntegerField(default=0)  # 矩阵代数，见 SimilarityGeneration
     last_updated = models.DateTimeField(auto_now=True)
 
+    objects = GenerationQuerySet.as_manager()
+
     class Meta:
-        unique_together = ['question_a', 'question_b']
+        unique_together = ['question_a', 'question_b', 'generation']
         indexes = [
             models.Index(fields=['question_a']),
             models.Index(fields=['question_b']),
@@ -49,6 +102,55 @@ class QuestionSimilarity(models.Model):
         return f"Q{self.question_a.id} - Q{self.question_b.id}: {self.similarity_score:.2f}"
 
 
+class UserNeighbor(models.Model):
+    """
+    用户近邻模型 - 每个用户只保存相似度最高的 K 个邻居（单向）
+    推荐时按 (user, generation, rank) 索引做一次范围扫描即可取出近邻
+    """
+    GENERATION_KIND = 'user'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='neighbor_of')
+    rank = models.PositiveSmallIntegerField()  # 名次，0 为最相似
+    similarity_score = models.FloatField(default=0.0)  # 相似度分数，范围 0-1
+    common_questions = models.IntegerField(default=0)  # 共同答题数量
+    generation = models.IntegerField(default=0)  # 矩阵代数，见 SimilarityGeneration
+    last_updated = models.DateTimeField(auto_now=True)
+
+    objects = GenerationQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['user', 'rank']
+        unique_together = ['user', 'generation', 'rank']  # 同时作为 (user, generation, rank) 索引
+
+    def __str__(self):
+        return f"{self.user.username} #{self.rank} {self.neighbor.username}: {self.similarity_score:.2f}"
+
+
+class QuestionNeighbor(models.Model):
+    """
+    题目近邻模型 - 每道题目只保存相似度最高的 K 个相似题目（单向）
+    """
+    GENERATION_KIND = 'question'
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='neighbor_of')
+    rank = models.PositiveSmallIntegerField()  # 名次，0 为最相似
+    similarity_score = models.FloatField(default=0.0)  # 相似度分数，范围 0-1
+    common_users = models.IntegerField(default=0)  # 共同答题用户数量
+    generation = models.IntegerField(default=0)  # 矩阵代数，见 SimilarityGeneration
+    last_updated = models.DateTimeField(auto_now=True)
+
+    objects = GenerationQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['question', 'rank']
+        unique_together = ['question', 'generation', 'rank']  # 同时作为 (question, generation, rank) 索引
+
+    def __str__(self):
+        return f"Q{self.question_id} #{self.rank} Q{self.neighbor_id}: {self.similarity_score:.2f}"
+
+
 class Recommendation(models.Model):
     """
     推荐记录模型 - 记录给用户的推荐结果
@@ -58,6 +160,8 @@ class Recommendation(models.Model):
         ('item_based', '基于物品的协同过滤'),
         ('hybrid', '混合推荐'),
         ('content_based', '基于内容的推荐'),
+        ('mf', '矩阵分解推荐'),
+        ('graph', '图随机游走推荐'),
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
@@ -71,6 +175,7 @@ class Recommendation(models.Model):
 
     class Meta:
         ordering = ['-score', '-created_at']
+        unique_together = ['user', 'question', 'recommendation_type']
         indexes = [
             models.Index(fields=['user']),
             models.Index(fields=['question']),
@@ -82,6 +187,26 @@ class Recommendation(models.Model):
         return f"{self.user.username} - Q{self.question.id}: {self.score:.2f}"
 
 
+class MaterializedRecommendation(models.Model):
+    """
+    离线物化的推荐列表 - 由 materialize_recommendations 命令批量生成
+    每个用户每种推荐类型一行，整份列表存为 JSON，在线读取只需一次查询
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='materialized_recommendations')
+    recommendation_type = models.CharField(max_length=20, choices=Recommendation.RECOMMENDATION_TYPES, default='hybrid')
+    n = models.PositiveIntegerField(default=10)  # 生成时请求的推荐数量
+    min_similarity = models.FloatField(default=0.1)  # 生成时使用的最小相似度
+    items = models.JSONField(default=list, encoder=DjangoJSONEncoder)  # 序列化后的推荐记录列表
+    generated_at = models.DateTimeField()  # 生成时间（新鲜度）
+    answered_at = models.DateTimeField(null=True)  # 生成前该用户最新一条已提交答题记录的更新时间，不一致时不再使用
+
+    class Meta:
+        unique_together = ['user', 'recommendation_type']
+
+    def __str__(self):
+        return f"{self.user.username} - {self.recommendation_type}: {len(self.items)} items @ {self.generated_at}"
+
+
 class UserPreference(models.Model):
     """
     用户偏好模型 - 基于用户答题历史计算的用户偏好
@@ -98,3 +223,85 @@ class UserPreference(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - Avg Score: {self.avg_score:.2f}"
+
+
+class SkillRating(models.Model):
+    """
+    用户能力评分（Elo）- 每次评分后在线更新
+    category 为空的一行是全局评分，其余每个分类一行
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='skill_ratings')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, related_name='skill_ratings')
+    rating = models.FloatField(default=1500.0)  # 能力评分
+    answered = models.IntegerField(default=0)  # 参与评分的答题数（决定 K 因子）
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'category'],
+                name='unique_category_skill_rating'
+            ),
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(category__isnull=True),
+                name='unique_global_skill_rating'
+            ),
+        ]
+
+    def __str__(self):
+        scope = self.category_id if self.category_id else 'global'
+        return f"{self.user.username} - {scope}: {self.rating:.0f}"
+
+
+class QuestionRating(models.Model):
+    """
+    题目经验难度评分（Elo）- 与能力评分在同一量表上，每次评分后在线更新
+    bucket 为 rating 按固定宽度分桶的桶号，选题时按桶走索引
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='rating')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='question_ratings')  # 冗余题目分类，用于按分类选题
+    rating = models.FloatField(default=1500.0)  # 难度评分
+    answered = models.IntegerField(default=0)  # 参与评分的答题数（决定 K 因子）
+    bucket = models.IntegerField(default=0)  # 评分桶号
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bucket', 'rating']),
+            models.Index(fields=['category', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"Q{self.question_id}: {self.rating:.0f} (bucket {self.bucket})"
+
+
+class BuildRecord(models.Model):
+    """
+    构建记录 - 每次相似度矩阵或离线模型构建一行，用于判断构建是否过慢、数据是否过期
+    """
+    STATUS_CHOICES = [
+        ('ok', '成功'),
+        ('failed', '失败'),
+    ]
+
+    kind = models.CharField(max_length=40)  # 构建类型，例如 user_similarity、mf
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ok')
+    started_at = models.DateTimeField()
+    duration_ms = models.FloatField(default=0.0)  # 耗时（毫秒）
+    rows_written = models.BigIntegerField(null=True)  # 写入的行数 / 条目数
+    pairs_evaluated = models.BigIntegerField(null=True)  # 共同评分数达到 min_common、计算了相似度的实体对数
+    pairs_pruned = models.BigIntegerField(null=True)  # 共同评分数不足 min_common（含没有共同评分）而跳过的实体对数
+    peak_memory_mb = models.FloatField(null=True)  # 构建结束时进程的峰值常驻内存（MB）
+    watermark = models.DateTimeField(null=True)  # 构建读取数据前最新一条答题记录的时间
+    details = models.JSONField(default=dict, encoder=DjangoJSONEncoder)  # 其他参数与统计
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['kind', '-started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} @ {self.started_at}: {self.status} ({self.duration_ms:.0f}ms)"
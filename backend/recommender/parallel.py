@@ -0,0 +1,101 @@
+"""
+多进程分片计算相似度
+
+评分矩阵的 CSR 数组先保存到临时目录，各工作进程用 np.load(mmap_mode='r') 映射同一份文件，
+不通过管道传递整个矩阵；行空间按分块切分成任务，工作进程只做数值计算，
+返回每个分块的 Top-K 近邻及其行对统计量，数据库写入仍在主进程中完成。
+"""
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, Tuple
+from django.db import connections
+from .matrix import SimilarityBlock, SimilarityOperands
+import numpy as np
+from scipy import sparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+CSR_ARRAYS = ['data', 'indices', 'indptr']
+
+# 每个进程最多同时排队的任务数，避免结果堆积在主进程内存中
+TASKS_PER_WORKER = 2
+
+# 工作进程内的派生矩阵，由 _init_worker 构建一次
+_operands = None
+
+
+def _init_worker(directory: str, shape: Tuple[int, int]):
+    global _operands
+    data, indices, indptr = (
+        np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in CSR_ARRAYS
+    )
+    ratings = sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+    _operands = SimilarityOperands(ratings)
+
+
+def _compute(rows: np.ndarray, min_common: int, k: int):
+    # 只返回 Top-K 近邻涉及的行对，传回主进程的数据量与 K 成正比
+    return _operands.block(rows, min_common).bounded(k, min_common, upper_only=True)
+
+
+def _context():
+    # fork 下子进程直接继承已加载的 Django 与 NumPy；不支持 fork 的平台使用默认方式
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def parallel_blocks(
+    ratings: sparse.csr_matrix,
+    min_common: int,
+    block_size: int,
+    k: int,
+    workers: int
+) -> Iterator[Tuple[SimilarityBlock, tuple, int]]:
+    """
+    在进程池中按分块计算所有行的相似度
+
+    Args:
+        ratings: CSR 评分矩阵，每一行是一个待比较的实体
+        min_common: 最小共同评分数
+        block_size: 每个任务的行数
+        k: 每行保留的近邻数
+        workers: 进程数
+
+    Yields:
+        (block, top_k, evaluated): 同 SimilarityBlock.bounded()，按完成顺序输出
+    """
+    n_rows = ratings.shape[0]
+    tasks = (np.arange(start, min(start + block_size, n_rows)) for start in range(0, n_rows, block_size))
+
+    with tempfile.TemporaryDirectory(prefix='similarity-') as directory:
+        for name in CSR_ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(ratings, name))
+
+        # 子进程不能复用父进程的数据库连接（事务中的连接保持不动，子进程也不会使用它）
+        for connection in connections.all():
+            if not connection.in_atomic_block:
+                connection.close()
+
+        logger.info(f"Computing similarities for {n_rows} rows with {workers} workers (block size {block_size})")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=_context(),
+            initializer=_init_worker,
+            initargs=(directory, ratings.shape)
+        ) as pool:
+            pending = set()
+            for rows in tasks:
+                pending.add(pool.submit(_compute, rows, min_common, k))
+                if len(pending) >= workers * TASKS_PER_WORKER:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
@@ -0,0 +1,344 @@
+"""
+推荐流水线：候选生成器并发执行，再合并重排
+
+混合推荐原来依次调用基于用户和基于物品的推荐，总耗时是两者之和。这里把每种召回封装为候选生成器，
+在线程池中并发执行（数据库查询与 numpy 运算期间释放 GIL），每个生成器有自己的时间预算：
+超过预算的生成器被丢弃（结果不参与合并，线程继续跑完后自行结束），不会拖慢整个请求。
+超时的调用按 (生成器, 用户) 记录：仍在运行期间，同一用户的后续请求跳过该生成器，其他用户不受影响；
+每个生成器同时最多保留线程池一半（至少一个）的超时调用，达到上限后所有用户都跳过该生成器，
+因此一个持续变慢的生成器不会逐步占满整个线程池。
+
+- 生成器：默认与原混合推荐相同，只有 user_based 与 item_based（各 0.5）；
+  popularity 与 content_based（需已发布题目嵌入矩阵）通过 RECOMMENDER_PIPELINE_GENERATORS 启用；
+- 合并策略：weighted_sum（按权重累加分数）或 reciprocal_rank（按名次倒数累加，各生成器分数量纲不同时更稳健），
+  由 RECOMMENDER_PIPELINE_MERGE 选择，也可以直接传入合并函数；
+- 每个阶段的耗时、状态与候选数记录在 PipelineResult.stages 中，随推荐结果一起返回。
+
+调用方处于未提交的事务中时（例如测试用例），其他线程的数据库连接看不到这些写入，此时在当前线程内依次执行，
+预算仍然生效：开始前已超时的生成器跳过，完成时超时的结果丢弃。
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from django.conf import settings
+from django.db import close_old_connections, connection
+from questions.models import Question
+from users.models import User
+from .algorithms import CollaborativeFiltering
+from .answered import AnsweredSet
+from .content import QuestionEmbeddings
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PIPELINE_WORKERS = 4
+DEFAULT_BUDGET_MS = 2000
+DEFAULT_MERGE = 'weighted_sum'
+DEFAULT_GENERATORS = ('user_based', 'item_based')
+
+# 名次倒数合并的平滑常数
+RRF_K = 60
+
+OK = 'ok'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+SKIPPED = 'skipped'
+
+Candidates = List[Tuple[Question, float, str]]
+
+
+class CandidateGenerator(NamedTuple):
+    """
+    候选生成器
+    """
+    name: str
+    # (user, n, min_similarity) -> [(question, score, reason), ...]
+    generate: Callable[[User, int, float], Candidates]
+    weight: float
+    # 推荐理由的前缀
+    label: str
+    # 是否可用（例如依赖的离线模型已发布），不可用时跳过
+    available: Callable[[], bool] = lambda: True
+    # 时间预算（毫秒），None 表示使用 RECOMMENDER_PIPELINE_BUDGET_MS
+    budget_ms: Optional[int] = None
+
+
+GENERATORS: Dict[str, CandidateGenerator] = {
+    'user_based': CandidateGenerator(
+        'user_based',
+        lambda user, n, min_similarity: CollaborativeFiltering.user_based_recommend(user, n, min_similarity),
+        0.5,
+        '用户推荐'
+    ),
+    'item_based': CandidateGenerator(
+        'item_based',
+        lambda user, n, min_similarity: CollaborativeFiltering.item_based_recommend(user, n, min_similarity),
+        0.5,
+        '物品推荐'
+    ),
+    'popularity': CandidateGenerator(
+        'popularity',
+        lambda user, n, min_similarity: CollaborativeFiltering._popular_questions_recommend(
+            user, n, AnsweredSet.for_user(user.id)
+        ),
+        0.1,
+        '热门推荐'
+    ),
+    'content_based': CandidateGenerator(
+        'content_based',
+        lambda user, n, min_similarity: CollaborativeFiltering.content_based_recommend(user, n),
+        0.3,
+        '内容推荐',
+        available=lambda: QuestionEmbeddings.current() is not None
+    ),
+}
+
+
+def _merge(
+    candidates: List[Tuple[CandidateGenerator, Candidates]],
+    n: int,
+    contribution: Callable[[CandidateGenerator, int, float], float]
+) -> Candidates:
+    """
+    累加每个生成器对候选的贡献（contribution(生成器, 名次, 分数)），分数降序、ID 升序取前 n 个
+    """
+    questions = {}
+    combined = {}
+    reasons = {}
+    for generator, results in candidates:
+        for rank, (question, score, reason) in enumerate(results, start=1):
+            questions[question.id] = question
+            combined[question.id] = combined.get(question.id, 0.0) + contribution(generator, rank, score)
+            reasons.setdefault(question.id, []).append(f"{generator.label}: {reason}")
+
+    top = sorted(combined.items(), key=lambda item: (-item[1], item[0]))[:n]
+    return [(questions[question_id], score, "; ".join(reasons[question_id])) for question_id, score in top]
+
+
+def weighted_sum_merge(candidates: List[Tuple[CandidateGenerator, Candidates]], n: int) -> Candidates:
+    """
+    按生成器权重累加分数：Σ 权重 * 分数
+    """
+    return _merge(candidates, n, lambda generator, rank, score: score * generator.weight)
+
+
+def reciprocal_rank_merge(candidates: List[Tuple[CandidateGenerator, Candidates]], n: int) -> Candidates:
+    """
+    按名次倒数累加：Σ 权重 / (RRF_K + 名次)，不受各生成器分数量纲的影响
+    """
+    return _merge(candidates, n, lambda generator, rank, score: generator.weight / (RRF_K + rank))
+
+
+MERGERS = {
+    'weighted_sum': weighted_sum_merge,
+    'reciprocal_rank': reciprocal_rank_merge,
+}
+
+
+class PipelineResult(NamedTuple):
+    """
+    流水线结果
+    """
+    recommendations: Candidates
+    # 生成器名 -> {'status', 'ms', 'candidates'}
+    stages: Dict[str, dict]
+    merge_ms: float
+    total_ms: float
+
+    def metadata(self) -> dict:
+        return {'stages': self.stages, 'merge_ms': self.merge_ms, 'total_ms': self.total_ms}
+
+
+def _timed(generate: Callable[[User, int, float], Candidates], user: User, n: int, min_similarity: float) -> tuple:
+    started = time.perf_counter()
+    return generate(user, n, min_similarity), (time.perf_counter() - started) * 1000
+
+
+def _timed_in_thread(generate: Callable[[User, int, float], Candidates], user: User, n: int, min_similarity: float) -> tuple:
+    try:
+        return _timed(generate, user, n, min_similarity)
+    finally:
+        # 工作线程不经过请求结束信号，按 CONN_MAX_AGE 主动回收连接
+        close_old_connections()
+
+
+class RecommendationPipeline:
+    """
+    推荐流水线（每个进程一个线程池，首次使用时创建）
+    """
+    _executor: Optional[ThreadPoolExecutor] = None
+    _lock = threading.Lock()
+    # 超过预算后仍在线程池中运行的调用：生成器名 -> {用户 ID -> future}，运行结束时移除
+    _stale: Dict[str, Dict[int, Future]] = {}
+
+    @staticmethod
+    def workers() -> int:
+        return getattr(settings, 'RECOMMENDER_PIPELINE_WORKERS', DEFAULT_PIPELINE_WORKERS)
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.workers(),
+                    thread_name_prefix='recommendation-pipeline'
+                )
+            return cls._executor
+
+    @staticmethod
+    def stale_limit() -> int:
+        """
+        每个生成器同时保留的超时调用上限：线程池的一半，至少一个
+        """
+        return max(1, RecommendationPipeline.workers() // 2)
+
+    @classmethod
+    def _mark_stale(cls, name: str, user_id: int, future: Future):
+        def release(done: Future):
+            with cls._lock:
+                calls = cls._stale.get(name, {})
+                if calls.get(user_id) is done:
+                    del calls[user_id]
+                if not calls:
+                    cls._stale.pop(name, None)
+
+        with cls._lock:
+            cls._stale.setdefault(name, {})[user_id] = future
+        future.add_done_callback(release)
+
+    @classmethod
+    def _is_stale(cls, name: str, user_id: int) -> bool:
+        """
+        该用户上一次超时的调用还在运行，或该生成器的超时调用已达到上限
+        """
+        with cls._lock:
+            calls = cls._stale.get(name, {})
+            return user_id in calls or len(calls) >= cls.stale_limit()
+
+    @staticmethod
+    def generators(weights: Optional[Dict[str, float]] = None) -> List[CandidateGenerator]:
+        """
+        RECOMMENDER_PIPELINE_GENERATORS 中配置的生成器
+
+        Args:
+            weights: 覆盖部分生成器的权重
+        """
+        names = getattr(settings, 'RECOMMENDER_PIPELINE_GENERATORS', DEFAULT_GENERATORS)
+        weights = weights or {}
+        return [
+            GENERATORS[name]._replace(weight=weights.get(name, GENERATORS[name].weight))
+            for name in names
+        ]
+
+    @staticmethod
+    def run(
+        user: User,
+        n: int = 10,
+        min_similarity: float = 0.1,
+        generators: Optional[List[CandidateGenerator]] = None,
+        merge: Optional[Callable[[List[Tuple[CandidateGenerator, Candidates]], int], Candidates]] = None,
+        budget_ms: Optional[int] = None
+    ) -> PipelineResult:
+        """
+        并发执行候选生成器并合并
+
+        Args:
+            user: 目标用户
+            n: 推荐数量（每个生成器召回 2n 个候选）
+            min_similarity: 最小相似度阈值（用于 user_based 与 item_based）
+            generators: 候选生成器，默认取 RECOMMENDER_PIPELINE_GENERATORS
+            merge: 合并函数，默认取 RECOMMENDER_PIPELINE_MERGE
+            budget_ms: 生成器的默认时间预算，默认取 RECOMMENDER_PIPELINE_BUDGET_MS
+
+        Returns:
+            PipelineResult: 推荐结果与各阶段耗时
+        """
+        started = time.perf_counter()
+        if generators is None:
+            generators = RecommendationPipeline.generators()
+        if merge is None:
+            merge = MERGERS[getattr(settings, 'RECOMMENDER_PIPELINE_MERGE', DEFAULT_MERGE)]
+        if budget_ms is None:
+            budget_ms = getattr(settings, 'RECOMMENDER_PIPELINE_BUDGET_MS', DEFAULT_BUDGET_MS)
+
+        stages = {}
+        active = []
+        for generator in generators:
+            if generator.available():
+                active.append(generator)
+            else:
+                stages[generator.name] = {'status': SKIPPED, 'ms': 0.0, 'candidates': 0}
+
+        def elapsed_ms() -> float:
+            return (time.perf_counter() - started) * 1000
+
+        def budget(generator: CandidateGenerator) -> float:
+            return generator.budget_ms if generator.budget_ms is not None else budget_ms
+
+        candidates = []
+        if RecommendationPipeline.workers() <= 0 or connection.in_atomic_block:
+            runs = RecommendationPipeline._run_inline(active, user, n, min_similarity, elapsed_ms, budget)
+        else:
+            runs = RecommendationPipeline._run_concurrent(active, user, n, min_similarity, elapsed_ms, budget)
+        for generator, status, results, ms in runs:
+            stages[generator.name] = {'status': status, 'ms': ms, 'candidates': len(results)}
+            if status == OK:
+                candidates.append((generator, results))
+            elif status == TIMEOUT:
+                logger.warning(f"Candidate generator {generator.name} missed its {budget(generator)}ms budget for user {user.id}")
+
+        merge_started = time.perf_counter()
+        recommendations = merge(candidates, n)
+        merge_ms = (time.perf_counter() - merge_started) * 1000
+
+        return PipelineResult(recommendations, stages, merge_ms, elapsed_ms())
+
+    @staticmethod
+    def _run_concurrent(active, user, n, min_similarity, elapsed_ms, budget):
+        executor = RecommendationPipeline.executor()
+        futures = []
+        skipped = []
+        for generator in active:
+            if RecommendationPipeline._is_stale(generator.name, user.id):
+                # 上一次超时的调用还占着线程，不再提交
+                skipped.append(generator)
+            else:
+                futures.append((
+                    generator,
+                    executor.submit(_timed_in_thread, generator.generate, user, n * 2, min_similarity)
+                ))
+        for generator in skipped:
+            logger.warning(f"Candidate generator {generator.name} skipped: a timed-out call is still running")
+            yield generator, SKIPPED, [], 0.0
+
+        # 按预算从短到长等待，每个生成器只等到自己的截止时间
+        for generator, future in sorted(futures, key=lambda item: budget(item[0])):
+            try:
+                results, ms = future.result(timeout=max(budget(generator) - elapsed_ms(), 0) / 1000)
+            except FutureTimeoutError:
+                if not future.cancel():
+                    RecommendationPipeline._mark_stale(generator.name, user.id, future)
+                yield generator, TIMEOUT, [], elapsed_ms()
+            except Exception as e:
+                logger.error(f"Candidate generator {generator.name} failed for user {user.id}: {e}", exc_info=True)
+                yield generator, ERROR, [], elapsed_ms()
+            else:
+                yield generator, OK, results, ms
+
+    @staticmethod
+    def _run_inline(active, user, n, min_similarity, elapsed_ms, budget):
+        for generator in active:
+            if elapsed_ms() >= budget(generator):
+                yield generator, SKIPPED, [], 0.0
+                continue
+            try:
+                results, ms = _timed(generator.generate, user, n * 2, min_similarity)
+            except Exception as e:
+                logger.error(f"Candidate generator {generator.name} failed for user {user.id}: {e}", exc_info=True)
+                yield generator, ERROR, [], elapsed_ms()
+                continue
+            if elapsed_ms() > budget(generator):
+                yield generator, TIMEOUT, [], ms
+            else:
+                yield generator, OK, results, ms
@@ -0,0 +1,269 @@
+"""
+按时间衰减的题目热度索引
+
+热度 = Σ exp(-ln2 · (now - 答题时间) / 半衰期)，每条答题记录贡献一次。
+所有题目的热度以同一参考时间保存，整体衰减不改变排序，因此刷新时只需：
+1. 把上次的热度整体衰减到当前时间；
+2. 读取上次刷新之后新增的答题记录（按 ID 水位线），逐条累加（O(新事件数)）。
+   ID 在插入时分配、按提交顺序可见，较小的 ID 可能晚于水位线才提交：每次刷新另外重读
+   创建时间在上次刷新前 RECOMMENDER_COMMIT_LAG_SECONDS 之内的记录，按 ID 跳过已计入的；
+3. 重新排序，并按分类、难度分区。
+
+索引（几个 NumPy 数组）存入 Django 缓存，各进程另保留一份本地副本，用版本号判断是否需要重新读取。
+超过 RECOMMENDER_POPULARITY_REFRESH_SECONDS 未刷新时，由第一个读取的请求刷新（也可定时执行
+refresh_popularity_index 命令）。取前 n 个热门题目只需遍历排序好的分区前缀，
+跳过已答题目的代价为 O(n + 已答题目数)，不再聚合答题记录。
+"""
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Q
+from practice.models import Interaction
+from questions.models import Question
+from .answered import exclusion_mask
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'recommender:popularity_index'
+VERSION_KEY = 'recommender:popularity_index:version'
+LOCK_KEY = 'recommender:popularity_index:lock'
+
+DEFAULT_HALF_LIFE_DAYS = 7
+DEFAULT_REFRESH_SECONDS = 300
+DEFAULT_COMMIT_LAG_SECONDS = 300
+
+# 刷新锁的超时时间（秒），防止刷新进程异常退出后锁无法释放
+LOCK_TIMEOUT = 120
+
+# 没有分类的题目使用的分区键
+NO_CATEGORY = -1
+
+
+def half_life_days() -> float:
+    return getattr(settings, 'RECOMMENDER_POPULARITY_HALF_LIFE_DAYS', DEFAULT_HALF_LIFE_DAYS)
+
+
+def refresh_seconds() -> float:
+    return getattr(settings, 'RECOMMENDER_POPULARITY_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+
+
+def commit_lag_seconds() -> float:
+    return getattr(settings, 'RECOMMENDER_COMMIT_LAG_SECONDS', DEFAULT_COMMIT_LAG_SECONDS)
+
+
+class PopularityIndex:
+    """
+    题目热度索引
+
+    Attributes:
+        question_ids: 题目 ID（升序，只含已审核且公开的题目）
+        categories: 分类 ID（没有分类为 -1）
+        difficulties: 难度
+        view_counts: 浏览次数（热度相同时的次序）
+        scores: 参考时间 reference 时的衰减热度
+        counts: 累计答题记录数（不衰减）
+        reference: 参考时间（Unix 时间戳）
+        watermark: 已计入的最大答题记录 ID
+        recent_ids: 已计入、创建时间在重读窗口内的答题记录 ID（下次刷新重读窗口时跳过）
+        recent_times: recent_ids 的创建时间（Unix 时间戳）
+        half_life: 半衰期（天）
+    """
+
+    _local: Optional['PopularityIndex'] = None
+    _lock = threading.Lock()
+
+    def __init__(self, question_ids, categories, difficulties, view_counts, scores, counts,
+                 reference: float, watermark: int, half_life: float, recent_ids=None, recent_times=None):
+        self.question_ids = question_ids
+        self.categories = categories
+        self.difficulties = difficulties
+        self.view_counts = view_counts
+        self.scores = scores
+        self.counts = counts
+        self.reference = reference
+        self.watermark = watermark
+        self.recent_ids = np.zeros(0, dtype=np.int64) if recent_ids is None else recent_ids
+        self.recent_times = np.zeros(0, dtype=np.float64) if recent_times is None else recent_times
+        self.half_life = half_life
+        self.version = f'{reference}:{watermark}'
+
+        # 热度降序，其次答题数、浏览数降序，最后题目 ID 升序
+        self.ranked = np.lexsort((question_ids, -view_counts, -counts, -scores))
+        self.partitions: Dict[Tuple[str, int], np.ndarray] = {}
+        for kind, values in (('category', categories), ('difficulty', difficulties)):
+            keys = values[self.ranked]
+            grouped = np.argsort(keys, kind='stable')
+            unique, starts = np.unique(keys[grouped], return_index=True)
+            for key, positions in zip(unique.tolist(), np.split(self.ranked[grouped], starts[1:])):
+                self.partitions[(kind, key)] = positions
+
+    def decay(self, now: float) -> float:
+        """
+        参考时间的热度衰减到 now 时的系数
+        """
+        return math.exp(-math.log(2) * (now - self.reference) / (self.half_life * 86400))
+
+    @classmethod
+    def build(cls, previous: Optional['PopularityIndex'] = None, now: Optional[float] = None) -> 'PopularityIndex':
+        """
+        在上一个索引的基础上计入新增的答题记录；没有上一个索引（或半衰期已修改、答题记录 ID 回退）时全量构建
+
+        Args:
+            previous: 上一个索引
+            now: 当前时间（Unix 时间戳），默认取系统时间
+
+        Returns:
+            PopularityIndex: 新索引
+        """
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        half_life = half_life_days()
+
+        lag = commit_lag_seconds()
+
+        max_id = Interaction.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        if previous is not None and (
+            previous.half_life != half_life or previous.watermark > max_id
+            or getattr(previous, 'recent_ids', None) is None
+        ):
+            previous = None
+
+        rows = list(
+            Question.objects.filter(is_approved=True, is_public=True).order_by('id').values_list(
+                'id', 'category_id', 'difficulty', 'view_count'
+            )
+        )
+        question_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        categories = np.array([NO_CATEGORY if row[1] is None else row[1] for row in rows], dtype=np.int64)
+        difficulties = np.array([row[2] for row in rows], dtype=np.int64)
+        view_counts = np.array([row[3] for row in rows], dtype=np.int64)
+        scores = np.zeros(len(rows), dtype=np.float64)
+        counts = np.zeros(len(rows), dtype=np.int64)
+
+        events = Interaction.objects.filter(id__lte=max_id)
+        recent_ids = np.zeros(0, dtype=np.int64)
+        recent_times = np.zeros(0, dtype=np.float64)
+        if previous is not None:
+            # 沿用上次的热度（已下架的题目丢弃，新题目从 0 开始）
+            pos = np.searchsorted(question_ids, previous.question_ids)
+            found = pos < len(question_ids)
+            found[found] = question_ids[pos[found]] == previous.question_ids[found]
+            scores[pos[found]] = previous.scores[found] * previous.decay(now)
+            counts[pos[found]] = previous.counts[found]
+            # 水位线之后的新记录，以及上次刷新时可能尚未提交的记录（重读窗口）
+            window = datetime.fromtimestamp(previous.reference - lag, tz=dt_timezone.utc)
+            events = events.filter(Q(id__gt=previous.watermark) | Q(created_at__gte=window))
+            recent_ids, recent_times = previous.recent_ids, previous.recent_times
+
+        event_ids, event_questions, event_times = [], [], []
+        for event_id, question_id, created_at in events.values_list(
+            'id', 'question_id', 'created_at'
+        ).iterator(chunk_size=10000):
+            event_ids.append(event_id)
+            event_questions.append(question_id)
+            event_times.append(created_at.timestamp())
+
+        # 重读窗口内已计入的记录跳过
+        event_ids = np.asarray(event_ids, dtype=np.int64)
+        fresh = ~np.isin(event_ids, recent_ids)
+        event_ids = event_ids[fresh]
+        event_questions = np.asarray(event_questions, dtype=np.int64)[fresh]
+        event_times = np.asarray(event_times, dtype=np.float64)[fresh]
+
+        recent_ids = np.concatenate([recent_ids, event_ids])
+        recent_times = np.concatenate([recent_times, event_times])
+        keep = recent_times >= now - lag
+        recent_ids, recent_times = recent_ids[keep], recent_times[keep]
+
+        pos = np.searchsorted(question_ids, event_questions)
+        found = pos < len(question_ids)
+        found[found] = question_ids[pos[found]] == event_questions[found]
+        ages = now - event_times[found]
+        np.add.at(scores, pos[found], np.exp(-math.log(2) * ages / (half_life * 86400)))
+        np.add.at(counts, pos[found], 1)
+
+        logger.info(
+            f"Built popularity index: {len(question_ids)} questions, {len(event_questions)} new interactions "
+            f"({'incremental' if previous is not None else 'full'}, {time.perf_counter() - started:.2f}s)"
+        )
+        return cls(
+            question_ids, categories, difficulties, view_counts, scores, counts, now, max_id, half_life,
+            recent_ids, recent_times
+        )
+
+    @classmethod
+    def refresh(cls) -> 'PopularityIndex':
+        """
+        刷新缓存中的索引并返回
+        """
+        index = cls.build(cache.get(CACHE_KEY))
+        cache.set(CACHE_KEY, index, timeout=None)
+        cache.set(VERSION_KEY, index.version, timeout=None)
+        cls._local = index
+        return index
+
+    @classmethod
+    def current(cls) -> 'PopularityIndex':
+        """
+        获取当前索引：优先使用本进程的副本，版本变化时从缓存重新读取，过期时刷新
+
+        Returns:
+            PopularityIndex: 索引
+        """
+        version = cache.get(VERSION_KEY)
+        index = cls._local
+        if index is None or index.version != version:
+            index = cache.get(CACHE_KEY) if version is not None else None
+
+        if index is None:
+            with cls._lock:
+                return cls.refresh()
+
+        if time.time() - index.reference > refresh_seconds() and cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+            # 只有拿到锁的进程刷新，其余进程继续使用旧索引
+            try:
+                index = cls.refresh()
+            finally:
+                cache.delete(LOCK_KEY)
+
+        cls._local = index
+        return index
+
+    def top(
+        self,
+        n: int = 10,
+        exclude=(),
+        category: Optional[int] = None,
+        difficulty: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        取前 n 个热门题目
+
+        Args:
+            n: 数量
+            exclude: 需要跳过的题目（AnsweredSet 或题目 ID 集合）
+            category: 只取该分类（None 表示不限）
+            difficulty: 只取该难度（None 表示不限）
+
+        Returns:
+            (question_ids, scores, counts): 按热度降序；scores 为当前时间的衰减热度
+        """
+        if category is not None:
+            positions = self.partitions.get(('category', category), self.ranked[:0])
+            if difficulty is not None:
+                positions = positions[self.difficulties[positions] == difficulty]
+        elif difficulty is not None:
+            positions = self.partitions.get(('difficulty', difficulty), self.ranked[:0])
+        else:
+            positions = self.ranked
+
+        # 前 n + len(exclude) 个中至少有 n 个未被排除
+        prefix = positions[:n + len(exclude)]
+        prefix = prefix[~exclusion_mask(self.question_ids[prefix], exclude)][:n]
+        return self.question_ids[prefix], self.scores[prefix] * self.decay(time.time()), self.counts[prefix]
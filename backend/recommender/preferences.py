@@ -0,0 +1,118 @@
+"""
+批量计算用户偏好
+
+逐个用户计算偏好需要每人若干次聚合查询和一次 update_or_create。这里对全部（或指定的）用户只做两次分组查询：
+按 (用户, 分类) 和按 (用户, 难度) 聚合平均分与答题数，在 Python 中组装每个用户的 JSON，
+再用 BulkUpserter 分块批量写入 UserPreference。总平均分与总答题数由分类分组的结果合并得到。
+"""
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+from django.db.models import Avg, Count
+from practice.models import Interaction
+from .bulk import BulkUpserter
+from .models import UserPreference
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 低于该平均分的分类记为薄弱领域，不低于 STRONG_AREA_SCORE 的记为强项领域
+WEAK_AREA_SCORE = 60
+STRONG_AREA_SCORE = 80
+
+
+class UserPreferenceBuilder:
+    """
+    用户偏好批量构建器
+    """
+
+    @staticmethod
+    def build(user_ids: Optional[Iterable[int]] = None, chunk_size: Optional[int] = None) -> int:
+        """
+        计算并保存用户偏好
+
+        Args:
+            user_ids: 目标用户 ID，默认为所有有评分答题记录的用户
+            chunk_size: 每个写入事务的行数，默认取 RECOMMENDER_BULK_CHUNK_SIZE
+
+        Returns:
+            int: 写入的用户偏好数
+        """
+        started = time.perf_counter()
+        interactions = Interaction.objects.filter(score__isnull=False, is_submitted=True)
+        if user_ids is not None:
+            interactions = interactions.filter(user_id__in=list(user_ids))
+
+        categories = UserPreferenceBuilder._grouped(interactions, 'question__category__name')
+        difficulties = UserPreferenceBuilder._grouped(interactions, 'question__difficulty')
+
+        with BulkUpserter(
+            UserPreference,
+            ['user'],
+            ['preferred_categories', 'preferred_difficulty', 'weak_areas', 'strong_areas',
+             'avg_score', 'total_answered', 'last_updated'],
+            chunk_size=chunk_size
+        ) as writer:
+            for user_id, stats in categories.items():
+                writer.add(UserPreferenceBuilder._preference(user_id, stats, difficulties.get(user_id, {})))
+
+        logger.info(f"Built {writer.rows} user preferences in {time.perf_counter() - started:.1f}s")
+        return writer.rows
+
+    @staticmethod
+    def _grouped(interactions, field: str) -> Dict[int, Dict[object, tuple]]:
+        """
+        一次分组查询：用户 ID -> {分组值: (平均分, 答题数)}
+        """
+        rows = interactions.order_by().values_list('user_id', field).annotate(
+            avg_score=Avg('score'),
+            count=Count('id')
+        )
+        grouped = defaultdict(dict)
+        for user_id, key, avg_score, count in rows.iterator(chunk_size=10000):
+            grouped[user_id][key] = (avg_score, count)
+        return grouped
+
+    @staticmethod
+    def _preference(user_id: int, categories: Dict[object, tuple], difficulties: Dict[object, tuple]) -> UserPreference:
+        """
+        由一个用户的分组统计组装 UserPreference
+        """
+        preferred_categories = {}
+        weak_areas = []
+        strong_areas = []
+        for category_name, (avg_score, count) in categories.items():
+            if not category_name:
+                continue
+            preferred_categories[category_name] = {
+                'avg_score': avg_score,
+                'count': count,
+                'weight': avg_score / 100
+            }
+            if avg_score < WEAK_AREA_SCORE:
+                weak_areas.append(category_name)
+            elif avg_score >= STRONG_AREA_SCORE:
+                strong_areas.append(category_name)
+
+        preferred_difficulty = {
+            str(difficulty): {
+                'avg_score': avg_score,
+                'count': count,
+                'weight': avg_score / 100
+            }
+            for difficulty, (avg_score, count) in difficulties.items()
+        }
+
+        # 各分类（含无分类）的答题数之和即总答题数，按答题数加权即总平均分
+        total_answered = sum(count for _, count in categories.values())
+        avg_score = sum(avg * count for avg, count in categories.values()) / total_answered
+
+        return UserPreference(
+            user_id=user_id,
+            preferred_categories=preferred_categories,
+            preferred_difficulty=preferred_difficulty,
+            weak_areas=weak_areas,
+            strong_areas=strong_areas,
+            avg_score=avg_score,
+            total_answered=total_answered
+        )
@@ -0,0 +1,379 @@
+"""
+在线能力 / 难度评分（Elo，等价于在线更新的 Rasch 单参数 IRT 模型）
+
+用户能力与题目难度放在同一条评分量表上，用户答对题目的期望得分率为
+    P = 1 / (1 + 10 ^ ((难度 - 能力) / 400))
+每次答题评分后（得分 / 100 作为实际结果 S）按 K 因子向相反方向修正双方：
+    能力 += K_用户 * (S - P)，难度 -= K_题目 * (S - P)
+K 因子随参与评分的答题数递减，新用户 / 新题目收敛快，老用户 / 老题目稳定。
+
+- 每个用户一条全局评分，每个答过的分类一条分类评分（首次出现时以全局评分为初值）；
+- 每道题一条难度评分，初值由人工标注的难度（1-4）换算，之后完全由答题结果决定；
+- 一次更新只锁定并改写题目、全局、分类三行，与答题总数无关（O(1)）；
+- 题目评分按 RECOMMENDER_RATING_BUCKET_WIDTH 分桶，选题时从目标难度所在的桶向两侧逐环查询 (bucket, rating) 索引，
+  找到的最近题目不可能被未查询的桶超过时停止，不扫描题目表。
+
+修改桶宽后需要执行 rebuild_ratings 重新分桶。
+"""
+import math
+from collections import defaultdict
+from typing import Dict, NamedTuple, Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from practice.models import Interaction
+from questions.models import Question
+from .answered import exclusion_mask
+from .bulk import BulkUpserter
+from .models import QuestionRating, SkillRating
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+INITIAL_RATING = 1500.0
+# Elo 量表：评分相差 400 分时期望得分率约为 10:1
+ELO_SCALE = 400.0
+# 人工标注难度每差一级对应的初始评分差
+DIFFICULTY_STEP = 200.0
+
+DEFAULT_MAX_K = 32.0
+DEFAULT_MIN_K = 8.0
+# 参与评分的答题数达到该值时 K 因子减半
+DEFAULT_K_HALF_LIFE = 20
+DEFAULT_BUCKET_WIDTH = 50
+DEFAULT_TARGET = 0.5
+# 选题时最多向目标难度两侧搜索的评分范围
+DEFAULT_SEARCH_RANGE = 1000.0
+
+
+def rating_settings() -> dict:
+    """
+    评分参数（RECOMMENDER_RATING_* 设置）
+    """
+    return {
+        'max_k': getattr(settings, 'RECOMMENDER_RATING_MAX_K', DEFAULT_MAX_K),
+        'min_k': getattr(settings, 'RECOMMENDER_RATING_MIN_K', DEFAULT_MIN_K),
+        'bucket_width': getattr(settings, 'RECOMMENDER_RATING_BUCKET_WIDTH', DEFAULT_BUCKET_WIDTH),
+        'target': getattr(settings, 'RECOMMENDER_RATING_TARGET', DEFAULT_TARGET),
+    }
+
+
+def expected_score(skill: float, difficulty: float) -> float:
+    """
+    能力为 skill 的用户在难度为 difficulty 的题目上的期望得分率
+    """
+    return 1.0 / (1.0 + 10.0 ** ((difficulty - skill) / ELO_SCALE))
+
+
+def target_difficulty(skill: float, target: float) -> float:
+    """
+    使期望得分率等于 target 的题目难度（expected_score 的反函数）
+    """
+    target = min(max(target, 0.01), 0.99)
+    return skill + ELO_SCALE * math.log10(1.0 / target - 1.0)
+
+
+def k_factor(answered: int, max_k: float, min_k: float) -> float:
+    """
+    K 因子：随参与评分的答题数按 max_k / (1 + answered / 半衰数) 递减，不低于 min_k
+    """
+    return max(min_k, max_k / (1.0 + answered / DEFAULT_K_HALF_LIFE))
+
+
+def prior_rating(difficulty: int) -> float:
+    """
+    由人工标注的难度（1-4）换算题目的初始评分
+    """
+    return INITIAL_RATING + (difficulty - 2.5) * DIFFICULTY_STEP
+
+
+def rating_bucket(rating: float, width: int) -> int:
+    return int(math.floor(rating / width))
+
+
+class RatingUpdate(NamedTuple):
+    """
+    一次答题评分后的更新结果
+    """
+    skill: float
+    category_skill: Optional[float]
+    difficulty: float
+    expected: float
+
+
+class AdaptivePick(NamedTuple):
+    """
+    自适应选题结果
+    """
+    question_id: int
+    difficulty: float
+    skill: float
+    target_difficulty: float
+    # 用户在该题上的期望得分率
+    expected: float
+
+
+class OnlineRatings:
+    """
+    在线评分的更新、查询与选题
+    """
+
+    @staticmethod
+    def question_defaults(category_id: Optional[int], difficulty: int, bucket_width: int) -> dict:
+        rating = prior_rating(difficulty)
+        return {'category_id': category_id, 'rating': rating, 'bucket': rating_bucket(rating, bucket_width)}
+
+    @staticmethod
+    def ensure_question(question: Question) -> QuestionRating:
+        """
+        为题目创建难度评分（已存在时同步分类；还没有人答过时按当前标注难度重置初值）
+        """
+        defaults = OnlineRatings.question_defaults(
+            question.category_id, question.difficulty, rating_settings()['bucket_width']
+        )
+        rating, created = QuestionRating.objects.get_or_create(question_id=question.id, defaults=defaults)
+        if not created:
+            changed = {'category_id': question.category_id}
+            if rating.answered == 0:
+                changed.update(rating=defaults['rating'], bucket=defaults['bucket'])
+            if any(getattr(rating, field) != value for field, value in changed.items()):
+                QuestionRating.objects.filter(pk=rating.pk).update(**changed)
+                for field, value in changed.items():
+                    setattr(rating, field, value)
+        return rating
+
+    @staticmethod
+    def _locked_question(question_id: int, bucket_width: int) -> QuestionRating:
+        rating = QuestionRating.objects.select_for_update().filter(question_id=question_id).first()
+        if rating is None:
+            category_id, difficulty = Question.all_objects.filter(pk=question_id).values_list(
+                'category_id', 'difficulty'
+            ).get()
+            QuestionRating.objects.get_or_create(
+                question_id=question_id,
+                defaults=OnlineRatings.question_defaults(category_id, difficulty, bucket_width)
+            )
+            rating = QuestionRating.objects.select_for_update().get(question_id=question_id)
+        return rating
+
+    @staticmethod
+    def _locked_skill(user_id: int, category_id: Optional[int], initial: float) -> SkillRating:
+        skill, _ = SkillRating.objects.select_for_update().get_or_create(
+            user_id=user_id,
+            category_id=category_id,
+            defaults={'rating': initial}
+        )
+        return skill
+
+    @staticmethod
+    def apply(user_id: int, question_id: int, score: float) -> RatingUpdate:
+        """
+        按一次答题评分更新用户能力（全局与题目所属分类）和题目难度
+
+        Args:
+            user_id: 用户 ID
+            question_id: 题目 ID
+            score: 得分（0-100）
+
+        Returns:
+            RatingUpdate: 更新后的评分与本次的期望得分率
+        """
+        options = rating_settings()
+        outcome = min(max(score / 100.0, 0.0), 1.0)
+
+        with transaction.atomic():
+            # 固定按 题目 -> 全局 -> 分类 的顺序加锁，避免并发更新互相等待成环
+            question = OnlineRatings._locked_question(question_id, options['bucket_width'])
+            skill = OnlineRatings._locked_skill(user_id, None, INITIAL_RATING)
+            category_skill = None
+            if question.category_id:
+                category_skill = OnlineRatings._locked_skill(user_id, question.category_id, skill.rating)
+
+            difficulty = question.rating
+            expected = expected_score(skill.rating, difficulty)
+            skill.rating += k_factor(skill.answered, options['max_k'], options['min_k']) * (outcome - expected)
+            skill.answered += 1
+            skill.save(update_fields=['rating', 'answered', 'updated_at'])
+
+            if category_skill is not None:
+                category_expected = expected_score(category_skill.rating, difficulty)
+                category_skill.rating += k_factor(
+                    category_skill.answered, options['max_k'], options['min_k']
+                ) * (outcome - category_expected)
+                category_skill.answered += 1
+                category_skill.save(update_fields=['rating', 'answered', 'updated_at'])
+
+            question.rating -= k_factor(question.answered, options['max_k'], options['min_k']) * (outcome - expected)
+            question.answered += 1
+            question.bucket = rating_bucket(question.rating, options['bucket_width'])
+            question.save(update_fields=['rating', 'answered', 'bucket', 'updated_at'])
+
+        return RatingUpdate(
+            skill.rating,
+            category_skill.rating if category_skill is not None else None,
+            question.rating,
+            expected
+        )
+
+    @staticmethod
+    def skill(user_id: int, category_id: Optional[int] = None) -> float:
+        """
+        用户能力评分（分类评分不存在时取全局评分，都不存在时为初始评分）
+        """
+        ratings = dict(
+            SkillRating.objects.filter(user_id=user_id).filter(
+                Q(category__isnull=True) | Q(category_id=category_id)
+            ).values_list('category_id', 'rating')
+        )
+        if category_id is not None and category_id in ratings:
+            return ratings[category_id]
+        return ratings.get(None, INITIAL_RATING)
+
+    @staticmethod
+    def next_question(
+        user_id: int,
+        category_id: Optional[int] = None,
+        target: Optional[float] = None,
+        exclude=(),
+        search_range: float = DEFAULT_SEARCH_RANGE
+    ) -> Optional[AdaptivePick]:
+        """
+        选出难度最接近目标难度的题目
+
+        Args:
+            user_id: 用户 ID
+            category_id: 只在该分类中选题（同时使用该分类的能力评分），None 表示全部分类
+            target: 目标期望得分率，默认取 RECOMMENDER_RATING_TARGET
+            exclude: 需要跳过的题目（AnsweredSet 或题目 ID 集合）
+            search_range: 向目标难度两侧搜索的最大评分范围
+
+        Returns:
+            AdaptivePick: 选中的题目；范围内没有可选题目时返回 None
+        """
+        options = rating_settings()
+        width = options['bucket_width']
+        skill = OnlineRatings.skill(user_id, category_id)
+        desired = target_difficulty(skill, options['target'] if target is None else target)
+        center = rating_bucket(desired, width)
+
+        queryset = QuestionRating.objects.filter(question__is_approved=True, question__is_deleted=False)
+        if category_id:
+            queryset = queryset.filter(category_id=category_id)
+
+        best = None
+        for distance in range(int(math.ceil(search_range / width)) + 1):
+            rows = list(queryset.filter(
+                bucket__in={center - distance, center + distance}
+            ).values_list('question_id', 'rating'))
+            if rows:
+                question_ids = np.array([row[0] for row in rows], dtype=np.int64)
+                ratings = np.array([row[1] for row in rows], dtype=np.float64)
+                keep = ~exclusion_mask(question_ids, exclude)
+                if keep.any():
+                    question_ids, ratings = question_ids[keep], ratings[keep]
+                    gaps = np.abs(ratings - desired)
+                    i = np.lexsort((question_ids, gaps))[0]
+                    if best is None or (gaps[i], question_ids[i]) < (best[0], best[1]):
+                        best = (float(gaps[i]), int(question_ids[i]), float(ratings[i]))
+
+            # 未查询的桶与目标难度的最近距离不小于该值，已找到的题目不会被超过
+            if best is not None and best[0] <= min(desired - (center - distance) * width,
+                                                   (center + distance + 1) * width - desired):
+                break
+
+        if best is None:
+            return None
+        _, question_id, difficulty = best
+        return AdaptivePick(question_id, difficulty, skill, desired, expected_score(skill, difficulty))
+
+    @staticmethod
+    def rebuild(seed_only: bool = False) -> dict:
+        """
+        重建评分：为所有题目按标注难度设初值，再按时间顺序重放全部已评分的答题记录
+        （重建期间的在线更新会被覆盖，应在低峰期执行）
+
+        Args:
+            seed_only: 只为还没有难度评分的题目创建初值，不重放答题记录
+
+        Returns:
+            dict: 题目数、用户评分数与重放的答题数
+        """
+        options = rating_settings()
+        width = options['bucket_width']
+        questions = {
+            question_id: OnlineRatings.question_defaults(category_id, difficulty, width)
+            for question_id, category_id, difficulty in Question.all_objects.values_list(
+                'id', 'category_id', 'difficulty'
+            )
+        }
+
+        if seed_only:
+            existing = set(QuestionRating.objects.values_list('question_id', flat=True))
+            missing = [
+                QuestionRating(question_id=question_id, **defaults)
+                for question_id, defaults in questions.items()
+                if question_id not in existing
+            ]
+            QuestionRating.objects.bulk_create(missing, ignore_conflicts=True)
+            return {'questions': len(missing), 'skills': 0, 'interactions': 0}
+
+        question_answered: Dict[int, int] = defaultdict(int)
+        # (user_id, category_id) -> [rating, answered]，category_id 为 None 表示全局
+        skills: Dict[tuple, list] = {}
+        replayed = 0
+        interactions = Interaction.objects.filter(
+            is_submitted=True,
+            score__isnull=False
+        ).order_by('created_at', 'id').values_list('user_id', 'question_id', 'score')
+
+        for user_id, question_id, score in interactions.iterator(chunk_size=10000):
+            question = questions.get(question_id)
+            if question is None:
+                continue
+            outcome = min(max(score / 100.0, 0.0), 1.0)
+            skill = skills.setdefault((user_id, None), [INITIAL_RATING, 0])
+            expected = expected_score(skill[0], question['rating'])
+
+            if question['category_id']:
+                category_skill = skills.setdefault((user_id, question['category_id']), [skill[0], 0])
+                category_skill[0] += k_factor(
+                    category_skill[1], options['max_k'], options['min_k']
+                ) * (outcome - expected_score(category_skill[0], question['rating']))
+                category_skill[1] += 1
+
+            skill[0] += k_factor(skill[1], options['max_k'], options['min_k']) * (outcome - expected)
+            skill[1] += 1
+            question['rating'] -= k_factor(
+                question_answered[question_id], options['max_k'], options['min_k']
+            ) * (outcome - expected)
+            question_answered[question_id] += 1
+            replayed += 1
+
+        with BulkUpserter(
+            QuestionRating, ['question'], ['category', 'rating', 'answered', 'bucket'], label='QuestionRating'
+        ) as writer:
+            for question_id, question in questions.items():
+                writer.add(QuestionRating(
+                    question_id=question_id,
+                    category_id=question['category_id'],
+                    rating=question['rating'],
+                    answered=question_answered[question_id],
+                    bucket=rating_bucket(question['rating'], width)
+                ))
+
+        with transaction.atomic():
+            SkillRating.objects.all().delete()
+            SkillRating.objects.bulk_create(
+                [
+                    SkillRating(user_id=user_id, category_id=category_id, rating=rating, answered=answered)
+                    for (user_id, category_id), (rating, answered) in skills.items()
+                ],
+                batch_size=1000
+            )
+
+        logger.info(
+            f"Rebuilt ratings for {len(questions)} questions and {len(skills)} user skills "
+            f"from {replayed} interactions"
+        )
+        return {'questions': len(questions), 'skills': len(skills), 'interactions': replayed}
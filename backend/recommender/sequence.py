@@ -0,0 +1,361 @@
+"""
+按练习顺序的下一题模型（一阶马尔可夫转移）
+
+用户按会话练习，答题记录的 created_at 顺序本身就是信号：做完 A 的人接下来常做 B。
+按 (用户, created_at) 流式读取答题记录（.iterator()），同一会话内相邻两题（间隔不超过
+RECOMMENDER_SEQUENCE_SESSION_GAP_MINUTES）记一次 A -> B 转移，累加成稀疏计数矩阵；
+每道题只保留计数最多的 K 个后继，存成 CSR 式的紧凑查找表（indptr / successors / probabilities），
+查询“下一题”只需一次二分查找加读取 K 个元素。
+
+答题记录在打开题目时创建、提交时更新，created_at 就是练习顺序，因此统计所有未删除的记录（不只是已提交的）。
+模型记录水位线（已处理的最大 created_at）与每个用户最后一题，增量更新时只读取水位线之后的记录，
+并把用户最后一题作为新记录的前驱，跨越水位线的转移不会丢失。
+
+created_at 在插入时确定，事务提交后才可见：水位线之前、上次构建之后才提交的记录，
+靠重读水位线之前 RECOMMENDER_COMMIT_LAG_SECONDS 的窗口补上，窗口内已处理的记录按 ID 跳过（recent_ids）。
+这类迟到记录如果早于该用户已计入的最后一题，已经计入的转移顺序无法改写，
+只计入水位线与 late_interactions，不产生转移（否则会与实际练习顺序相反）。
+"""
+import json
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from typing import Optional, Tuple
+from django.conf import settings
+from practice.models import Interaction
+from .answered import exclusion_mask
+from .artifact import ArtifactStore, artifact_dir, publish
+import numpy as np
+from scipy import sparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_NAME = 'transitions'
+
+# 每道题保留的后继数
+DEFAULT_TOP_K = 20
+
+# 同一会话内相邻两题的最大间隔（分钟）
+DEFAULT_SESSION_GAP_MINUTES = 120
+
+DEFAULT_COMMIT_LAG_SECONDS = 300
+
+
+def sequence_settings() -> dict:
+    """
+    构建参数的默认值（来自 settings）
+    """
+    return {
+        'top_k': getattr(settings, 'RECOMMENDER_SEQUENCE_TOP_K', DEFAULT_TOP_K),
+        'session_gap_minutes': getattr(settings, 'RECOMMENDER_SEQUENCE_SESSION_GAP_MINUTES', DEFAULT_SESSION_GAP_MINUTES),
+    }
+
+
+def commit_lag_seconds() -> float:
+    return getattr(settings, 'RECOMMENDER_COMMIT_LAG_SECONDS', DEFAULT_COMMIT_LAG_SECONDS)
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _to_us(moment: datetime) -> int:
+    """
+    精确到微秒的整数时间戳（水位线必须与 created_at 精度一致，否则同一毫秒内的记录会被重复读取）
+    """
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_us(us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=us)
+
+
+def _stream(since: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    按 (用户, created_at) 顺序流式读取答题记录
+
+    Returns:
+        (ids, user_ids, question_ids, times): times 为微秒时间戳
+    """
+    interactions = Interaction.objects.all()
+    if since is not None:
+        interactions = interactions.filter(created_at__gt=since)
+    rows = interactions.order_by('user_id', 'created_at', 'id').values_list(
+        'id', 'user_id', 'question_id', 'created_at'
+    )
+
+    id_col = []
+    user_col = []
+    question_col = []
+    time_col = []
+    for row_id, user_id, question_id, created_at in rows.iterator(chunk_size=10000):
+        id_col.append(row_id)
+        user_col.append(user_id)
+        question_col.append(question_id)
+        time_col.append(_to_us(created_at))
+    return (
+        np.asarray(id_col, dtype=np.int64),
+        np.asarray(user_col, dtype=np.int64),
+        np.asarray(question_col, dtype=np.int64),
+        np.asarray(time_col, dtype=np.int64),
+    )
+
+
+class TransitionModel:
+    """
+    题目转移模型
+
+    Attributes:
+        from_ids, to_ids, counts: 全部转移计数（COO，增量更新时累加）
+        state_user_ids, state_question_ids, state_times: 每个用户最后一题及其时间（增量更新时作为前驱）
+        recent_ids, recent_times: 已处理、创建时间在重读窗口内的答题记录 ID 及时间（增量更新时跳过）
+        question_ids: 有后继的题目 ID（升序）
+        indptr, successors, probabilities: 每道题前 K 个后继（按计数降序）及转移概率（占该题全部转移的比例）
+        manifest: watermark（微秒时间戳）、top_k、session_gap_minutes 等
+    """
+
+    ARRAYS = [
+        'from_ids', 'to_ids', 'counts',
+        'state_user_ids', 'state_question_ids', 'state_times',
+        'question_ids', 'indptr', 'successors', 'probabilities',
+        'recent_ids', 'recent_times',
+    ]
+
+    def __init__(
+        self,
+        from_ids, to_ids, counts,
+        state_user_ids, state_question_ids, state_times,
+        question_ids, indptr, successors, probabilities,
+        recent_ids=None, recent_times=None,
+        manifest: Optional[dict] = None
+    ):
+        self.from_ids = from_ids
+        self.to_ids = to_ids
+        self.counts = counts
+        self.state_user_ids = state_user_ids
+        self.state_question_ids = state_question_ids
+        self.state_times = state_times
+        self.question_ids = question_ids
+        self.indptr = indptr
+        self.successors = successors
+        self.probabilities = probabilities
+        # 旧版本发布的模型没有重读窗口，为 None
+        self.recent_ids = recent_ids
+        self.recent_times = recent_times
+        self.manifest = manifest or {}
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        watermark = self.manifest.get('watermark')
+        return _from_us(watermark) if watermark is not None else None
+
+    @classmethod
+    def build(
+        cls,
+        previous: Optional['TransitionModel'] = None,
+        top_k: int = DEFAULT_TOP_K,
+        session_gap_minutes: int = DEFAULT_SESSION_GAP_MINUTES
+    ) -> 'TransitionModel':
+        """
+        构建转移模型
+
+        Args:
+            previous: 已有模型，给出时只读取其水位线之后的答题记录并累加
+            top_k: 每道题保留的后继数
+            session_gap_minutes: 同一会话内相邻两题的最大间隔（分钟）
+
+        Returns:
+            TransitionModel: 新模型
+        """
+        started = time.perf_counter()
+        lag_us = int(commit_lag_seconds() * 1000000)
+        since = None
+        recent_ids = np.zeros(0, dtype=np.int64)
+        recent_times = np.zeros(0, dtype=np.int64)
+        if previous is not None and previous.watermark is not None:
+            if previous.recent_ids is None:
+                since = previous.watermark
+            else:
+                # 重读水位线之前的窗口，补上较晚提交的记录
+                since = _from_us(previous.manifest['watermark'] - lag_us)
+                recent_ids = np.asarray(previous.recent_ids, dtype=np.int64)
+                recent_times = np.asarray(previous.recent_times, dtype=np.int64)
+
+        row_ids, user_ids, question_ids, times = _stream(since)
+        # 窗口内已处理过的记录跳过
+        fresh = ~np.isin(row_ids, recent_ids)
+        row_ids, user_ids, question_ids, times = row_ids[fresh], user_ids[fresh], question_ids[fresh], times[fresh]
+        new_rows = len(user_ids)
+        recent_ids = np.concatenate([recent_ids, row_ids])
+        recent_times = np.concatenate([recent_times, times])
+        late_rows = 0
+
+        from_ids = np.zeros(0, dtype=np.int64)
+        to_ids = np.zeros(0, dtype=np.int64)
+        counts = np.zeros(0, dtype=np.float64)
+        state = (np.zeros(0, dtype=np.int64),) * 3
+        watermark = None
+        if previous is not None:
+            from_ids = np.asarray(previous.from_ids, dtype=np.int64)
+            to_ids = np.asarray(previous.to_ids, dtype=np.int64)
+            counts = np.asarray(previous.counts, dtype=np.float64)
+            state = (
+                np.asarray(previous.state_user_ids, dtype=np.int64),
+                np.asarray(previous.state_question_ids, dtype=np.int64),
+                np.asarray(previous.state_times, dtype=np.int64),
+            )
+            watermark = previous.manifest.get('watermark')
+
+            # 早于该用户已计入的最后一题的迟到记录不产生转移
+            if len(state[0]):
+                pos = np.minimum(np.searchsorted(state[0], user_ids), len(state[0]) - 1)
+                late = (state[0][pos] == user_ids) & (times < state[2][pos])
+                late_rows = int(late.sum())
+                user_ids, question_ids, times = user_ids[~late], question_ids[~late], times[~late]
+
+            # 有新记录的用户，以其最后一题作为第一条新记录的前驱
+            carried = np.isin(state[0], user_ids)
+            user_ids = np.concatenate([state[0][carried], user_ids])
+            question_ids = np.concatenate([state[1][carried], question_ids])
+            times = np.concatenate([state[2][carried], times])
+            order = np.lexsort((times, user_ids))
+            user_ids, question_ids, times = user_ids[order], question_ids[order], times[order]
+
+        # 同一用户、同一会话内的相邻两题（跳过重复打开同一题）
+        if len(user_ids) > 1:
+            pairs = (
+                (user_ids[1:] == user_ids[:-1])
+                & (times[1:] - times[:-1] <= session_gap_minutes * 60 * 1000000)
+                & (question_ids[1:] != question_ids[:-1])
+            )
+            from_ids = np.concatenate([from_ids, question_ids[:-1][pairs]])
+            to_ids = np.concatenate([to_ids, question_ids[1:][pairs]])
+            counts = np.concatenate([counts, np.ones(int(pairs.sum()))])
+
+        # 更新每个用户的最后一题
+        if len(user_ids):
+            last = np.r_[user_ids[1:] != user_ids[:-1], True]
+            untouched = ~np.isin(state[0], user_ids)
+            state_user_ids = np.concatenate([state[0][untouched], user_ids[last]])
+            order = np.argsort(state_user_ids, kind='stable')
+            state = (
+                state_user_ids[order],
+                np.concatenate([state[1][untouched], question_ids[last]])[order],
+                np.concatenate([state[2][untouched], times[last]])[order],
+            )
+            watermark = int(max(times.max(), watermark or 0))
+
+        if watermark is not None:
+            recent = recent_times >= watermark - lag_us
+            recent_ids, recent_times = recent_ids[recent], recent_times[recent]
+
+        model = cls._from_counts(from_ids, to_ids, counts, state, top_k)
+        model.recent_ids, model.recent_times = recent_ids, recent_times
+        model.manifest = {
+            'watermark': watermark,
+            'top_k': top_k,
+            'session_gap_minutes': session_gap_minutes,
+            'transitions': int(model.counts.sum()),
+            'questions': int(len(model.question_ids)),
+            'users': int(len(model.state_user_ids)),
+            'new_interactions': new_rows,
+            'late_interactions': late_rows,
+            'incremental': previous is not None,
+        }
+        logger.info(
+            f"Built transition model: {model.manifest['transitions']} transitions over "
+            f"{model.manifest['questions']} questions from {new_rows} new interactions "
+            f"({time.perf_counter() - started:.1f}s)"
+        )
+        return model
+
+    @classmethod
+    def _from_counts(cls, from_ids, to_ids, counts, state, top_k: int) -> 'TransitionModel':
+        """
+        合并重复的转移计数，并为每道题取前 K 个后继
+        """
+        question_ids = np.unique(np.concatenate([from_ids, to_ids]))
+        rows = np.searchsorted(question_ids, from_ids)
+        cols = np.searchsorted(question_ids, to_ids)
+        matrix = sparse.csr_matrix((counts, (rows, cols)), shape=(len(question_ids), len(question_ids)))
+        matrix.sum_duplicates()
+
+        coo = matrix.tocoo()
+        row_totals = np.asarray(matrix.sum(axis=1)).ravel()
+
+        # 每行按计数降序、后继 ID 升序排列，名次小于 K 的保留
+        order = np.lexsort((coo.col, -coo.data, coo.row))
+        rows, cols, data = coo.row[order], coo.col[order], coo.data[order]
+        rank = np.arange(len(rows)) - matrix.indptr[rows]
+        keep = rank < top_k
+        rows, cols, data = rows[keep], cols[keep], data[keep]
+
+        sources = np.unique(rows)
+        indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=len(question_ids))[sources])]
+        return cls(
+            question_ids[coo.row], question_ids[coo.col], coo.data.astype(np.float64),
+            *state,
+            question_ids[sources], indptr.astype(np.int64), question_ids[cols],
+            (data / row_totals[rows]).astype(np.float32)
+        )
+
+    def save(self, directory: Optional[Path] = None) -> Path:
+        """
+        发布为新版本（目录见 RECOMMENDER_ARTIFACT_DIR），并原子切换当前版本
+        """
+        return publish(directory or artifact_dir(), SEQUENCE_NAME, {
+            'from_ids': np.asarray(self.from_ids, dtype=np.int64),
+            'to_ids': np.asarray(self.to_ids, dtype=np.int64),
+            'counts': np.asarray(self.counts, dtype=np.float64),
+            'state_user_ids': np.asarray(self.state_user_ids, dtype=np.int64),
+            'state_question_ids': np.asarray(self.state_question_ids, dtype=np.int64),
+            'state_times': np.asarray(self.state_times, dtype=np.int64),
+            'question_ids': np.asarray(self.question_ids, dtype=np.int64),
+            'indptr': np.asarray(self.indptr, dtype=np.int64),
+            'successors': np.asarray(self.successors, dtype=np.int64),
+            'probabilities': np.asarray(self.probabilities, dtype=np.float32),
+            'recent_ids': np.asarray(self.recent_ids if self.recent_ids is not None else [], dtype=np.int64),
+            'recent_times': np.asarray(self.recent_times if self.recent_times is not None else [], dtype=np.int64),
+        }, self.manifest)
+
+    @classmethod
+    def open(cls, path: Path) -> 'TransitionModel':
+        """
+        以内存映射方式打开某个版本目录
+        """
+        path = Path(path)
+        with open(path / 'manifest.json', encoding='utf-8') as f:
+            manifest = json.load(f)
+        arrays = {
+            name: np.load(path / f'{name}.npy', mmap_mode='r')
+            for name in cls.ARRAYS if (path / f'{name}.npy').exists()
+        }
+        return cls(manifest=manifest, **arrays)
+
+    @classmethod
+    def current(cls, directory: Optional[Path] = None) -> Optional['TransitionModel']:
+        """
+        获取当前发布的模型（进程内缓存，发布新版本后自动重新加载），没有时返回 None
+        """
+        return ArtifactStore.load(SEQUENCE_NAME, cls.open, directory)
+
+    def next_questions(self, question_id: int, n: int = 5, exclude=()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        某道题之后最常练习的题目
+
+        Args:
+            question_id: 刚完成的题目 ID
+            n: 数量（至多 K 个）
+            exclude: 需要跳过的题目（AnsweredSet 或题目 ID 集合）
+
+        Returns:
+            (question_ids, probabilities): 按转移概率降序；没有后继时为空数组
+        """
+        pos = int(np.searchsorted(self.question_ids, question_id))
+        if pos >= len(self.question_ids) or self.question_ids[pos] != question_id:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        row = slice(int(self.indptr[pos]), int(self.indptr[pos + 1]))
+        successors = np.asarray(self.successors[row])
+        probabilities = np.asarray(self.probabilities[row])
+        keep = ~exclusion_mask(successors, exclude)
+        return successors[keep][:n], probabilities[keep][:n]
@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
+from practice.models import Interaction
+from questions.models import Question
+from .incremental import IncrementalSimilarity
+from .jobs import RecommendationJobs
+from .answered import AnsweredSet
+from .ratings import OnlineRatings
+from .caching import bump_generation
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _after_commit(action, description: str):
+    """
+    事务提交后执行缓存维护（回滚时不执行），出错只记录日志
+    """
+    def run():
+        try:
+            action()
+        except Exception as e:
+            logger.error(f"Error {description}: {e}", exc_info=True)
+
+    transaction.on_commit(run)
+
+
+@receiver(pre_save, sender=Interaction)
+def remember_previous_rating(sender, instance, **kwargs):
+    """
+    保存前记录原有评分状态，用于判断评分是否发生变化
+    """
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Interaction.all_objects.filter(pk=instance.pk).values(
+            'score', 'is_submitted', 'is_deleted'
+        ).first()
+
+
+@receiver(post_save, sender=Interaction)
+def update_similarities_on_interaction_save(sender, instance, created, **kwargs):
+    """
+    答题记录评分变化时，增量更新相关的用户相似度与题目相似度
+    """
+    if not getattr(settings, 'RECOMMENDER_INCREMENTAL_SIMILARITY', True):
+        return
+
+    previous = getattr(instance, '_previous_rating', None)
+    current = {
+        'score': instance.score,
+        'is_submitted': instance.is_submitted,
+        'is_deleted': instance.is_deleted,
+    }
+    if previous == current:
+        return
+
+    was_rated = previous is not None and previous['is_submitted'] and previous['score'] is not None
+    is_rated = instance.is_submitted and instance.score is not None
+    if not was_rated and not is_rated:
+        return
+
+    user_id, question_id = instance.user_id, instance.question_id
+    try:
+        old_score, new_score = IncrementalSimilarity.rating_change(instance, previous)
+        if old_score == new_score:
+            return
+        user_partners, question_partners = IncrementalSimilarity.partners(user_id, question_id)
+    except Exception as e:
+        logger.error(f"Error updating similarities incrementally: {e}", exc_info=True)
+        return
+
+    # 评分变化与已保存行对的对方评分在保存时读取；加行锁、累加增量与近邻重建在事务提交后放到后台执行
+    transaction.on_commit(lambda: RecommendationJobs.enqueue(
+        IncrementalSimilarity.apply_partners,
+        user_id, question_id, old_score, new_score, user_partners, question_partners
+    ))
+
+
+@receiver(post_save, sender=Interaction)
+def invalidate_recommendations_on_interaction_save(sender, instance, created, **kwargs):
+    """
+    答题记录提交或评分发生变化时，使该用户已缓存的推荐结果失效（事务提交后执行）
+    """
+    previous = getattr(instance, '_previous_rating', None)
+    current = {
+        'score': instance.score,
+        'is_submitted': instance.is_submitted,
+        'is_deleted': instance.is_deleted,
+    }
+    if previous == current:
+        return
+    if not instance.is_submitted and not (previous and previous['is_submitted']):
+        return
+
+    # 提交前失效的话，并发请求可能读到提交前的数据并以新代数写回缓存，因此在提交后再失效
+    user_id = instance.user_id
+    _after_commit(lambda: bump_generation(user_id), 'invalidating recommendation cache')
+
+
+@receiver(post_save, sender=Interaction)
+def update_answered_set_on_interaction_save(sender, instance, created, **kwargs):
+    """
+    答题记录提交时在用户的已答位图中置位；撤回提交或删除时丢弃位图缓存（事务提交后执行）
+    """
+    previous = getattr(instance, '_previous_rating', None)
+    was_answered = previous is not None and previous['is_submitted'] and not previous['is_deleted']
+    is_answered = instance.is_submitted and not instance.is_deleted
+    if was_answered == is_answered:
+        return
+
+    # 回滚时不能留下已置位的位，提交后再更新缓存
+    user_id, question_id = instance.user_id, instance.question_id
+    if is_answered:
+        _after_commit(lambda: AnsweredSet.record(user_id, question_id), 'updating answered questions bitmap')
+    else:
+        _after_commit(lambda: AnsweredSet.invalidate(user_id), 'updating answered questions bitmap')
+
+
+@receiver(post_save, sender=Interaction)
+def update_ratings_on_interaction_save(sender, instance, created, **kwargs):
+    """
+    答题记录首次得到评分时，在线更新用户能力评分与题目难度评分（改分不重复计入）
+    """
+    if not getattr(settings, 'RECOMMENDER_ONLINE_RATINGS', True):
+        return
+
+    previous = getattr(instance, '_previous_rating', None)
+    was_rated = previous is not None and previous['is_submitted'] and previous['score'] is not None
+    is_rated = instance.is_submitted and instance.score is not None and not instance.is_deleted
+    if was_rated or not is_rated:
+        return
+
+    try:
+        OnlineRatings.apply(instance.user_id, instance.question_id, instance.score)
+    except Exception as e:
+        logger.error(f"Error updating skill and difficulty ratings: {e}", exc_info=True)
+
+
+@receiver(post_save, sender=Question)
+def ensure_question_rating_on_question_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    新题目创建难度评分（初值按标注难度），已有题目同步分类，使其进入自适应选题的评分桶索引
+    """
+    if not getattr(settings, 'RECOMMENDER_ONLINE_RATINGS', True):
+        return
+    # 浏览数、答题数等计数字段的更新不影响评分
+    if update_fields is not None and not {'category', 'difficulty'} & set(update_fields):
+        return
+
+    try:
+        OnlineRatings.ensure_question(instance)
+    except Exception as e:
+        logger.error(f"Error creating question rating: {e}", exc_info=True)
@@ -0,0 +1,381 @@
+"""
+推荐系统遥测：离线构建的耗时、规模与数据新鲜度，在线服务的缓存命中率、延迟分布与热门回退率
+
+构建遥测（BuildTelemetry）：
+- 相似度矩阵全量重建与各离线模型构建在 BuildTelemetry.record() 中执行，结束时写入一条 BuildRecord：
+  耗时、写入行数、共同评分数达到 / 不足 min_common 的实体对数（计算 / 跳过）、进程峰值内存、数据水位线（开始读取数据前最新一条答题记录的时间）；
+- 构建失败同样记录（status=failed），异常照常抛出；每类构建只保留最近 RECOMMENDER_TELEMETRY_KEEP_BUILDS 条；
+- status() 汇总每类构建：最近一次成功构建距今多久、水位线之后又新增了多少答题记录（数据是否过期）、
+  耗时是否明显超过之前几次构建的中位数（构建是否变慢）。
+
+服务遥测（ServingTelemetry）：
+- 计数器保存在缓存中（cache.incr），配置 Redis 时所有进程共享，本地内存缓存时只统计当前进程；
+- 按推荐类型统计：缓存命中 / 物化命中 / 未命中次数、请求延迟直方图（固定分桶，毫秒）、
+  算法运行次数与回退到热门题目的次数；
+- 计数器不过期，缓存被淘汰或清空后从 0 重新开始，可用 reset() 手动清零。
+"""
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import Max
+from django.utils import timezone
+from practice.models import Interaction
+from .models import BuildRecord, Recommendation
+import logging
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不记录峰值内存
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# 已接入遥测的构建类型（status() 中即使从未构建过也会列出）；离线物化按推荐类型分别记录为 materialized_<type>
+BUILD_KINDS = [
+    'user_similarity', 'question_similarity', 'mf', 'ann', 'embeddings',
+    'walk_graph', 'transitions', 'popularity', 'ratings',
+]
+
+# 每类构建保留的记录数
+DEFAULT_KEEP_BUILDS = 50
+
+# 最近一次成功构建超过该时长（小时）且之后有新的答题记录时视为数据过期
+DEFAULT_STALE_HOURS = 24
+
+# 耗时超过之前构建耗时中位数的倍数时视为构建变慢
+DEFAULT_SLOW_FACTOR = 2.0
+
+# 请求延迟直方图的分桶上界（毫秒），最后一个桶统计超过最大上界的请求
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# 服务遥测计数器的缓存键前缀
+SERVING_KEY_PREFIX = 'recommender_telemetry'
+
+LOOKUP_OUTCOMES = ('cache', 'materialized', 'miss')
+
+
+def telemetry_settings() -> dict:
+    return {
+        'keep_builds': getattr(settings, 'RECOMMENDER_TELEMETRY_KEEP_BUILDS', DEFAULT_KEEP_BUILDS),
+        'stale_hours': getattr(settings, 'RECOMMENDER_TELEMETRY_STALE_HOURS', DEFAULT_STALE_HOURS),
+        'slow_factor': getattr(settings, 'RECOMMENDER_TELEMETRY_SLOW_FACTOR', DEFAULT_SLOW_FACTOR),
+    }
+
+
+def peak_memory_mb() -> Optional[float]:
+    """
+    当前进程的峰值常驻内存（MB），不支持时返回 None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def data_watermark() -> Optional[datetime]:
+    """
+    最新一条答题记录的创建时间
+    """
+    return Interaction.objects.aggregate(latest=Max('created_at'))['latest']
+
+
+class BuildRun:
+    """
+    一次构建的统计量，由构建代码在 BuildTelemetry.record() 中填写
+    """
+    __slots__ = ('kind', 'watermark', 'rows_written', 'pairs_evaluated', 'pairs_pruned', 'details')
+
+    def __init__(self, kind: str, watermark: Optional[datetime]):
+        self.kind = kind
+        self.watermark = watermark
+        self.rows_written: Optional[int] = None
+        self.pairs_evaluated: Optional[int] = None
+        self.pairs_pruned: Optional[int] = None
+        self.details: dict = {}
+
+
+class BuildTelemetry:
+    """
+    离线构建记录的写入与汇总
+    """
+
+    @staticmethod
+    @contextmanager
+    def record(kind: str, enabled: bool = True) -> Iterator[BuildRun]:
+        """
+        记录一次构建：进入时读取数据水位线，退出时写入 BuildRecord
+
+        Args:
+            kind: 构建类型
+            enabled: 为 False 时只返回一个不会保存的 BuildRun（例如只重建单个用户时）
+
+        Yields:
+            BuildRun: 由构建代码填写写入行数、实体对数等统计量
+        """
+        if not enabled:
+            yield BuildRun(kind, None)
+            return
+
+        run = BuildRun(kind, data_watermark())
+        started_at = timezone.now()
+        started = time.perf_counter()
+        try:
+            yield run
+        except Exception as e:
+            BuildTelemetry._save(run, started_at, started, 'failed', str(e))
+            raise
+        BuildTelemetry._save(run, started_at, started, 'ok')
+
+    @staticmethod
+    def _save(run: BuildRun, started_at: datetime, started: float, status: str, error: str = ''):
+        duration_ms = (time.perf_counter() - started) * 1000
+        try:
+            BuildRecord.objects.create(
+                kind=run.kind,
+                status=status,
+                started_at=started_at,
+                duration_ms=duration_ms,
+                rows_written=run.rows_written,
+                pairs_evaluated=run.pairs_evaluated,
+                pairs_pruned=run.pairs_pruned,
+                peak_memory_mb=peak_memory_mb(),
+                watermark=run.watermark,
+                details=run.details,
+                error=error
+            )
+            BuildTelemetry.prune(run.kind)
+        except DatabaseError as e:
+            # 遥测写入失败不影响构建结果
+            logger.warning(f"Failed to save build record for {run.kind}: {e}")
+            return
+
+        logger.info(f"Recorded {status} {run.kind} build: {duration_ms:.0f}ms, {run.rows_written} rows")
+
+    @staticmethod
+    def prune(kind: str, keep: Optional[int] = None) -> int:
+        """
+        删除该类构建最近 keep 条以外的记录
+
+        Returns:
+            int: 删除的记录数
+        """
+        keep = keep or telemetry_settings()['keep_builds']
+        stale = list(
+            BuildRecord.objects.filter(kind=kind).order_by('-started_at').values_list('pk', flat=True)[keep:]
+        )
+        if not stale:
+            return 0
+        return BuildRecord.objects.filter(pk__in=stale).delete()[0]
+
+    @staticmethod
+    def status(kinds: Optional[List[str]] = None) -> Dict[str, dict]:
+        """
+        汇总每类构建的最近状态
+
+        Args:
+            kinds: 构建类型，默认为 BUILD_KINDS 与已有记录中的所有类型
+
+        Returns:
+            dict: 构建类型 -> {
+                'last_status', 'last_error', 'last_build'（最近一次成功构建，从未成功时为 None）,
+                'age_seconds', 'lag_seconds'（最新答题记录比水位线晚多久）, 'interactions_since',
+                'median_duration_ms'（之前成功构建的耗时中位数）, 'slow', 'stale'
+            }
+        """
+        options = telemetry_settings()
+        if kinds is None:
+            recorded = BuildRecord.objects.values_list('kind', flat=True).distinct()
+            kinds = BUILD_KINDS + sorted(set(recorded) - set(BUILD_KINDS))
+
+        latest_interaction = data_watermark()
+        now = timezone.now()
+        result = {}
+        for kind in kinds:
+            records = list(BuildRecord.objects.filter(kind=kind).order_by('-started_at')[:options['keep_builds']])
+            succeeded = [record for record in records if record.status == 'ok']
+            entry = {
+                'last_status': records[0].status if records else None,
+                'last_error': records[0].error if records else '',
+                'last_build': None,
+                'age_seconds': None,
+                'lag_seconds': None,
+                'interactions_since': None,
+                'median_duration_ms': None,
+                'slow': False,
+                'stale': False,
+            }
+            result[kind] = entry
+            if not succeeded:
+                continue
+
+            last = succeeded[0]
+            entry['last_build'] = BuildTelemetry.record_data(last)
+            entry['age_seconds'] = (now - last.started_at).total_seconds()
+
+            since = Interaction.objects.all()
+            if last.watermark is not None:
+                since = since.filter(created_at__gt=last.watermark)
+            entry['interactions_since'] = since.count()
+            if latest_interaction is not None and last.watermark is not None:
+                entry['lag_seconds'] = max(0.0, (latest_interaction - last.watermark).total_seconds())
+
+            previous = [record.duration_ms for record in succeeded[1:]]
+            if previous:
+                entry['median_duration_ms'] = statistics.median(previous)
+                entry['slow'] = last.duration_ms > options['slow_factor'] * entry['median_duration_ms']
+            entry['stale'] = (
+                entry['interactions_since'] > 0
+                and entry['age_seconds'] > options['stale_hours'] * 3600
+            )
+        return result
+
+    @staticmethod
+    def record_data(record: BuildRecord) -> dict:
+        return {
+            'started_at': record.started_at,
+            'status': record.status,
+            'duration_ms': record.duration_ms,
+            'rows_written': record.rows_written,
+            'pairs_evaluated': record.pairs_evaluated,
+            'pairs_pruned': record.pairs_pruned,
+            'peak_memory_mb': record.peak_memory_mb,
+            'watermark': record.watermark,
+            'details': record.details,
+        }
+
+
+def _serving_key(recommendation_type: str, counter: str) -> str:
+    return f'{SERVING_KEY_PREFIX}:{recommendation_type}:{counter}'
+
+
+def _serving_counters() -> List[str]:
+    return (
+        [f'lookup_{outcome}' for outcome in LOOKUP_OUTCOMES]
+        + ['requests', 'latency_us']
+        + [f'latency_{bucket}' for bucket in range(len(LATENCY_BUCKETS_MS) + 1)]
+        + ['runs', 'fallbacks']
+    )
+
+
+def _recommendation_types() -> List[str]:
+    return [recommendation_type for recommendation_type, _ in Recommendation.RECOMMENDATION_TYPES]
+
+
+def _incr(key: str, delta: int = 1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # 键不存在：add 失败说明另一个请求刚刚创建，再加一次即可
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def _percentile_ms(histogram: List[int], fraction: float) -> Optional[float]:
+    """
+    由直方图估算分位数：返回累计次数达到该比例的分桶上界（超过最大上界时返回 None）
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if seen >= fraction * total:
+            return float(LATENCY_BUCKETS_MS[bucket]) if bucket < len(LATENCY_BUCKETS_MS) else None
+    return None
+
+
+class ServingTelemetry:
+    """
+    在线服务计数器（保存在缓存中）
+    """
+
+    @staticmethod
+    def record_lookup(recommendation_type: str, outcome: str):
+        """
+        记录一次读取已有结果的尝试
+
+        Args:
+            recommendation_type: 推荐类型
+            outcome: 'cache'（缓存命中）、'materialized'（物化命中）或 'miss'（需要实时计算）
+        """
+        _incr(_serving_key(recommendation_type, f'lookup_{outcome}'))
+
+    @staticmethod
+    def record_request(recommendation_type: str, elapsed_ms: float):
+        """
+        记录一次推荐请求的端到端耗时
+        """
+        bucket = next(
+            (i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound),
+            len(LATENCY_BUCKETS_MS)
+        )
+        _incr(_serving_key(recommendation_type, 'requests'))
+        _incr(_serving_key(recommendation_type, 'latency_us'), int(elapsed_ms * 1000))
+        _incr(_serving_key(recommendation_type, f'latency_{bucket}'))
+
+    @staticmethod
+    def record_run(algorithm: str, count: int = 1):
+        """
+        记录推荐算法的运行次数（回退率的分母），批量推荐时按用户数计
+        """
+        _incr(_serving_key(algorithm, 'runs'), count)
+
+    @staticmethod
+    def record_fallback(algorithm: str):
+        """
+        记录一次推荐算法因缺少数据或模型而回退到热门题目
+        """
+        _incr(_serving_key(algorithm, 'fallbacks'))
+
+    @staticmethod
+    def snapshot(types: Optional[List[str]] = None) -> Dict[str, dict]:
+        """
+        读取所有计数器并计算命中率、延迟分位数与回退率
+
+        Returns:
+            dict: 推荐类型 -> {
+                'lookups', 'cache_hit_ratio', 'materialized_hit_ratio',
+                'requests', 'avg_latency_ms', 'p50_ms', 'p95_ms', 'latency_histogram',
+                'runs', 'fallbacks', 'fallback_rate'
+            }，命中率与回退率在没有数据时为 None
+        """
+        types = types or _recommendation_types()
+        counters = _serving_counters()
+        values = cache.get_many([_serving_key(t, counter) for t in types for counter in counters])
+
+        result = {}
+        for recommendation_type in types:
+            count = {counter: values.get(_serving_key(recommendation_type, counter), 0) for counter in counters}
+            lookups = sum(count[f'lookup_{outcome}'] for outcome in LOOKUP_OUTCOMES)
+            histogram = [count[f'latency_{bucket}'] for bucket in range(len(LATENCY_BUCKETS_MS) + 1)]
+            labels = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+            result[recommendation_type] = {
+                'lookups': lookups,
+                'cache_hit_ratio': count['lookup_cache'] / lookups if lookups else None,
+                'materialized_hit_ratio': count['lookup_materialized'] / lookups if lookups else None,
+                'requests': count['requests'],
+                'avg_latency_ms': count['latency_us'] / 1000 / count['requests'] if count['requests'] else None,
+                'p50_ms': _percentile_ms(histogram, 0.5),
+                'p95_ms': _percentile_ms(histogram, 0.95),
+                'latency_histogram': dict(zip(labels, histogram)),
+                'runs': count['runs'],
+                'fallbacks': count['fallbacks'],
+                'fallback_rate': count['fallbacks'] / count['runs'] if count['runs'] else None,
+            }
+        return result
+
+    @staticmethod
+    def reset(types: Optional[List[str]] = None):
+        """
+        清零服务计数器
+        """
+        types = types or _recommendation_types()
+        cache.delete_many([_serving_key(t, counter) for t in types for counter in _serving_counters()])
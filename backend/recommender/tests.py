@@ -1,9 +1,45 @@
-from django.test import TestCase
+import io
+import tempfile
+from contextlib import contextmanager, nullcontext
+import threading
+import time
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from .algorithms import CollaborativeFiltering
-from .models import UserSimilarity, QuestionSimilarity
+from .matrix import USER_TABLES, RatingMatrix, SimilarityEngine, _rebuild
+from .incremental import IncrementalSimilarity
+from .generations import RebuildInProgress, SimilarityGenerations
+from .bulk import BulkUpserter
+from .materialize import RecommendationMaterializer
+from .artifact import ArtifactStore, export_artifact
+from .ann import UserANNIndex, benchmark_recall, exact_top_k
+from .factorization import ALSModel
+from .graph import WalkGraph
+from .sequence import TransitionModel
+from .ratings import OnlineRatings, expected_score
+from .content import QuestionEmbeddings
+from .popularity import PopularityIndex
+from .caching import recommendation_cache_key, single_flight
+from .jobs import RecommendationJobs
+from .answered import AnsweredSet, exclusion_mask
+from .pipeline import CandidateGenerator, RecommendationPipeline, reciprocal_rank_merge, weighted_sum_merge
+from .preferences import UserPreferenceBuilder
+from .benchmark import DatasetSpec, clear_dataset, generate_dataset, run_benchmark
+from .telemetry import BuildRun, BuildTelemetry, ServingTelemetry
+from .models import (
+    UserSimilarity, QuestionSimilarity, UserNeighbor, QuestionNeighbor, Recommendation,
+    MaterializedRecommendation, UserPreference, SkillRating, QuestionRating, SimilarityGeneration, BuildRecord
+)
 from practice.models import Interaction
 from questions.models import Question, Category
+import numpy as np
 
 User = get_user_model()
 
@@ -189,3 +225,1919 @@ class CollaborativeFilteringTestCase(TestCase):
 
         self.assertIsNotNone(similarity)
         self.assertGreater(similarity.similarity_score, 0)
+
+
+class RatingFixtureTestCase(TestCase):
+    """
+    带有 4 个用户 × 4 道题目评分数据的测试基类
+    """
+
+    @contextmanager
+    def committed(self):
+        """
+        模拟事务提交：块内注册的提交回调（缓存失效、相似度增量更新等）在退出时于当前线程内执行
+        """
+        with override_settings(RECOMMENDER_JOB_WORKERS=0), self.captureOnCommitCallbacks(execute=True):
+            yield
+
+    def setUp(self):
+        # 热度索引等缓存在测试之间不能复用
+        cache.clear()
+        # 相似度增量更新在事务提交后执行：夹具数据的增量更新在当前线程内立即应用
+        committed = self.captureOnCommitCallbacks(execute=True) if isinstance(self, TestCase) else nullcontext()
+        with override_settings(RECOMMENDER_JOB_WORKERS=0), committed:
+            self.users = [
+                User.objects.create_user(username=f'engine_user{i}', password='pass')
+                for i in range(4)
+            ]
+            self.category = Category.objects.create(name='Engine', slug='engine')
+            self.questions = [
+                Question.objects.create(
+                    title=f'Engine Q{i}',
+                    slug=f'engine-q{i}',
+                    content='content',
+                    category=self.category,
+                    difficulty=1,
+                    is_approved=True
+                )
+                for i in range(4)
+            ]
+
+            scores = [
+                [90, 80, 40, None],
+                [85, 70, 30, 60],
+                [20, 95, None, 75],
+                [None, 60, 65, 70],
+            ]
+            for user, row in zip(self.users, scores):
+                for question, score in zip(self.questions, row):
+                    if score is not None:
+                        Interaction.objects.create(
+                            user=user,
+                            question=question,
+                            score=score,
+                            is_submitted=True
+                        )
+
+
+@override_settings(RECOMMENDER_INCREMENTAL_SIMILARITY=False)
+class SimilarityEngineTestCase(RatingFixtureTestCase):
+    """
+    稀疏矩阵相似度引擎测试用例
+    """
+
+    def test_user_similarities_match_pairwise(self):
+        """
+        测试引擎结果与逐对计算一致
+        """
+        matrix = RatingMatrix.from_interactions()
+        pairs = {
+            (stats.a, stats.b): (stats.similarity, stats.common)
+            for stats in SimilarityEngine.user_similarities(matrix, 2)
+        }
+
+        self.assertEqual(len(pairs), 6)
+        for i, user_a in enumerate(self.users):
+            for user_b in self.users[i + 1:]:
+                expected = CollaborativeFiltering.calculate_user_similarity(user_a, user_b, 2)
+                similarity, _ = pairs[(user_a.id, user_b.id)]
+                self.assertAlmostEqual(similarity, expected)
+
+        self.assertEqual(pairs[(self.users[0].id, self.users[1].id)][1], 3)
+
+    def test_rebuild_user_similarities(self):
+        """
+        测试重建用户相似度矩阵并支持重复执行
+        """
+        updated_count = SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        self.assertEqual(updated_count, 6)
+
+        SimilarityEngine.rebuild_user_similarities(
+            min_common_questions=2, target_user=self.users[0]
+        )
+        self.assertEqual(UserSimilarity.objects.count(), 6)
+
+    def test_question_similarities_match_pairwise(self):
+        """
+        测试题目相似度与逐对计算一致，且分块大小不影响结果
+        """
+        matrix = RatingMatrix.from_interactions(approved_only=True)
+        full = {
+            (stats.a, stats.b): stats.similarity
+            for stats in SimilarityEngine.question_similarities(matrix, 2)
+        }
+        blocked = {
+            (stats.a, stats.b): stats.similarity
+            for stats in SimilarityEngine.question_similarities(matrix, 2, block_size=1)
+        }
+
+        self.assertEqual(full.keys(), blocked.keys())
+        for key, similarity in full.items():
+            self.assertAlmostEqual(blocked[key], similarity)
+        for i, question_a in enumerate(self.questions):
+            for question_b in self.questions[i + 1:]:
+                expected = CollaborativeFiltering.calculate_question_similarity(question_a, question_b, 2)
+                self.assertAlmostEqual(full[(question_a.id, question_b.id)], expected)
+
+    def test_rebuild_question_similarities_skips_unapproved(self):
+        """
+        测试未审核题目不参与题目相似度计算
+        """
+        self.questions[3].is_approved = False
+        self.questions[3].save()
+
+        updated_count = SimilarityEngine.rebuild_question_similarities(
+            min_common_users=2, memory_budget_mb=1
+        )
+
+        self.assertEqual(updated_count, 3)
+        self.assertFalse(QuestionSimilarity.objects.filter(
+            Q(question_a=self.questions[3]) | Q(question_b=self.questions[3])
+        ).exists())
+
+    def test_rebuild_question_similarities_skips_deleted(self):
+        """
+        测试已软删除的题目不参与题目相似度计算（与原来从 Question.objects 取题目一致），用户相似度仍计入其评分
+        """
+        users_before = RatingMatrix.from_interactions().shape
+        self.questions[3].soft_delete()
+
+        self.assertNotIn(self.questions[3].id, RatingMatrix.from_interactions(approved_only=True).question_ids)
+        self.assertEqual(RatingMatrix.from_interactions().shape, users_before)
+        updated_count = SimilarityEngine.rebuild_question_similarities(min_common_users=2)
+
+        self.assertEqual(updated_count, 3)
+        self.assertFalse(QuestionSimilarity.objects.filter(
+            Q(question_a=self.questions[3]) | Q(question_b=self.questions[3])
+        ).exists())
+
+    def test_parallel_rebuild_matches_serial(self):
+        """
+        测试多进程分片重建与单进程结果一致
+        """
+        def snapshot():
+            pairs = {
+                (row.user_a_id, row.user_b_id): (round(row.similarity_score, 9), row.common_questions)
+                for row in UserSimilarity.objects.all()
+            }
+            neighbors = list(UserNeighbor.objects.values_list('user_id', 'rank', 'neighbor_id'))
+            return pairs, sorted(neighbors)
+
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        expected = snapshot()
+        UserSimilarity.objects.all().delete()
+        UserNeighbor.objects.all().delete()
+
+        updated_count = SimilarityEngine.rebuild_user_similarities(
+            min_common_questions=2, memory_budget_mb=1, workers=2
+        )
+
+        self.assertEqual(updated_count, 6)
+        self.assertEqual(snapshot(), expected)
+
+    @override_settings(RECOMMENDER_NEIGHBOR_K=1)
+    def test_rebuild_keeps_top_k_neighbors(self):
+        """
+        测试重建时每个用户只保留相似度最高的 K 个近邻
+        """
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+
+        for user in self.users:
+            neighbors = list(UserNeighbor.objects.filter(user=user))
+            best = UserSimilarity.objects.filter(
+                Q(user_a=user) | Q(user_b=user)
+            ).order_by('-similarity_score').first()
+            self.assertEqual(len(neighbors), 1)
+            self.assertEqual(neighbors[0].rank, 0)
+            self.assertAlmostEqual(neighbors[0].similarity_score, best.similarity_score)
+            self.assertIn(neighbors[0].neighbor_id, (best.user_a_id, best.user_b_id))
+
+    @override_settings(RECOMMENDER_NEIGHBOR_K=1)
+    def test_stored_pairs_bounded_by_neighbors(self):
+        """
+        测试重建与增量更新后只保存出现在近邻列表中的用户对
+        """
+        def edges():
+            return {
+                tuple(sorted(pair))
+                for pair in UserNeighbor.objects.values_list('user_id', 'neighbor_id')
+            }
+
+        def stored():
+            return set(UserSimilarity.objects.values_list('user_a_id', 'user_b_id'))
+
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        self.assertEqual(stored(), edges())
+        self.assertLess(len(stored()), 6)
+
+        interaction = Interaction.objects.get(user=self.users[1], question=self.questions[1])
+        old_score, interaction.score = interaction.score, 10
+        interaction.save()
+        IncrementalSimilarity.apply_rating(self.users[1].id, self.questions[1].id, old_score, 10)
+        self.assertLessEqual(stored(), edges())
+
+    def test_user_based_recommend_single_query_expansion(self):
+        """
+        测试基于用户的推荐一次查询展开相似用户，并只使用前 M 个相似用户
+        """
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        user = self.users[0]
+        neighbors = list(UserNeighbor.objects.filter(user=user, similarity_score__gte=0.0))
+        self.assertGreaterEqual(len(neighbors), 2)
+
+        # 已答题、近邻、相似用户答题、in_bulk、用户名
+        with self.assertNumQueries(5):
+            recommendations = CollaborativeFiltering.user_based_recommend(user, n=5, min_similarity=0.0)
+
+        question, score, reason = recommendations[0]
+        contributors = [
+            neighbor for neighbor in neighbors[:30]
+            if Interaction.objects.filter(user=neighbor.neighbor, question=self.questions[3], score__gte=60).exists()
+        ]
+        self.assertEqual(question.id, self.questions[3].id)
+        self.assertAlmostEqual(score, sum(
+            neighbor.similarity_score * Interaction.objects.get(user=neighbor.neighbor, question=self.questions[3]).score / 100
+            for neighbor in contributors
+        ))
+        self.assertEqual(reason.count('相似用户'), len(contributors))
+
+        limited = CollaborativeFiltering.user_based_recommend(user, n=5, min_similarity=0.0, max_neighbors=1)
+        top_neighbor = neighbors[0]
+        expected = Interaction.objects.get(user=top_neighbor.neighbor, question=self.questions[3]).score
+        self.assertAlmostEqual(limited[0][1], top_neighbor.similarity_score * expected / 100)
+
+    def test_item_based_recommend_reads_neighbors(self):
+        """
+        测试基于物品的推荐从近邻表读取相似题目
+        """
+        SimilarityEngine.rebuild_question_similarities(min_common_users=2)
+        self.assertTrue(QuestionNeighbor.objects.filter(neighbor=self.questions[3]).exists())
+
+        # 已答题目位图已缓存时：已答评分、近邻、题目各一次查询
+        AnsweredSet.for_user(self.users[0].id)
+        with self.assertNumQueries(3):
+            recommendations = CollaborativeFiltering.item_based_recommend(self.users[0], n=5, min_similarity=0.0)
+
+        self.assertEqual([question.id for question, _, _ in recommendations], [self.questions[3].id])
+        question, score, reason = recommendations[0]
+        expected = sum(
+            neighbor.similarity_score * Interaction.objects.get(user=self.users[0], question=neighbor.question).score / 100
+            for neighbor in QuestionNeighbor.objects.filter(neighbor=self.questions[3], similarity_score__gte=0.0)
+        )
+        self.assertAlmostEqual(score, expected)
+        self.assertIn(f'Q{self.questions[0].id}', reason)
+
+
+@override_settings(RECOMMENDER_INCREMENTAL_SIMILARITY=False)
+class SimilarityGenerationTestCase(RatingFixtureTestCase):
+    """
+    相似度矩阵代数切换测试用例
+    """
+
+    def neighbor_ids(self, user):
+        return CollaborativeFiltering.similar_users(user.id, min_similarity=-1)[0].tolist()
+
+    def test_full_rebuild_swaps_generation(self):
+        """
+        测试全量重建写入新代数后切换，旧代数（包括已不存在的行对）被清理
+        """
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        self.assertEqual(SimilarityGenerations.active('user'), 1)
+        expected = self.neighbor_ids(self.users[0])
+        idle = User.objects.create_user(username='idle_user', password='pass')
+        UserSimilarity.objects.create(user_a=self.users[3], user_b=idle, generation=1, common_questions=9)
+
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        self.assertEqual(SimilarityGenerations.active('user'), 2)
+        self.assertEqual(set(UserSimilarity.objects.values_list('generation', flat=True)), {2})
+        self.assertEqual(set(UserNeighbor.objects.values_list('generation', flat=True)), {2})
+        self.assertEqual(UserSimilarity.objects.count(), 6)
+        self.assertEqual(self.neighbor_ids(self.users[0]), expected)
+
+        # 只重建单个用户时在当前代数上原地更新
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2, target_user=self.users[0])
+        self.assertEqual(SimilarityGenerations.active('user'), 2)
+        self.assertEqual(UserSimilarity.objects.count(), 6)
+
+    def test_readers_ignore_unactivated_generation(self):
+        """
+        测试切换前读取方看不到正在写入的代数，失败的重建留下的行在下次重建开始时被清理
+        """
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        expected = self.neighbor_ids(self.users[0])
+
+        generation = SimilarityGenerations.begin(USER_TABLES)
+        self.assertEqual(generation, 2)
+        UserNeighbor.objects.create(user=self.users[0], neighbor=self.users[3], rank=0, generation=generation)
+        self.assertEqual(self.neighbor_ids(self.users[0]), expected)
+        self.assertEqual(UserSimilarity.objects.active().count(), 6)
+
+        SimilarityGenerations.activate('user', generation)
+        self.assertEqual(self.neighbor_ids(self.users[0]), [self.users[3].id])
+
+        SimilarityGenerations.activate('user', 1)
+        self.assertEqual(SimilarityGenerations.begin(USER_TABLES), 2)
+        self.assertFalse(UserNeighbor.objects.filter(generation=2).exists())
+        self.assertEqual(SimilarityGeneration.objects.count(), 1)
+
+    def test_concurrent_full_rebuild_fails_fast(self):
+        """
+        测试同一类矩阵已有全量重建时，第二个重建立即失败且不会清理第一个重建正在写入的代数
+        """
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        generation = SimilarityGenerations.begin(USER_TABLES)
+        UserNeighbor.objects.create(user=self.users[0], neighbor=self.users[3], rank=0, generation=generation)
+
+        with self.assertRaises(RebuildInProgress):
+            SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        self.assertTrue(UserNeighbor.objects.filter(generation=generation).exists())
+        self.assertEqual(SimilarityGenerations.active('user'), 1)
+        # 只重建单个用户不受租约限制
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2, target_user=self.users[0])
+
+        # 过期的租约（重建进程崩溃）不再阻塞
+        with override_settings(RECOMMENDER_REBUILD_LEASE_SECONDS=0):
+            SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        self.assertEqual(SimilarityGenerations.active('user'), 2)
+        self.assertIsNone(SimilarityGeneration.objects.get(kind='user').building_since)
+
+    def test_failed_rebuild_releases_lease(self):
+        """
+        测试重建失败时释放租约
+        """
+        with self.assertRaises(RuntimeError):
+            with SimilarityGenerations.rebuilding(USER_TABLES):
+                raise RuntimeError('rebuild failed')
+        self.assertIsNone(SimilarityGeneration.objects.get(kind='user').building_since)
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        self.assertEqual(SimilarityGenerations.active('user'), 1)
+
+    @override_settings(RECOMMENDER_INCREMENTAL_SIMILARITY=True, RECOMMENDER_COMMIT_LAG_SECONDS=0)
+    def test_replays_changes_during_rebuild(self):
+        """
+        测试重建期间写入旧代数的增量更新在切换后重放
+        """
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+
+        run = BuildRun('user_similarity', None)
+        with SimilarityGenerations.rebuilding(USER_TABLES) as generation:
+            matrix = RatingMatrix.from_interactions()
+            with self.committed():
+                Interaction.objects.create(
+                    user=self.users[0], question=self.questions[3], score=50, is_submitted=True
+                )
+            _rebuild(USER_TABLES, matrix.ratings, matrix.user_ids, 2, None, 1000, None, run=run, generation=generation)
+
+        self.assertEqual(run.details['replayed'], 1)
+        self.assertEqual(SimilarityGenerations.active('user'), generation)
+        self.assertEqual(
+            UserSimilarity.objects.active().get(user_a=self.users[0], user_b=self.users[1]).common_questions, 4
+        )
+
+    def test_incremental_updates_active_generation(self):
+        """
+        测试增量更新只修改当前代数的行
+        """
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+
+        Interaction.objects.create(user=self.users[0], question=self.questions[3], score=50, is_submitted=True)
+        IncrementalSimilarity.apply_rating(self.users[0].id, self.questions[3].id, None, 50)
+
+        self.assertEqual(set(UserSimilarity.objects.values_list('generation', flat=True)), {2})
+        self.assertEqual(set(UserNeighbor.objects.values_list('generation', flat=True)), {2})
+        self.assertEqual(
+            UserSimilarity.objects.get(user_a=self.users[0], user_b=self.users[1]).common_questions, 4
+        )
+
+
+@override_settings(RECOMMENDER_JOB_WORKERS=0)
+class IncrementalSimilarityTestCase(RatingFixtureTestCase):
+    """
+    相似度增量维护测试用例（增量更新在事务提交后执行）
+    """
+
+    def assertMatchesRebuild(self):
+        """
+        已保存的行对与重新计算的一致；夹具远小于 K，相似度大于 0 的行对都应保存
+        """
+        matrix = RatingMatrix.from_interactions()
+        expected = {
+            (stats.a, stats.b): stats
+            for stats in SimilarityEngine.user_similarities(matrix, 2)
+        }
+        stored = {
+            (row.user_a_id, row.user_b_id): row
+            for row in UserSimilarity.objects.all()
+        }
+        self.assertLessEqual(stored.keys(), expected.keys())
+        self.assertGreaterEqual(stored.keys(), {key for key, stats in expected.items() if stats.similarity > 0})
+        for key, row in stored.items():
+            self.assertEqual(row.common_questions, expected[key].common)
+            self.assertAlmostEqual(row.similarity_score, expected[key].similarity)
+            self.assertAlmostEqual(row.sum_ab, expected[key].sum_ab)
+
+        matrix = RatingMatrix.from_interactions(approved_only=True)
+        expected = {
+            (stats.a, stats.b): stats.similarity
+            for stats in SimilarityEngine.question_similarities(matrix, 2)
+        }
+        stored = dict(
+            ((row.question_a_id, row.question_b_id), row.similarity_score)
+            for row in QuestionSimilarity.objects.all()
+        )
+        self.assertLessEqual(stored.keys(), expected.keys())
+        self.assertGreaterEqual(stored.keys(), {key for key, similarity in expected.items() if similarity > 0})
+        for key, similarity in stored.items():
+            self.assertAlmostEqual(similarity, expected[key])
+
+    def test_new_ratings_update_incrementally(self):
+        """
+        测试逐条评分后的相似度与全量重建一致
+        """
+        self.assertMatchesRebuild()
+
+    def test_rescore_and_reset(self):
+        """
+        测试重新评分和重置答题后的相似度与全量重建一致
+        """
+        interaction = Interaction.objects.get(user=self.users[1], question=self.questions[1])
+        interaction.score = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            interaction.save()
+        self.assertMatchesRebuild()
+
+        interaction.score = None
+        interaction.is_submitted = False
+        with self.captureOnCommitCallbacks(execute=True):
+            interaction.save()
+        self.assertMatchesRebuild()
+
+    def test_deferred_until_commit(self):
+        """
+        测试保存答题记录时不在请求内更新相似度，事务提交后才应用
+        """
+        interaction = Interaction.objects.get(user=self.users[1], question=self.questions[1])
+        before = UserSimilarity.objects.get(user_a=self.users[0], user_b=self.users[1]).sum_ab
+        interaction.score = 10
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            interaction.save()
+        # 相似度增量更新与推荐缓存失效
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(UserSimilarity.objects.get(user_a=self.users[0], user_b=self.users[1]).sum_ab, before)
+
+        for callback in callbacks:
+            callback()
+        self.assertMatchesRebuild()
+
+    def assertStoredStatsExact(self):
+        matrix = RatingMatrix.from_interactions()
+        expected = {
+            (stats.a, stats.b): stats
+            for stats in SimilarityEngine.user_similarities(matrix, 2)
+        }
+        for row in UserSimilarity.objects.all():
+            stats = expected[(row.user_a_id, row.user_b_id)]
+            self.assertEqual(row.common_questions, stats.common)
+            self.assertAlmostEqual(row.sum_ab, stats.sum_ab)
+            self.assertAlmostEqual(row.similarity_score, stats.similarity)
+
+    @override_settings(RECOMMENDER_NEIGHBOR_K=1)
+    def test_full_neighbor_list_applies_deltas(self):
+        """
+        测试近邻列表已满时只在已保存的行对上累加增量，不读取该题其他答题者的评分明细
+        """
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        stored = set(UserSimilarity.objects.values_list('user_a_id', 'user_b_id'))
+
+        interaction = Interaction.objects.get(user=self.users[1], question=self.questions[1])
+        interaction.score = 10
+        with CaptureQueriesContext(connection) as queries, self.committed():
+            interaction.save()
+
+        self.assertLessEqual(set(UserSimilarity.objects.values_list('user_a_id', 'user_b_id')), stored)
+        self.assertStoredStatsExact()
+        # 没有读取该题所有答题者的评分（只按已保存行对的对方读取）
+        wheres = [query['sql'].partition(' WHERE ')[2] for query in queries.captured_queries]
+        raters = [
+            where for where in wheres
+            if f'"practice_interaction"."question_id" = {self.questions[1].id}' in where
+            and '"practice_interaction"."user_id"' not in where.replace('NOT ("practice_interaction"."user_id"', '')
+        ]
+        self.assertEqual(raters, [])
+
+    def test_rescan_restores_exact_stats(self):
+        """
+        测试从评分记录重新计算已保存行对的统计量，重复执行结果不变
+        """
+        UserSimilarity.objects.update(sum_ab=0.0, common_questions=1)
+        for user in self.users:
+            IncrementalSimilarity.rescan_user(user.id)
+        self.assertMatchesRebuild()
+        IncrementalSimilarity.rescan_user(self.users[0].id)
+        self.assertMatchesRebuild()
+
+    def test_refresh_user(self):
+        """
+        测试使用已保存的统计量刷新用户相似度
+        """
+        UserSimilarity.objects.filter(
+            Q(user_a=self.users[0]) | Q(user_b=self.users[0])
+        ).update(similarity_score=0.0)
+
+        updated_count = IncrementalSimilarity.refresh_user(self.users[0].id)
+
+        self.assertEqual(updated_count, 3)
+        self.assertMatchesRebuild()
+
+        neighbors = list(UserNeighbor.objects.filter(user=self.users[0]))
+        self.assertEqual([neighbor.rank for neighbor in neighbors], list(range(len(neighbors))))
+        scores = [neighbor.similarity_score for neighbor in neighbors]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+class BulkUpserterTestCase(RatingFixtureTestCase):
+    """
+    批量分块写入工具测试用例
+    """
+
+    def upsert(self, scores, chunk_size):
+        with BulkUpserter(
+            Recommendation,
+            ['user', 'question', 'recommendation_type'],
+            ['score', 'reason'],
+            chunk_size=chunk_size
+        ) as writer:
+            writer.extend(
+                Recommendation(
+                    user=self.users[0],
+                    question=question,
+                    recommendation_type='hybrid',
+                    score=score,
+                    reason=f'score {score}'
+                )
+                for question, score in zip(self.questions, scores)
+            )
+        return writer
+
+    def test_flushes_in_chunks(self):
+        """
+        测试按块写入并统计行数
+        """
+        writer = self.upsert([0.1, 0.2, 0.3], chunk_size=2)
+
+        self.assertEqual(writer.rows, 3)
+        self.assertEqual(writer.chunks, 2)
+        self.assertGreaterEqual(writer.rows_per_second, 0.0)
+        self.assertEqual(Recommendation.objects.count(), 3)
+
+    def test_updates_existing_rows(self):
+        """
+        测试冲突时更新已有记录且保留其他字段
+        """
+        self.upsert([0.1, 0.2], chunk_size=10)
+        Recommendation.objects.filter(question=self.questions[0]).update(is_viewed=True)
+
+        self.upsert([0.9, 0.8, 0.7], chunk_size=10)
+
+        self.assertEqual(Recommendation.objects.count(), 3)
+        first = Recommendation.objects.get(question=self.questions[0])
+        self.assertAlmostEqual(first.score, 0.9)
+        self.assertEqual(first.reason, 'score 0.9')
+        self.assertTrue(first.is_viewed)
+
+
+@override_settings(RECOMMENDER_INCREMENTAL_SIMILARITY=False)
+class RecommendationMaterializerTestCase(RatingFixtureTestCase):
+    """
+    离线推荐物化测试用例
+    """
+
+    def setUp(self):
+        super().setUp()
+        SimilarityEngine.rebuild_question_similarities(min_common_users=2)
+
+    def test_materialize_active_users(self):
+        """
+        测试为所有活跃用户生成推荐列表并可重复执行
+        """
+        self.users[3].is_active = False
+        self.users[3].save()
+
+        count = RecommendationMaterializer.materialize(recommendation_type='item_based', min_similarity=0.0)
+        self.assertEqual(count, 3)
+
+        RecommendationMaterializer.materialize(recommendation_type='item_based', min_similarity=0.0)
+        self.assertEqual(MaterializedRecommendation.objects.count(), 3)
+
+        entry = MaterializedRecommendation.objects.get(user=self.users[0])
+        self.assertEqual([item['question'] for item in entry.items], [self.questions[3].id])
+        self.assertEqual(entry.items[0]['id'], Recommendation.objects.get(user=self.users[0]).id)
+
+    def test_serve(self):
+        """
+        测试读取物化结果，参数不匹配时返回 None
+        """
+        RecommendationMaterializer.materialize(
+            [self.users[0]], recommendation_type='item_based', n=10, min_similarity=0.0
+        )
+
+        with self.assertNumQueries(1):
+            result = RecommendationMaterializer.serve(self.users[0], 'item_based', n=5, min_similarity=0.0)
+        self.assertEqual(result['source'], 'materialized')
+        self.assertEqual(result['count'], 1)
+        self.assertIsNotNone(result['generated_at'])
+
+        self.assertIsNone(RecommendationMaterializer.serve(self.users[0], 'item_based', n=20, min_similarity=0.0))
+        self.assertIsNone(RecommendationMaterializer.serve(self.users[1], 'item_based', n=5, min_similarity=0.0))
+
+    def test_serve_skips_answered_and_stale(self):
+        """
+        测试物化结果跳过已答题目，已答题目补不足时及物化后又有新答题时返回 None
+        """
+        RecommendationMaterializer.materialize(
+            [self.users[0]], recommendation_type='item_based', n=10, min_similarity=0.0
+        )
+        entry = MaterializedRecommendation.objects.get(user=self.users[0])
+        self.assertIsNotNone(entry.answered_at)
+        entry.items = [dict(entry.items[0], question=self.questions[0].id)] + entry.items
+        entry.save()
+
+        result = RecommendationMaterializer.serve(self.users[0], 'item_based', n=1, min_similarity=0.0)
+        self.assertEqual([item['question'] for item in result['recommendations']], [self.questions[3].id])
+        self.assertIsNone(RecommendationMaterializer.serve(self.users[0], 'item_based', n=2, min_similarity=0.0))
+
+        Interaction.objects.create(user=self.users[0], question=self.questions[3], score=50, is_submitted=True)
+        self.assertIsNone(RecommendationMaterializer.serve(self.users[0], 'item_based', n=1, min_similarity=0.0))
+
+
+@override_settings(RECOMMENDER_INCREMENTAL_SIMILARITY=False)
+class NeighborArtifactTestCase(RatingFixtureTestCase):
+    """
+    内存映射近邻矩阵测试用例
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        SimilarityEngine.rebuild_question_similarities(min_common_users=2)
+
+    def test_lookup_matches_neighbor_table(self):
+        """
+        测试映射数组的切片与近邻表一致
+        """
+        export_artifact('user', self.directory.name)
+        artifact = ArtifactStore.get('user', self.directory.name)
+
+        for user in self.users:
+            ids, scores = artifact.lookup(user.id, min_similarity=0.5)
+            expected = UserNeighbor.objects.filter(user=user, similarity_score__gte=0.5)
+            self.assertEqual(ids.tolist(), [neighbor.neighbor_id for neighbor in expected])
+            for score, neighbor in zip(scores.tolist(), expected):
+                self.assertAlmostEqual(score, neighbor.similarity_score, places=6)
+
+        ids, scores = artifact.lookup(0)
+        self.assertEqual(len(ids), 0)
+
+    def test_lookup_many_matches_neighbor_table(self):
+        """
+        测试批量读取多个 owner 的近邻与近邻表一致
+        """
+        export_artifact('question', self.directory.name)
+        artifact = ArtifactStore.get('question', self.directory.name)
+        question_ids = [self.questions[2].id, 0, self.questions[0].id]
+
+        owners, ids, scores = artifact.lookup_many(question_ids, min_similarity=0.5)
+
+        expected = [
+            (neighbor.question_id, neighbor.neighbor_id)
+            for question_id in question_ids
+            for neighbor in QuestionNeighbor.objects.filter(question_id=question_id, similarity_score__gte=0.5)
+        ]
+        self.assertEqual(list(zip(owners.tolist(), ids.tolist())), expected)
+        self.assertEqual(len(scores), len(expected))
+
+    def test_hot_reload(self):
+        """
+        测试重新导出后自动切换到新版本并清理旧版本
+        """
+        export_artifact('question', self.directory.name, keep_versions=1)
+        first = ArtifactStore.get('question', self.directory.name)
+
+        QuestionNeighbor.objects.filter(question=self.questions[0]).delete()
+        export_artifact('question', self.directory.name, keep_versions=1)
+        second = ArtifactStore.get('question', self.directory.name)
+
+        self.assertNotEqual(first.version, second.version)
+        self.assertEqual(len(second.lookup(self.questions[0].id, 0.0)[0]), 0)
+        self.assertGreater(len(first.lookup(self.questions[0].id, 0.0)[0]), 0)
+
+    def test_recommend_from_artifact(self):
+        """
+        测试启用内存映射文件后推荐结果不变
+        """
+        expected = CollaborativeFiltering.item_based_recommend(self.users[0], min_similarity=0.0)
+        export_artifact('question', self.directory.name)
+
+        with override_settings(RECOMMENDER_USE_ARTIFACT=True, RECOMMENDER_ARTIFACT_DIR=self.directory.name):
+            with self.assertNumQueries(2):
+                recommendations = CollaborativeFiltering.item_based_recommend(self.users[0], min_similarity=0.0)
+
+        self.assertEqual(
+            [(question.id, round(score, 5)) for question, score, _ in recommendations],
+            [(question.id, round(score, 5)) for question, score, _ in expected]
+        )
+
+
+class UserANNIndexTestCase(RatingFixtureTestCase):
+    """
+    用户 ANN 索引测试用例
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.matrix = RatingMatrix.from_interactions()
+
+    def test_full_probe_matches_exact(self):
+        """
+        测试扫描全部簇时结果与暴力搜索一致，且保存后重新映射结果不变
+        """
+        index = UserANNIndex.build(self.matrix, dim=8, n_lists=2, seed=1)
+        index.save(self.directory.name)
+        loaded = UserANNIndex.current(self.directory.name)
+        self.assertEqual(loaded.manifest['users'], len(self.users))
+
+        k = len(self.users) - 1
+        exact = exact_top_k(self.matrix, range(len(self.users)), k)
+        for user in self.users:
+            ids, scores = loaded.query(user.id, k=k, n_probe=loaded.n_lists)
+            self.assertEqual(set(ids.tolist()), set(exact[user.id]))
+            self.assertNotIn(user.id, ids.tolist())
+            self.assertTrue(all(0.0 <= score <= 1.0 for score in scores.tolist()))
+            self.assertEqual(scores.tolist(), sorted(scores.tolist(), reverse=True))
+
+        self.assertEqual(len(loaded.query(0)[0]), 0)
+        result = benchmark_recall(loaded, self.matrix, k=2, n_probe=loaded.n_lists)
+        self.assertEqual(result['recall'], 1.0)
+        self.assertEqual(result['scanned'], 1.0)
+
+    def test_user_based_recommend_with_ann(self):
+        """
+        测试启用 ANN 后基于用户的推荐不依赖相似度表
+        """
+        UserANNIndex.build(self.matrix, dim=8, n_lists=1).save(self.directory.name)
+        UserNeighbor.objects.all().delete()
+
+        with override_settings(RECOMMENDER_USER_ANN=True, RECOMMENDER_ARTIFACT_DIR=self.directory.name):
+            recommendations = CollaborativeFiltering.user_based_recommend(self.users[0], min_similarity=0.0)
+
+        self.assertGreater(len(recommendations), 0)
+
+
+class ALSModelTestCase(RatingFixtureTestCase):
+    """
+    矩阵分解推荐测试用例
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.matrix = RatingMatrix.from_interactions(approved_only=True)
+
+    def test_train_fits_ratings(self):
+        """
+        测试 ALS 训练后能拟合已知评分，且单线程与多线程结果一致
+        """
+        model = ALSModel.train(self.matrix, factors=4, epochs=20, regularization=0.001)
+        threaded = ALSModel.train(self.matrix, factors=4, epochs=20, regularization=0.001, threads=4)
+
+        self.assertLess(model.manifest['rmse'] * 100, 5)
+        self.assertTrue((model.user_factors == threaded.user_factors).all())
+
+        user = model.user_ids.tolist().index(self.users[1].id)
+        question = model.question_ids.tolist().index(self.questions[0].id)
+        predicted = (model.user_factors[user] @ model.question_factors[question] + model.mean) * 100
+        self.assertAlmostEqual(predicted, 85, delta=5)
+
+    def test_recommend_unanswered(self):
+        """
+        测试矩阵分解推荐只推荐未答题目，且只需两次查询
+        """
+        ALSModel.train(self.matrix, factors=4, epochs=5).save(self.directory.name)
+
+        with override_settings(RECOMMENDER_ARTIFACT_DIR=self.directory.name):
+            with self.assertNumQueries(2):
+                recommendations = CollaborativeFiltering.recommend(self.users[0], 'mf', n=5)
+
+        self.assertEqual([question.id for question, _, _ in recommendations], [self.questions[3].id])
+        loaded = ALSModel.current(self.directory.name)
+        self.assertEqual(loaded.recommend(0)[0].tolist(), [])
+
+
+class WalkGraphTestCase(RatingFixtureTestCase):
+    """
+    图随机游走推荐测试用例
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_build_transitions(self):
+        """
+        测试转移矩阵按行归一化，收藏成为边，批量游走与逐个游走一致
+        """
+        Interaction.objects.create(user=self.users[0], question=self.questions[3], is_favorite=True)
+        graph = WalkGraph.build(favorite_weight=0.5)
+
+        self.assertEqual(graph.manifest['edges'], 14)
+        np.testing.assert_allclose(np.asarray(graph.user_to_question.sum(axis=1)).ravel(), 1, rtol=1e-6)
+        np.testing.assert_allclose(np.asarray(graph.question_to_user.sum(axis=1)).ravel(), 1, rtol=1e-6)
+        self.assertEqual(WalkGraph.build(favorite_weight=0).manifest['edges'], 13)
+
+        positions = graph.positions([user.id for user in self.users])
+        batch = graph.walk(positions)
+        np.testing.assert_allclose(batch.sum(axis=0), 1, rtol=1e-5)
+        for column, position in enumerate(positions):
+            np.testing.assert_allclose(batch[:, column], graph.walk(np.array([position]))[:, 0], rtol=1e-5)
+
+    def test_recommend_and_materialize(self):
+        """
+        测试图游走推荐只推荐未答题目，离线物化整批游走
+        """
+        WalkGraph.build().save(self.directory.name)
+
+        with override_settings(RECOMMENDER_ARTIFACT_DIR=self.directory.name):
+            with self.assertNumQueries(2):
+                recommendations = CollaborativeFiltering.recommend(self.users[0], 'graph', n=5)
+            self.assertEqual([question.id for question, _, _ in recommendations], [self.questions[3].id])
+            self.assertEqual(WalkGraph.current(self.directory.name).recommend(0)[0].tolist(), [])
+
+            count = RecommendationMaterializer.materialize(self.users, recommendation_type='graph', n=5)
+        self.assertEqual(count, 4)
+        served = RecommendationMaterializer.serve(self.users[0], 'graph', 5)
+        self.assertEqual([item['question'] for item in served['recommendations']], [self.questions[3].id])
+
+    def test_falls_back_without_graph(self):
+        """
+        测试没有二部图时使用热门题目
+        """
+        with override_settings(RECOMMENDER_ARTIFACT_DIR=self.directory.name):
+            recommendations = CollaborativeFiltering.graph_recommend(self.users[0], n=5)
+        self.assertEqual([reason.startswith('热门题目') for _, _, reason in recommendations], [True])
+
+
+class TransitionModelTestCase(RatingFixtureTestCase):
+    """
+    下一题转移模型测试用例
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def successors(self, model, question):
+        question_ids, probabilities = model.next_questions(question.id, 10)
+        return [(question_id, round(probability, 4)) for question_id, probability in zip(question_ids.tolist(), probabilities.tolist())]
+
+    def test_counts_transitions_in_order(self):
+        """
+        测试按答题顺序统计转移，只保留前 K 个后继
+        """
+        q0, q1, q2, q3 = [question.id for question in self.questions]
+        model = TransitionModel.build()
+
+        self.assertEqual(model.manifest['transitions'], 9)
+        self.assertEqual(self.successors(model, self.questions[1]), [(q2, 0.75), (q3, 0.25)])
+        self.assertEqual(self.successors(model, self.questions[0]), [(q1, 1.0)])
+        self.assertEqual(self.successors(model, self.questions[3]), [])
+        self.assertEqual(self.successors(TransitionModel.build(top_k=1), self.questions[1]), [(q2, 0.75)])
+
+    def test_incremental_matches_full_build(self):
+        """
+        测试从水位线增量更新与全量构建一致，跨水位线的转移不丢失，会话间隔之外的不计入
+        """
+        previous = TransitionModel.build()
+        previous.save(self.directory.name)
+        previous = TransitionModel.current(self.directory.name)
+
+        Interaction.objects.create(user=self.users[0], question=self.questions[3], score=50, is_submitted=True)
+        late = Interaction.objects.create(user=self.users[3], question=self.questions[0])
+        Interaction.objects.filter(pk=late.pk).update(created_at=late.created_at + timedelta(hours=3))
+
+        incremental = TransitionModel.build(previous)
+        full = TransitionModel.build()
+        self.assertEqual(incremental.manifest['new_interactions'], 2)
+        self.assertEqual(incremental.manifest['transitions'], 10)
+        self.assertEqual(incremental.manifest['watermark'], full.manifest['watermark'])
+        for question in self.questions:
+            self.assertEqual(self.successors(incremental, question), self.successors(full, question))
+        self.assertEqual(
+            self.successors(incremental, self.questions[2]),
+            [(self.questions[3].id, 1.0)]
+        )
+        self.assertEqual(TransitionModel.build(incremental).manifest['new_interactions'], 0)
+
+    def test_incremental_reads_late_committed_rows(self):
+        """
+        测试水位线之前、上次构建之后才提交的记录在重读窗口内补上；
+        早于该用户最后一题的迟到记录不产生反向转移，重读的记录不重复计入
+        """
+        q0, q1, q2, q3 = [question.id for question in self.questions]
+        previous = TransitionModel.build()
+        previous.save(self.directory.name)
+        previous = TransitionModel.current(self.directory.name)
+        watermark = previous.watermark
+
+        # users[0] 最后一题是 Q2，迟到记录在其之后；users[1] 的迟到记录早于其最后一题 Q3
+        following = Interaction.objects.create(user=self.users[0], question=self.questions[3])
+        Interaction.objects.filter(pk=following.pk).update(created_at=watermark - timedelta(microseconds=1))
+        last = Interaction.objects.filter(user=self.users[1]).order_by('-created_at').first()
+        reordered = Interaction.objects.create(user=self.users[1], question=self.questions[0])
+        Interaction.objects.filter(pk=reordered.pk).update(created_at=last.created_at - timedelta(microseconds=1))
+
+        incremental = TransitionModel.build(previous)
+        self.assertEqual(incremental.manifest['new_interactions'], 2)
+        self.assertEqual(incremental.manifest['late_interactions'], 1)
+        self.assertEqual(incremental.manifest['transitions'], previous.manifest['transitions'] + 1)
+        self.assertIn(q3, [question_id for question_id, _ in self.successors(incremental, self.questions[2])])
+        self.assertNotIn(q0, [question_id for question_id, _ in self.successors(incremental, self.questions[3])])
+
+        again = TransitionModel.build(incremental)
+        self.assertEqual(again.manifest['new_interactions'], 0)
+        self.assertEqual(again.manifest['transitions'], incremental.manifest['transitions'])
+
+    @override_settings(ROOT_URLCONF='recommender.urls')
+    def test_next_questions_view(self):
+        """
+        测试下一题接口默认取最近打开的题目，跳过已答题目
+        """
+        from rest_framework.test import APIClient
+
+        TransitionModel.build().save(self.directory.name)
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        with self.settings(RECOMMENDER_ARTIFACT_DIR=self.directory.name):
+            data = client.get('/recommendations/next_questions/').json()
+            self.assertEqual(data['after'], self.questions[2].id)
+            self.assertEqual([item['question']['id'] for item in data['questions']], [self.questions[3].id])
+            self.assertEqual(data['questions'][0]['probability'], 1.0)
+
+            data = client.get(f'/recommendations/next_questions/?question_id={self.questions[0].id}').json()
+            self.assertEqual(data['count'], 0)
+
+    @override_settings(ROOT_URLCONF='recommender.urls')
+    def test_next_questions_view_validates_params(self):
+        """
+        测试下一题接口对非法参数返回 400
+        """
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        for query in ('n=abc', 'n=-1', 'question_id=abc'):
+            response = client.get(f'/recommendations/next_questions/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('error', response.json())
+
+
+class OnlineRatingsTestCase(RatingFixtureTestCase):
+    """
+    在线能力 / 难度评分与自适应选题测试用例
+    """
+
+    def ratings(self):
+        return (
+            {(user_id, category_id): answered for user_id, category_id, answered in
+             SkillRating.objects.values_list('user_id', 'category_id', 'answered')},
+            {user_id: round(rating, 6) for user_id, rating in
+             SkillRating.objects.filter(category__isnull=True).values_list('user_id', 'rating')},
+            {question_id: (round(rating, 6), answered, bucket) for question_id, rating, answered, bucket in
+             QuestionRating.objects.values_list('question_id', 'rating', 'answered', 'bucket')},
+        )
+
+    def test_online_updates_match_replay(self):
+        """
+        测试评分时在线更新的结果与按时间顺序重放一致，改分不重复计入
+        """
+        online = self.ratings()
+        self.assertEqual(online[2][self.questions[1].id][1], 4)
+        self.assertEqual(len(online[0]), 8)
+
+        self.assertEqual(OnlineRatings.rebuild(), {'questions': 4, 'skills': 8, 'interactions': 13})
+        self.assertEqual(self.ratings(), online)
+
+        interaction = Interaction.objects.get(user=self.users[0], question=self.questions[0])
+        interaction.score = 10
+        interaction.save()
+        self.assertEqual(self.ratings(), online)
+
+    def test_update_direction_and_constant_queries(self):
+        """
+        测试高分提高能力、降低难度，更新的查询数与答题历史无关
+        """
+        question = Question.objects.create(
+            title='Rated', slug='rated', content='content', category=self.category, difficulty=3, is_approved=True
+        )
+        self.assertEqual(QuestionRating.objects.get(question=question).rating, 1600.0)
+        skill = OnlineRatings.skill(self.users[0].id)
+
+        with CaptureQueriesContext(connection) as first:
+            update = OnlineRatings.apply(self.users[0].id, question.id, 100)
+        self.assertGreater(update.skill, skill)
+        self.assertLess(update.difficulty, 1600.0)
+        self.assertAlmostEqual(update.expected, expected_score(skill, 1600.0))
+
+        with CaptureQueriesContext(connection) as second:
+            OnlineRatings.apply(self.users[1].id, question.id, 0)
+        self.assertEqual(len(first), len(second))
+
+    def test_next_question_matches_skill(self):
+        """
+        测试选出难度最接近目标难度的未答、已审核题目
+        """
+        user = User.objects.create_user(username='adaptive_user', password='pass')
+        category = Category.objects.create(name='Adaptive', slug='adaptive')
+        easy, medium, hard, expert = [
+            Question.objects.create(
+                title=f'Adaptive Q{difficulty}', slug=f'adaptive-q{difficulty}', content='content',
+                category=category, difficulty=difficulty, is_approved=True
+            )
+            for difficulty in range(1, 5)
+        ]
+        Question.objects.create(
+            title='Pending', slug='adaptive-pending', content='content',
+            category=category, difficulty=3, is_approved=False
+        )
+        SkillRating.objects.create(user=user, rating=1590)
+
+        pick = OnlineRatings.next_question(user.id, category.id)
+        self.assertEqual(pick.question_id, hard.id)
+        self.assertAlmostEqual(pick.target_difficulty, 1590)
+        self.assertEqual(OnlineRatings.next_question(user.id, category.id, target=0.75).question_id, medium.id)
+        self.assertEqual(
+            OnlineRatings.next_question(user.id, category.id, exclude={hard.id}).question_id, medium.id
+        )
+        self.assertEqual(
+            OnlineRatings.next_question(user.id, category.id, target=0.01).question_id, expert.id
+        )
+        self.assertIsNone(OnlineRatings.next_question(
+            user.id, category.id, exclude={easy.id, medium.id, hard.id, expert.id}
+        ))
+
+    @override_settings(ROOT_URLCONF='recommender.urls')
+    def test_adaptive_question_view(self):
+        """
+        测试自适应选题接口跳过已答题目，非法参数返回 400
+        """
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        data = client.get(f'/recommendations/adaptive_question/?category={self.category.id}').json()
+        self.assertEqual(data['question']['id'], self.questions[3].id)
+        self.assertAlmostEqual(data['skill'], OnlineRatings.skill(self.users[0].id, self.category.id))
+
+        client.force_authenticate(self.users[1])
+        data = client.get(f'/recommendations/adaptive_question/?category={self.category.id}').json()
+        self.assertIsNone(data['question'])
+
+        for query in ('category=x', 'target=abc', 'target=1.5', 'target=0', 'target=nan'):
+            response = client.get(f'/recommendations/adaptive_question/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('error', response.json())
+
+
+class TitleEncoder:
+    """
+    按题目标题返回固定向量的编码器（代替 SentenceTransformer）
+    """
+
+    VECTORS = {
+        'Engine Q0': [2.0, 0.0, 0.0],
+        'Engine Q1': [0.9, 0.1, 0.0],
+        'Engine Q2': [0.0, 1.0, 0.0],
+        'Engine Q3': [0.0, 0.6, 0.8],
+        'Engine Q4': [1.0, 0.1, 0.0],
+    }
+
+    def encode(self, texts, batch_size=64):
+        return [self.VECTORS[text.split('\n')[0]] for text in texts]
+
+
+class ContentBasedTestCase(RatingFixtureTestCase):
+    """
+    基于内容的推荐测试用例
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # 没有任何答题记录的新题目
+        self.new_question = Question.objects.create(
+            title='Engine Q4',
+            slug='engine-q4',
+            content='content',
+            category=self.category,
+            difficulty=1,
+            is_approved=True
+        )
+
+    def test_build_normalized_embeddings(self):
+        """
+        测试嵌入矩阵按题目 ID 排列且为单位向量
+        """
+        embeddings = QuestionEmbeddings.build(encoder=TitleEncoder())
+        embeddings.save(self.directory.name)
+        loaded = QuestionEmbeddings.current(self.directory.name)
+
+        self.assertEqual(loaded.question_ids.tolist(), sorted(q.id for q in self.questions + [self.new_question]))
+        self.assertEqual(loaded.vectors.dtype.name, 'float32')
+        for norm in (loaded.vectors ** 2).sum(axis=1).tolist():
+            self.assertAlmostEqual(norm, 1.0, places=5)
+
+    def test_recommend_new_question(self):
+        """
+        测试没有答题记录的新题目按内容被推荐，且只需两次查询
+        """
+        QuestionEmbeddings.build(encoder=TitleEncoder()).save(self.directory.name)
+
+        # 已答题目位图已缓存时：已答评分、题目各一次查询
+        AnsweredSet.for_user(self.users[0].id)
+        with override_settings(RECOMMENDER_ARTIFACT_DIR=self.directory.name):
+            with self.assertNumQueries(2):
+                recommendations = CollaborativeFiltering.recommend(self.users[0], 'content_based', n=5)
+
+        self.assertEqual(
+            [question.id for question, _, _ in recommendations],
+            [self.new_question.id, self.questions[3].id]
+        )
+        self.assertEqual(recommendations[0][2], f"与已答题 Q{self.questions[1].id} 内容相似")
+
+    def test_zero_score_counts_as_rated(self):
+        """
+        测试 0 分的答题记录作为已评分题目参与推荐理由，已答题目按位图跳过
+        """
+        QuestionEmbeddings.build(encoder=TitleEncoder()).save(self.directory.name)
+        Interaction.objects.filter(user=self.users[0], question=self.questions[1]).update(score=0)
+
+        with override_settings(RECOMMENDER_ARTIFACT_DIR=self.directory.name):
+            recommendations = CollaborativeFiltering.content_based_recommend(self.users[0], n=5)
+
+        self.assertEqual(
+            [question.id for question, _, _ in recommendations],
+            [self.new_question.id, self.questions[3].id]
+        )
+        self.assertEqual(recommendations[0][2], f"与已答题 Q{self.questions[1].id} 内容相似")
+
+
+class PopularityIndexTestCase(RatingFixtureTestCase):
+    """
+    热门题目索引测试用例
+    """
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        Interaction.objects.update(created_at=now - timedelta(days=1))
+        # Q1 的 4 条答题记录都在 30 天前，Q3 多一条新的浏览记录
+        Interaction.objects.filter(question=self.questions[1]).update(created_at=now - timedelta(days=30))
+        Interaction.objects.create(user=self.users[0], question=self.questions[3])
+
+    def test_decayed_ranking(self):
+        """
+        测试热度按时间衰减排序，且支持按难度分区和跳过已答题目
+        """
+        index = PopularityIndex.build()
+        q0, q1, q2, q3 = (question.id for question in self.questions)
+
+        self.assertEqual(index.top(10)[0].tolist(), [q3, q0, q2, q1])
+        self.assertEqual(index.top(2, exclude={q3, q2})[0].tolist(), [q0, q1])
+        self.assertEqual(index.top(10)[2].tolist(), [4, 3, 3, 4])
+        self.assertEqual(index.top(10, difficulty=2)[0].tolist(), [])
+        self.assertEqual(index.top(1, category=self.category.id, difficulty=1)[0].tolist(), [q3])
+
+    def test_incremental_refresh(self):
+        """
+        测试刷新时只读取新增的答题记录，结果与全量构建一致
+        """
+        previous = PopularityIndex.build()
+        Interaction.objects.create(user=self.users[2], question=self.questions[2])
+
+        with self.assertNumQueries(3):
+            index = PopularityIndex.build(previous)
+        full = PopularityIndex.build()
+
+        self.assertEqual(index.top(10)[0].tolist(), full.top(10)[0].tolist())
+        self.assertEqual(index.counts.tolist(), full.counts.tolist())
+        self.assertEqual(index.watermark, full.watermark)
+
+    def test_refresh_counts_late_committed_lower_ids(self):
+        """
+        测试 ID 低于水位线、在上次刷新之后才提交的答题记录也会计入，重读窗口内已计入的记录不重复计入
+        """
+        last_id = Interaction.objects.order_by('-id').values_list('id', flat=True).first()
+        Interaction.objects.create(id=last_id + 10, user=self.users[2], question=self.questions[2])
+        previous = PopularityIndex.build()
+
+        # 另一个事务先分配了较小的 ID，在上次刷新之后才提交
+        Interaction.objects.create(id=last_id + 5, user=self.users[1], question=self.questions[2])
+        index = PopularityIndex.build(previous)
+        full = PopularityIndex.build()
+        self.assertEqual(index.counts.tolist(), full.counts.tolist())
+        self.assertEqual(PopularityIndex.build(index).counts.tolist(), full.counts.tolist())
+
+    def test_cold_start_reads_index(self):
+        """
+        测试冷启动推荐读取缓存的热度索引，只查询一次题目
+        """
+        PopularityIndex.refresh()
+        answered = {self.questions[3].id}
+
+        with self.assertNumQueries(1):
+            recommendations = CollaborativeFiltering._popular_questions_recommend(self.users[0], 2, answered)
+
+        self.assertEqual(
+            [(question.id, reason) for question, _, reason in recommendations],
+            [(self.questions[0].id, '热门题目（3人已答）'), (self.questions[2].id, '热门题目（3人已答）')]
+        )
+
+    @override_settings(ROOT_URLCONF='recommender.urls', RECOMMENDER_MAX_RESULTS=2)
+    def test_hot_questions_view_validates_params(self):
+        """
+        测试热门题目接口对非法参数返回 400，数量超过上限时按上限返回
+        """
+        from rest_framework.test import APIClient
+
+        PopularityIndex.refresh()
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+
+        for query in ('n=abc', 'n=0', 'category=x', 'difficulty=1.5'):
+            response = client.get(f'/recommendations/hot_questions/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('error', response.json())
+
+        data = client.get('/recommendations/hot_questions/?n=1000&category=').json()
+        self.assertEqual(data['count'], 2)
+
+
+class RecommendationCacheTestCase(RatingFixtureTestCase):
+    """
+    推荐结果缓存失效与并发合并测试用例
+    """
+
+    def test_generation_bumped_on_submission(self):
+        """
+        测试提交或评分答题后缓存键变化，保存草稿不影响缓存
+        """
+        user = self.users[0]
+        key = recommendation_cache_key(user.id, 'hybrid', 10, 0.1)
+
+        with self.committed():
+            draft = Interaction.objects.create(user=user, question=self.questions[3], answer='draft')
+        self.assertEqual(recommendation_cache_key(user.id, 'hybrid', 10, 0.1), key)
+        self.assertEqual(recommendation_cache_key(self.users[1].id, 'hybrid', 10, 0.1),
+                         recommendation_cache_key(self.users[1].id, 'hybrid', 10, 0.1))
+
+        draft.is_submitted = True
+        with self.captureOnCommitCallbacks() as callbacks:
+            draft.save()
+        # 事务提交前缓存不失效
+        self.assertEqual(recommendation_cache_key(user.id, 'hybrid', 10, 0.1), key)
+        with override_settings(RECOMMENDER_JOB_WORKERS=0):
+            for callback in callbacks:
+                callback()
+        submitted_key = recommendation_cache_key(user.id, 'hybrid', 10, 0.1)
+        self.assertNotEqual(submitted_key, key)
+
+        draft.score = 70
+        with self.committed():
+            draft.save()
+        self.assertNotEqual(recommendation_cache_key(user.id, 'hybrid', 10, 0.1), submitted_key)
+
+    def test_single_flight(self):
+        """
+        测试并发未命中时只计算一次
+        """
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'value': len(calls)}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight('single-flight-test', compute)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'value': 1}] * 4)
+        self.assertEqual(single_flight('single-flight-test', compute), {'value': 1})
+
+    @override_settings(ROOT_URLCONF='recommender.urls')
+    def test_view_recomputes_after_answer(self):
+        """
+        测试推荐接口命中缓存，用户答题后重新计算
+        """
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        url = '/recommendations/generate_recommendations/?type=item_based&min_similarity=0'
+
+        first = client.get(url).json()
+        self.assertEqual([item['question'] for item in first['recommendations']], [self.questions[3].id])
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url).json(), first)
+
+        with self.committed():
+            Interaction.objects.create(user=self.users[0], question=self.questions[3], score=50, is_submitted=True)
+        self.assertEqual(client.get(url).json()['count'], 0)
+
+    @override_settings(ROOT_URLCONF='recommender.urls')
+    def test_view_skips_answered_with_materialized_row(self):
+        """
+        测试存在物化推荐时，用户提交答题后接口不再返回刚答过的题目
+        """
+        from rest_framework.test import APIClient
+
+        RecommendationMaterializer.materialize(
+            [self.users[0]], recommendation_type='item_based', n=10, min_similarity=0.0
+        )
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        url = '/recommendations/generate_recommendations/?type=item_based&min_similarity=0.0'
+
+        first = client.get(url).json()
+        self.assertEqual(first['source'], 'materialized')
+        self.assertEqual([item['question'] for item in first['recommendations']], [self.questions[3].id])
+
+        draft = Interaction.objects.create(user=self.users[0], question=self.questions[3], answer='draft')
+        self.assertEqual(client.get(url).json()['source'], 'materialized')
+
+        draft.is_submitted = True
+        with self.committed():
+            draft.save()
+        result = client.get(url).json()
+        self.assertNotIn(self.questions[3].id, [item['question'] for item in result['recommendations']])
+        self.assertNotEqual(result.get('source'), 'materialized')
+
+
+# 多进程共享的缓存（异步模式要求任务记录能被其他 worker 进程读取）
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='recommender-jobs-'),
+    }
+}
+
+
+@override_settings(ROOT_URLCONF='recommender.urls', RECOMMENDER_JOB_WORKERS=0)
+class RecommendationJobsTestCase(RatingFixtureTestCase):
+    """
+    异步推荐任务测试用例（同步执行模式）
+    """
+
+    def test_submit_and_dedupe(self):
+        """
+        测试任务结果与同步接口一致，重复提交返回同一任务
+        """
+        user = self.users[0]
+        job = RecommendationJobs.submit(user, 'item_based', 10, 0)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual([item['question'] for item in job['result']['recommendations']], [self.questions[3].id])
+        self.assertEqual(RecommendationJobs.get(job['job_id']), job)
+        self.assertEqual(RecommendationJobs.submit(user, 'item_based', 10, 0)['job_id'], job['job_id'])
+
+        # 用户答题后缓存代数变化，提交新任务
+        with self.committed():
+            Interaction.objects.create(user=user, question=self.questions[3], score=50, is_submitted=True)
+        self.assertNotEqual(RecommendationJobs.submit(user, 'item_based', 10, 0)['job_id'], job['job_id'])
+
+    def test_failed_job_can_be_resubmitted(self):
+        """
+        测试失败的任务记录错误并释放去重占位
+        """
+        failed = RecommendationJobs.submit(self.users[0], 'unknown', 10, 0)
+        self.assertEqual(failed['status'], 'failed')
+        self.assertTrue(failed['error'])
+        self.assertNotEqual(RecommendationJobs.submit(self.users[0], 'unknown', 10, 0)['job_id'], failed['job_id'])
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_job_status_view(self):
+        """
+        测试异步接口返回任务 ID，只有任务所属用户可以查询
+        """
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.get('/recommendations/generate_recommendations/?type=item_based&min_similarity=0&async=true')
+        job_id = response.json()['job_id']
+
+        status = client.get(f'/recommendations/job_status/?job_id={job_id}').json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['result']['count'], 1)
+        self.assertEqual(client.get('/recommendations/job_status/?job_id=missing').status_code, 404)
+
+        client.force_authenticate(self.users[1])
+        self.assertEqual(client.get(f'/recommendations/job_status/?job_id={job_id}').status_code, 404)
+
+    def test_generate_view_validates_params(self):
+        """
+        测试推荐接口对非法参数返回 400，缓存只在本进程内可见时拒绝异步模式
+        """
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        for query in ('n=abc', 'n=0', 'min_similarity=abc', 'min_similarity=nan'):
+            response = client.get(f'/recommendations/generate_recommendations/?type=item_based&{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+        response = client.get('/recommendations/generate_recommendations/?type=item_based&async=true')
+        self.assertEqual(response.status_code, 400)
+
+        with override_settings(CACHES=SHARED_CACHES, RECOMMENDER_MAX_RESULTS=5):
+            response = client.get('/recommendations/generate_recommendations/?type=item_based&n=100000&async=true')
+            self.assertEqual(RecommendationJobs.get(response.json()['job_id'])['n'], 5)
+
+
+@override_settings(ROOT_URLCONF='recommender.urls', RECOMMENDER_JOB_WORKERS=1, CACHES=SHARED_CACHES)
+class RecommendationJobThreadTestCase(TransactionTestCase):
+    """
+    异步推荐任务测试用例（线程池执行，数据需要提交后才能被工作线程读取）
+    """
+
+    def setUp(self):
+        RatingFixtureTestCase.setUp(self)
+
+    def test_job_runs_in_background(self):
+        """
+        测试请求立即返回 202，轮询任务状态直到完成
+        """
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.get('/recommendations/generate_recommendations/?type=item_based&min_similarity=0&async=true')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            job = client.get(f'/recommendations/job_status/?job_id={job_id}').json()
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual([item['question'] for item in job['result']['recommendations']], [self.questions[3].id])
+
+        # 结果已缓存：同步接口直接命中
+        sync = client.get('/recommendations/generate_recommendations/?type=item_based&min_similarity=0').json()
+        self.assertEqual(sync, job['result'])
+
+
+class AnsweredSetTestCase(RatingFixtureTestCase):
+    """
+    已答题目位图测试用例
+    """
+
+    def test_bitmap_operations(self):
+        """
+        测试位图的构建、查询、置位与序列化
+        """
+        answered = AnsweredSet.from_ids([3, 17, 17, 64])
+        self.assertEqual(len(answered), 3)
+        self.assertEqual(answered.contains(np.array([0, 3, 16, 17, 64, 65, 10 ** 6])).tolist(),
+                         [False, True, False, True, True, False, False])
+        self.assertTrue(answered.add(200))
+        self.assertFalse(answered.add(3))
+        self.assertIn(200, answered)
+        self.assertEqual(AnsweredSet.loads(answered.dumps()).ids().tolist(), [3, 17, 64, 200])
+        self.assertEqual(len(AnsweredSet.from_ids([])), 0)
+        self.assertEqual(exclusion_mask(np.array([3, 4]), {4}).tolist(), [False, True])
+
+    def test_cached_and_updated_on_submission(self):
+        """
+        测试位图缓存后不再查询，提交答题时增量置位，删除答题记录后重新构建
+        """
+        user = self.users[0]
+        self.assertEqual(AnsweredSet.for_user(user.id).ids().tolist(), [q.id for q in self.questions[:3]])
+
+        with self.committed():
+            interaction = Interaction.objects.create(user=user, question=self.questions[3], answer='draft')
+            interaction.is_submitted = True
+            interaction.save()
+        with self.assertNumQueries(0):
+            answered = AnsweredSet.for_user(user.id)
+        self.assertEqual(len(answered), 4)
+        self.assertIn(self.questions[3].id, answered)
+
+        with self.committed():
+            interaction.delete()
+        self.assertNotIn(self.questions[3].id, AnsweredSet.for_user(user.id))
+
+    def test_recommenders_skip_answered(self):
+        """
+        测试推荐结果不包含已提交但未评分的题目
+        """
+        user = self.users[0]
+        self.assertEqual(
+            [question.id for question, _, _ in CollaborativeFiltering.item_based_recommend(user, 10, 0)],
+            [self.questions[3].id]
+        )
+        with self.committed():
+            Interaction.objects.create(user=user, question=self.questions[3], answer='pending', is_submitted=True)
+        self.assertEqual(CollaborativeFiltering.item_based_recommend(user, 10, 0), [])
+        self.assertNotIn(
+            self.questions[3].id,
+            [question.id for question, _, _ in CollaborativeFiltering.user_based_recommend(user, 10, 0)]
+        )
+
+    def test_rolled_back_submission_not_recorded(self):
+        """
+        测试回滚的提交不会在已缓存的位图中置位
+        """
+        user = self.users[0]
+        AnsweredSet.for_user(user.id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                Interaction.objects.create(user=user, question=self.questions[3], is_submitted=True)
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertNotIn(self.questions[3].id, AnsweredSet.for_user(user.id))
+
+
+def _static_generator(name, results, weight=1.0, delay=0.0, budget_ms=None):
+    def generate(user, n, min_similarity):
+        time.sleep(delay)
+        if results is None:
+            raise RuntimeError('generator failed')
+        return results[:n]
+    return CandidateGenerator(name, generate, weight, name, budget_ms=budget_ms)
+
+
+class RecommendationPipelineTestCase(RatingFixtureTestCase):
+    """
+    推荐流水线测试用例（事务中依次执行）
+    """
+
+    def test_merge_strategies(self):
+        """
+        测试按权重累加与按名次倒数累加的合并结果
+        """
+        q0, q1, q2 = self.questions[:3]
+        candidates = [
+            (_static_generator('a', [], weight=0.5), [(q0, 1.0, 'x'), (q1, 0.2, 'y')]),
+            (_static_generator('b', [], weight=1.0), [(q1, 0.9, 'z'), (q2, 0.1, 'w')]),
+        ]
+        merged = weighted_sum_merge(candidates, 2)
+        self.assertEqual([(question.id, round(score, 6)) for question, score, _ in merged], [(q1.id, 1.0), (q0.id, 0.5)])
+        self.assertEqual(merged[0][2], 'a: y; b: z')
+        self.assertEqual([question.id for question, _, _ in reciprocal_rank_merge(candidates, 3)], [q1.id, q2.id, q0.id])
+
+    def test_budgets_and_failures(self):
+        """
+        测试超时与出错的生成器被丢弃，不可用的生成器被跳过
+        """
+        unavailable = _static_generator('missing', [])._replace(available=lambda: False)
+        result = RecommendationPipeline.run(self.users[0], 5, generators=[
+            _static_generator('fast', [(self.questions[3], 1.0, 'fast')]),
+            _static_generator('slow', [(self.questions[2], 9.0, 'slow')], delay=0.1, budget_ms=50),
+            _static_generator('broken', None),
+            unavailable,
+        ])
+        self.assertEqual([question.id for question, _, _ in result.recommendations], [self.questions[3].id])
+        self.assertEqual(
+            {name: stage['status'] for name, stage in result.stages.items()},
+            {'fast': 'ok', 'slow': 'timeout', 'broken': 'error', 'missing': 'skipped'}
+        )
+        self.assertEqual(result.stages['fast']['candidates'], 1)
+
+    @override_settings(ROOT_URLCONF='recommender.urls')
+    def test_hybrid_response_metadata(self):
+        """
+        测试混合推荐默认只使用基于用户和基于物品的召回（各 0.5），响应包含各阶段耗时
+        """
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        data = client.get('/recommendations/generate_recommendations/?type=hybrid&min_similarity=0').json()
+
+        self.assertEqual([item['question'] for item in data['recommendations']], [self.questions[3].id])
+        stages = data['pipeline']['stages']
+        self.assertEqual({name: stage['status'] for name, stage in stages.items()}, {'user_based': 'ok', 'item_based': 'ok'})
+        self.assertEqual([generator.weight for generator in RecommendationPipeline.generators()], [0.5, 0.5])
+        self.assertGreaterEqual(data['pipeline']['total_ms'], data['pipeline']['merge_ms'])
+
+    @override_settings(
+        ROOT_URLCONF='recommender.urls',
+        RECOMMENDER_PIPELINE_GENERATORS=['user_based', 'item_based', 'popularity', 'content_based']
+    )
+    def test_opt_in_generators(self):
+        """
+        测试通过配置启用热门与基于内容的召回，没有嵌入矩阵时跳过基于内容的召回
+        """
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        with self.settings(RECOMMENDER_ARTIFACT_DIR=tempfile.mkdtemp()):
+            data = client.get('/recommendations/generate_recommendations/?type=hybrid&min_similarity=0').json()
+
+        stages = data['pipeline']['stages']
+        self.assertEqual(stages['content_based']['status'], 'skipped')
+        for name in ('user_based', 'item_based', 'popularity'):
+            self.assertEqual(stages[name]['status'], 'ok')
+
+
+class RecommendationPipelineThreadTestCase(TransactionTestCase):
+    """
+    推荐流水线测试用例（线程池并发执行）
+    """
+
+    def test_generators_run_concurrently(self):
+        """
+        测试生成器并发执行，请求只等待到最短的截止时间
+        """
+        questions = [Question(id=i, title=f'Q{i}') for i in range(1, 4)]
+        started = time.perf_counter()
+        result = RecommendationPipeline.run(User(id=1), 5, generators=[
+            _static_generator('first', [(questions[0], 1.0, 'a')], delay=0.2),
+            _static_generator('second', [(questions[1], 2.0, 'b')], delay=0.2),
+            _static_generator('stalled', [(questions[2], 3.0, 'c')], delay=1.0, budget_ms=300),
+        ])
+        elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual([question.id for question, _, _ in result.recommendations], [2, 1])
+        self.assertEqual(result.stages['stalled']['status'], 'timeout')
+
+    def test_timed_out_generator_not_resubmitted(self):
+        """
+        测试超时的调用仍在运行时，同一用户的后续请求跳过该生成器而不是再占用一个线程，
+        其他用户不受影响，直到该生成器的超时调用达到上限
+        """
+        question = Question(id=1, title='Q1')
+        generators = [_static_generator('hung', [(question, 1.0, 'a')], delay=0.5, budget_ms=50)]
+
+        with override_settings(RECOMMENDER_PIPELINE_WORKERS=4):
+            first = RecommendationPipeline.run(User(id=1), 5, generators=generators)
+            second = RecommendationPipeline.run(User(id=1), 5, generators=generators)
+            other = RecommendationPipeline.run(User(id=2), 5, generators=generators)
+            limited = RecommendationPipeline.run(User(id=3), 5, generators=generators)
+        self.assertEqual(first.stages['hung']['status'], 'timeout')
+        self.assertEqual(second.stages['hung']['status'], 'skipped')
+        self.assertEqual(other.stages['hung']['status'], 'timeout')
+        self.assertEqual(limited.stages['hung']['status'], 'skipped')
+
+        time.sleep(0.6)
+        third = RecommendationPipeline.run(User(id=1), 5, generators=generators)
+        self.assertEqual(third.stages['hung']['status'], 'timeout')
+
+
+class UserPreferenceBuilderTestCase(RatingFixtureTestCase):
+    """
+    用户偏好批量构建测试用例
+    """
+
+    def setUp(self):
+        super().setUp()
+        weak = Category.objects.create(name='Weak', slug='weak')
+        question = Question.objects.create(
+            title='Weak Q',
+            slug='weak-q',
+            content='content',
+            category=weak,
+            difficulty=3,
+            is_approved=True
+        )
+        Interaction.objects.create(user=self.users[0], question=question, score=30, is_submitted=True)
+
+    def test_build_all_users(self):
+        """
+        测试两次分组查询计算所有用户的偏好
+        """
+        with CaptureQueriesContext(connection) as queries:
+            count = UserPreferenceBuilder.build()
+
+        self.assertEqual(count, 4)
+        selects = [query for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 2)
+
+        preference = UserPreference.objects.get(user=self.users[0])
+        self.assertEqual(preference.total_answered, 4)
+        self.assertAlmostEqual(preference.avg_score, 60.0)
+        self.assertEqual(preference.preferred_categories['Engine']['count'], 3)
+        self.assertAlmostEqual(preference.preferred_categories['Engine']['avg_score'], 70.0)
+        self.assertAlmostEqual(preference.preferred_categories['Weak']['weight'], 0.3)
+        self.assertEqual(preference.weak_areas, ['Weak'])
+        self.assertEqual(preference.strong_areas, [])
+        self.assertEqual(preference.preferred_difficulty['1']['count'], 3)
+        self.assertEqual(preference.preferred_difficulty['3']['count'], 1)
+
+        self.assertAlmostEqual(UserPreference.objects.get(user=self.users[1]).avg_score, 61.25)
+
+    def test_update_existing_preference(self):
+        """
+        测试单个用户更新时覆盖已有的偏好记录
+        """
+        UserPreferenceBuilder.build()
+        Interaction.objects.filter(user=self.users[3]).update(score=90)
+
+        CollaborativeFiltering.update_user_preferences(self.users[3])
+
+        preference = UserPreference.objects.get(user=self.users[3])
+        self.assertEqual(UserPreference.objects.count(), 4)
+        self.assertAlmostEqual(preference.avg_score, 90.0)
+        self.assertEqual(preference.strong_areas, ['Engine'])
+
+
+@override_settings(ROOT_URLCONF='recommender.urls', RECOMMENDER_INCREMENTAL_SIMILARITY=False)
+class TelemetryTestCase(RatingFixtureTestCase):
+    """
+    构建与服务遥测测试用例
+    """
+
+    def test_similarity_rebuild_records_build(self):
+        """
+        测试全量重建写入构建记录（实体对数与水位线），只重建单个用户时不记录
+        """
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2)
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=2, target_user=self.users[0])
+
+        record = BuildRecord.objects.get(kind='user_similarity')
+        self.assertEqual(record.status, 'ok')
+        self.assertEqual(record.rows_written, UserSimilarity.objects.active().count())
+        self.assertEqual(record.pairs_evaluated + record.pairs_pruned, 6)
+        self.assertEqual(record.watermark, Interaction.objects.order_by('-created_at').first().created_at)
+        self.assertEqual(record.details['entities'], 4)
+
+        status = BuildTelemetry.status()['user_similarity']
+        self.assertEqual(status['interactions_since'], 0)
+        self.assertFalse(status['stale'])
+        self.assertIsNone(BuildTelemetry.status()['mf']['last_build'])
+
+        Interaction.objects.create(user=self.users[0], question=self.questions[3], score=50, is_submitted=True)
+        self.assertEqual(BuildTelemetry.status()['user_similarity']['interactions_since'], 1)
+
+    @override_settings(RECOMMENDER_TELEMETRY_KEEP_BUILDS=3)
+    def test_failed_slow_and_pruned_builds(self):
+        """
+        测试失败构建照常抛出异常并记录，耗时超过中位数两倍时标记变慢，只保留最近的记录
+        """
+        with self.assertRaises(RuntimeError):
+            with BuildTelemetry.record('mf'):
+                raise RuntimeError('no ratings')
+        status = BuildTelemetry.status(['mf'])['mf']
+        self.assertEqual(status['last_status'], 'failed')
+        self.assertEqual(status['last_error'], 'no ratings')
+        self.assertIsNone(status['last_build'])
+
+        now = timezone.now()
+        for minutes, duration in [(30, 100.0), (20, 120.0), (10, 500.0)]:
+            BuildRecord.objects.create(kind='ann', started_at=now - timedelta(minutes=minutes), duration_ms=duration)
+        status = BuildTelemetry.status(['ann'])['ann']
+        self.assertEqual(status['median_duration_ms'], 110.0)
+        self.assertTrue(status['slow'])
+
+        with BuildTelemetry.record('ann') as run:
+            run.rows_written = 4
+        self.assertEqual(BuildRecord.objects.filter(kind='ann').count(), 3)
+        self.assertFalse(BuildRecord.objects.filter(kind='ann', duration_ms=100.0).exists())
+
+    def test_serving_counters_and_admin_endpoint(self):
+        """
+        测试缓存命中率、延迟直方图与热门回退率的统计，以及管理员遥测接口
+        """
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        url = '/recommendations/generate_recommendations/?type=item_based&min_similarity=0'
+        client.get(url)
+        client.get(url)
+
+        newcomer = User.objects.create_user(username='telemetry_newcomer', password='pass')
+        CollaborativeFiltering.user_based_recommend(newcomer, n=5)
+        fallback = CollaborativeFiltering.item_based_recommend(newcomer, n=5)
+        self.assertTrue(fallback)
+        self.assertTrue(all(reason.startswith('热门题目') for _, _, reason in fallback))
+
+        serving = ServingTelemetry.snapshot()
+        self.assertEqual(serving['item_based']['lookups'], 2)
+        self.assertEqual(serving['item_based']['cache_hit_ratio'], 0.5)
+        self.assertEqual(serving['item_based']['requests'], 2)
+        self.assertEqual(sum(serving['item_based']['latency_histogram'].values()), 2)
+        self.assertIsNotNone(serving['item_based']['avg_latency_ms'])
+        self.assertEqual(serving['user_based']['fallback_rate'], 1.0)
+        # 相似度矩阵尚未构建：缓存未命中时的实时计算与新用户的调用都回退到热门题目
+        self.assertEqual((serving['item_based']['runs'], serving['item_based']['fallbacks']), (2, 2))
+        self.assertIsNone(serving['mf']['cache_hit_ratio'])
+
+        self.assertEqual(client.get('/system/telemetry/').status_code, 403)
+
+        admin = User.objects.create_user(username='telemetry_admin', password='pass', is_staff=True)
+        client.force_authenticate(admin)
+        data = client.get('/system/telemetry/').json()
+        self.assertIn('user_similarity', data['builds'])
+        self.assertEqual(data['serving']['item_based']['requests'], 2)
+
+        self.assertEqual(client.post('/system/reset_telemetry/').status_code, 200)
+        self.assertEqual(ServingTelemetry.snapshot()['item_based']['requests'], 0)
+
+    def test_pairs_pruned_below_min_common(self):
+        """
+        测试跳过的实体对数为共同评分数不足 min_common 的候选对数，状态检查命令按同一口径输出
+        """
+        matrix = RatingMatrix.from_interactions()
+        common = {(stats.a, stats.b): stats.common for stats in SimilarityEngine.user_similarities(matrix, 3)}
+        SimilarityEngine.rebuild_user_similarities(min_common_questions=3)
+
+        record = BuildRecord.objects.get(kind='user_similarity')
+        self.assertEqual(record.pairs_evaluated, sum(1 for count in common.values() if count >= 3))
+        self.assertEqual(record.pairs_pruned, 6 - record.pairs_evaluated)
+        self.assertEqual((record.pairs_evaluated, record.pairs_pruned), (3, 3))
+
+        out = io.StringIO()
+        call_command('check_recommender_status', '--telemetry-only', stdout=out)
+        self.assertIn('计算 3 对 / 共同评分不足 3 跳过 3 对', out.getvalue())
+
+    def test_check_recommender_status_command(self):
+        """
+        测试状态检查命令输出构建与服务遥测
+        """
+        SimilarityEngine.rebuild_question_similarities(min_common_users=2)
+        ServingTelemetry.record_lookup('hybrid', 'cache')
+
+        out = io.StringIO()
+        call_command('check_recommender_status', stdout=out)
+        output = out.getvalue()
+        self.assertIn('question_similarity', output)
+        self.assertIn('user_similarity: 尚无构建记录', output)
+        self.assertIn('hybrid', output)
+
+
+class BenchmarkTestCase(TestCase):
+    """
+    合成数据集与性能测试报告测试用例
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.spec = DatasetSpec(users=30, questions=12, interactions=200, categories=3, prefix='tbench')
+
+    def test_generate_dataset(self):
+        """
+        测试按参数生成数据，每个 (用户, 题目) 至多一条记录，并可按前缀删除
+        """
+        result = generate_dataset(self.spec)
+
+        self.assertEqual(result['users'], 30)
+        self.assertEqual(result['questions'], 12)
+        self.assertEqual(result['interactions'], 200)
+        interactions = Interaction.objects.filter(user__username__startswith='tbench')
+        self.assertEqual(interactions.count(), 200)
+        self.assertEqual(interactions.values('user_id', 'question_id').distinct().count(), 200)
+        self.assertEqual(interactions.values('user_id').distinct().count(), 30)
+
+        clear_dataset('tbench')
+        self.assertFalse(User.objects.filter(username__startswith='tbench').exists())
+        self.assertFalse(Interaction.objects.exists())
+
+    def test_run_benchmark_report(self):
+        """
+        测试报告包含重建耗时、各推荐的延迟分位数与查询数
+        """
+        generate_dataset(self.spec)
+
+        report = run_benchmark(sample=5, prefix='tbench')
+
+        self.assertEqual(report['dataset']['interactions'], 200)
+        self.assertGreater(report['similarity']['user']['pairs'], 0)
+        self.assertGreater(report['similarity']['question']['queries'], 0)
+        for name in ('user_based', 'item_based', 'hybrid'):
+            stats = report['recommenders'][name]
+            self.assertEqual(stats['samples'], 5)
+            self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+            self.assertGreater(stats['queries_max'], 0)
+        self.assertIn('peak_rss_mb', report)
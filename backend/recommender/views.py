@@ -1,8 +1,9 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from typing import Optional
+from django.conf import settings
 from django.db.models import Q
-from django.core.cache import cache
 from .models import UserSimilarity, QuestionSimilarity, Recommendation, UserPreference
 from .serializers import (
     UserSimilaritySerializer,
@@ -11,18 +12,94 @@ from .serializers import (
     UserPreferenceSerializer
 )
 from .algorithms import CollaborativeFiltering
+from .answered import AnsweredSet
+from .generation import SUPPORTED_TYPES, generate_recommendations, lookup_recommendations
+from .jobs import DONE, FAILED, RecommendationJobs
+from .popularity import PopularityIndex
+from .sequence import TransitionModel
+from .ratings import OnlineRatings
+from .telemetry import BuildTelemetry, ServingTelemetry
+from .preferences import UserPreferenceBuilder
+from .matrix import SimilarityEngine
+from .generations import RebuildInProgress
+from .incremental import IncrementalSimilarity
 from practice.models import Interaction
 from questions.models import Question
+from questions.serializers import QuestionSerializer
+from users.models import User
+import math
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 列表类接口单次返回数量的默认上限
+DEFAULT_MAX_RESULTS = 100
+
+
+class InvalidParameter(ValueError):
+    """
+    查询参数格式错误，视图返回 400
+    """
+
+
+def _int_param(request, name: str, default=None, minimum: Optional[int] = None):
+    """
+    读取整数查询参数，缺省或为空时返回 default
+
+    Raises:
+        InvalidParameter: 不是整数或小于 minimum
+    """
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise InvalidParameter(f'参数 {name} 必须是整数')
+    if minimum is not None and value < minimum:
+        raise InvalidParameter(f'参数 {name} 不能小于 {minimum}')
+    return value
+
+
+def _float_param(request, name: str, default=None):
+    """
+    读取浮点数查询参数，缺省或为空时返回 default
+
+    Raises:
+        InvalidParameter: 不是有限的数值
+    """
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = float(value)
+    except ValueError:
+        raise InvalidParameter(f'参数 {name} 必须是数值')
+    if not math.isfinite(value):
+        raise InvalidParameter(f'参数 {name} 必须是数值')
+    return value
+
+
+def _result_count(request, default: int) -> int:
+    """
+    读取数量参数 n（至少为 1），超过 RECOMMENDER_MAX_RESULTS 时按上限处理
+    """
+    return min(
+        _int_param(request, 'n', default, minimum=1),
+        getattr(settings, 'RECOMMENDER_MAX_RESULTS', DEFAULT_MAX_RESULTS)
+    )
+
+
+def _invalid(error: InvalidParameter) -> Response:
+    return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
 
 class UserSimilarityViewSet(viewsets.ReadOnlyModelViewSet):
     """
     用户相似度视图集
     """
-    queryset = UserSimilarity.objects.all()
+    queryset = UserSimilarity.objects.active()
     serializer_class = UserSimilaritySerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -46,10 +123,13 @@ class UserSimilarityViewSet(viewsets.ReadOnlyModelViewSet):
         user = request.user
 
         try:
-            updated_count = CollaborativeFiltering.update_user_similarities(
-                target_user=user,
-                min_common_questions=2
-            )
+            # 优先用已保存的统计量刷新，O(邻居数)；尚未建立相似度时再计算该用户的一行
+            updated_count = IncrementalSimilarity.refresh_user(user.id, min_common=2)
+            if not updated_count:
+                updated_count = CollaborativeFiltering.update_user_similarities(
+                    target_user=user,
+                    min_common_questions=2
+                )
             return Response({
                 'message': f'成功更新 {updated_count} 条用户相似度记录',
                 'updated_count': updated_count
@@ -65,7 +145,7 @@ class QuestionSimilarityViewSet(viewsets.ReadOnlyModelViewSet):
     """
     题目相似度视图集
     """
-    queryset = QuestionSimilarity.objects.all()
+    queryset = QuestionSimilarity.objects.active()
     serializer_class = QuestionSimilaritySerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -94,10 +174,12 @@ class QuestionSimilarityViewSet(viewsets.ReadOnlyModelViewSet):
         try:
             if question_id:
                 question = Question.objects.get(id=question_id)
-                updated_count = CollaborativeFiltering.update_question_similarities(
-                    target_question=question,
-                    min_common_users=2
-                )
+                updated_count = IncrementalSimilarity.refresh_question(question.id, min_common=2)
+                if not updated_count:
+                    updated_count = CollaborativeFiltering.update_question_similarities(
+                        target_question=question,
+                        min_common_users=2
+                    )
             else:
                 updated_count = CollaborativeFiltering.update_question_similarities(
                     min_common_users=2
@@ -112,6 +194,8 @@ class QuestionSimilarityViewSet(viewsets.ReadOnlyModelViewSet):
                 {'error': '题目不存在'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except RebuildInProgress as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response(
                 {'error': str(e)},
@@ -157,76 +241,192 @@ class RecommendationViewSet(viewsets.ModelViewSet):
         """
         生成推荐题目
         参数：
-        - type: 推荐类型 (user_based, item_based, hybrid)
-        - n: 推荐数量，默认 10
+        - type: 推荐类型 (user_based, item_based, hybrid, mf, content_based, graph)
+        - n: 推荐数量，默认 10，最多 RECOMMENDER_MAX_RESULTS
         - min_similarity: 最小相似度，默认 0.1
+        - async: 为 true 时提交后台任务并立即返回任务 ID，用 job_status 查询结果，默认 false（需要共享缓存）
         """
         user = request.user
         recommendation_type = request.query_params.get('type', 'hybrid')
-        n = int(request.query_params.get('n', 10))
-        min_similarity = float(request.query_params.get('min_similarity', 0.1))
-
-        # 检查缓存
-        cache_key = f'recommendations_{user.id}_{recommendation_type}_{n}_{min_similarity}'
-        cached_result = cache.get(cache_key)
+        try:
+            n = _result_count(request, 10)
+            min_similarity = _float_param(request, 'min_similarity', 0.1)
+        except InvalidParameter as e:
+            return _invalid(e)
 
-        if cached_result:
-            logger.info(f"Returning cached recommendations for user {user.id}")
-            return Response(cached_result)
+        if recommendation_type not in SUPPORTED_TYPES:
+            return Response(
+                {'error': '不支持的推荐类型'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        try:
-            if recommendation_type == 'user_based':
-                recommendations = CollaborativeFiltering.user_based_recommend(
-                    user, n, min_similarity
-                )
-            elif recommendation_type == 'item_based':
-                recommendations = CollaborativeFiltering.item_based_recommend(
-                    user, n, min_similarity
-                )
-            elif recommendation_type == 'hybrid':
-                recommendations = CollaborativeFiltering.hybrid_recommend(
-                    user, n
-                )
-            else:
+        if request.query_params.get('async', 'false').lower() == 'true':
+            if not RecommendationJobs.shared_cache():
                 return Response(
-                    {'error': '不支持的推荐类型'},
+                    {'error': '异步模式需要所有进程共享的缓存（例如 Redis），当前缓存只在本进程内可见'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            job = RecommendationJobs.submit(user, recommendation_type, n, min_similarity)
+            return Response(
+                self._job_data(job),
+                status=status.HTTP_200_OK if job['status'] == DONE else status.HTTP_202_ACCEPTED
+            )
 
-            # 保存推荐记录
-            saved_recommendations = []
-            for question, score, reason in recommendations:
-                rec, created = Recommendation.objects.update_or_create(
-                    user=user,
-                    question=question,
-                    recommendation_type=recommendation_type,
-                    defaults={
-                        'score': score,
-                        'reason': reason
-                    }
+        # 缓存（键中包含用户的缓存代数，用户答题后自动失效）或离线物化的推荐列表，都没有时才实时计算
+        started = time.perf_counter()
+        result = lookup_recommendations(user, recommendation_type, n, min_similarity)
+        if result is None:
+            try:
+                result = generate_recommendations(user, recommendation_type, n, min_similarity)
+            except Exception as e:
+                logger.error(f"Error generating recommendations for user {user.id}: {e}", exc_info=True)
+                return Response(
+                    {'error': str(e)},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
-                saved_recommendations.append(rec)
-
-            # 返回推荐结果
-            serializer = self.get_serializer(saved_recommendations, many=True)
-            result = {
-                'recommendations': serializer.data,
-                'count': len(saved_recommendations),
-                'type': recommendation_type
-            }
-
-            # 缓存结果（1小时）
-            cache.set(cache_key, result, timeout=3600)
 
-            logger.info(f"Generated {len(saved_recommendations)} recommendations for user {user.id}")
-            return Response(result)
+        ServingTelemetry.record_request(recommendation_type, (time.perf_counter() - started) * 1000)
+        return Response(result)
 
-        except Exception as e:
-            logger.error(f"Error generating recommendations for user {user.id}: {e}", exc_info=True)
+    @action(detail=False, methods=['get'])
+    def job_status(self, request):
+        """
+        查询异步推荐任务的状态与结果
+        参数：
+        - job_id: generate_recommendations?async=true 返回的任务 ID
+        """
+        job = RecommendationJobs.get(request.query_params.get('job_id', ''))
+        if job is None or job['user_id'] != request.user.id:
             return Response(
-                {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': '任务不存在或已过期'},
+                status=status.HTTP_404_NOT_FOUND
             )
+        return Response(self._job_data(job))
+
+    @staticmethod
+    def _job_data(job: dict) -> dict:
+        data = {key: job[key] for key in ('job_id', 'status', 'type', 'created_at', 'finished_at')}
+        if job['status'] == DONE:
+            data['result'] = job['result']
+        elif job['status'] == FAILED:
+            data['error'] = job['error']
+        return data
+
+    @action(detail=False, methods=['get'])
+    def hot_questions(self, request):
+        """
+        热门题目（按时间衰减的热度排序）
+        参数：
+        - n: 数量，默认 10，最多 RECOMMENDER_MAX_RESULTS
+        - category: 分类 ID，可选
+        - difficulty: 难度，可选
+        - exclude_answered: 是否跳过已答题目，默认 false
+        """
+        try:
+            n = _result_count(request, 10)
+            category = _int_param(request, 'category')
+            difficulty = _int_param(request, 'difficulty')
+        except InvalidParameter as e:
+            return _invalid(e)
+
+        answered_questions = ()
+        if request.query_params.get('exclude_answered', 'false').lower() == 'true':
+            answered_questions = AnsweredSet.for_user(request.user.id)
+
+        question_ids, scores, counts = PopularityIndex.current().top(
+            n,
+            answered_questions,
+            category=category,
+            difficulty=difficulty
+        )
+        questions = Question.objects.select_related('category').in_bulk(question_ids.tolist())
+
+        results = [
+            {
+                'question': QuestionSerializer(questions[question_id], context={'request': request}).data,
+                'popularity': score,
+                'answer_count': count
+            }
+            for question_id, score, count in zip(question_ids.tolist(), scores.tolist(), counts.tolist())
+            if question_id in questions
+        ]
+        return Response({'questions': results, 'count': len(results)})
+
+    @action(detail=False, methods=['get'])
+    def next_questions(self, request):
+        """
+        下一题推荐（按练习顺序的题目转移模型，只需一次二分查找）
+        参数：
+        - question_id: 刚完成的题目 ID，默认取当前用户最近打开的题目
+        - n: 数量，默认 5，最多 RECOMMENDER_MAX_RESULTS
+        """
+        try:
+            n = _result_count(request, 5)
+            question_id = _int_param(request, 'question_id')
+        except InvalidParameter as e:
+            return _invalid(e)
+        if question_id is None:
+            question_id = Interaction.objects.filter(user=request.user).order_by(
+                '-created_at', '-id'
+            ).values_list('question_id', flat=True).first()
+        if question_id is None:
+            return Response({'after': None, 'questions': [], 'count': 0})
+
+        model = TransitionModel.current()
+        if model is None:
+            return Response({'after': question_id, 'questions': [], 'count': 0})
+
+        question_ids, probabilities = model.next_questions(
+            question_id, n, AnsweredSet.for_user(request.user.id)
+        )
+        questions = Question.objects.select_related('category').in_bulk(question_ids.tolist())
+
+        results = [
+            {
+                'question': QuestionSerializer(questions[next_id], context={'request': request}).data,
+                'probability': probability
+            }
+            for next_id, probability in zip(question_ids.tolist(), probabilities.tolist())
+            if next_id in questions
+        ]
+        return Response({'after': question_id, 'questions': results, 'count': len(results)})
+
+    @action(detail=False, methods=['get'])
+    def adaptive_question(self, request):
+        """
+        自适应选题（难度评分最接近用户能力评分的未答题目，按评分桶索引查找）
+        参数：
+        - category: 分类 ID，可选（同时使用该分类的能力评分）
+        - target: 目标期望得分率（0-1 之间），默认取 RECOMMENDER_RATING_TARGET
+        """
+        try:
+            category_id = _int_param(request, 'category')
+            target = _float_param(request, 'target')
+            if target is not None and not 0 < target < 1:
+                raise InvalidParameter('参数 target 必须在 0 到 1 之间')
+        except InvalidParameter as e:
+            return _invalid(e)
+
+        pick = OnlineRatings.next_question(
+            request.user.id,
+            category_id=category_id,
+            target=target,
+            exclude=AnsweredSet.for_user(request.user.id)
+        )
+        if pick is None:
+            return Response({
+                'question': None,
+                'skill': OnlineRatings.skill(request.user.id, category_id)
+            })
+
+        question = Question.objects.select_related('category').get(pk=pick.question_id)
+        return Response({
+            'question': QuestionSerializer(question, context={'request': request}).data,
+            'difficulty': pick.difficulty,
+            'skill': pick.skill,
+            'target_difficulty': pick.target_difficulty,
+            'expected_score': pick.expected
+        })
 
     @action(detail=True, methods=['post'])
     def mark_viewed(self, request, pk=None):
@@ -338,13 +538,13 @@ class RecommendationSystemViewSet(viewsets.GenericViewSet):
         重建所有相似度矩阵
         """
         try:
-            # 更新用户相似度
-            user_count = CollaborativeFiltering.update_user_similarities(
+            # 更新用户相似度（稀疏矩阵批量计算）
+            user_count = SimilarityEngine.rebuild_user_similarities(
                 min_common_questions=2
             )
 
-            # 更新题目相似度
-            question_count = CollaborativeFiltering.update_question_similarities(
+            # 更新题目相似度（按内存预算分块计算）
+            question_count = SimilarityEngine.rebuild_question_similarities(
                 min_common_users=2
             )
 
@@ -353,6 +553,8 @@ class RecommendationSystemViewSet(viewsets.GenericViewSet):
                 'user_similarities_updated': user_count,
                 'question_similarities_updated': question_count
             })
+        except RebuildInProgress as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response(
                 {'error': str(e)},
@@ -365,14 +567,8 @@ class RecommendationSystemViewSet(viewsets.GenericViewSet):
         更新所有用户的偏好分析
         """
         try:
-            from users.models import User
-
-            users = User.objects.filter(interaction__isnull=False).distinct()
-            updated_count = 0
-
-            for user in users:
-                CollaborativeFiltering.update_user_preferences(user)
-                updated_count += 1
+            # 两次分组查询 + 分块批量写入，不再逐个用户计算
+            updated_count = UserPreferenceBuilder.build()
 
             return Response({
                 'message': f'成功更新 {updated_count} 个用户的偏好分析',
@@ -391,15 +587,15 @@ class RecommendationSystemViewSet(viewsets.GenericViewSet):
         """
         try:
             stats = {
-                'user_similarities': UserSimilarity.objects.count(),
-                'question_similarities': QuestionSimilarity.objects.count(),
+                'user_similarities': UserSimilarity.objects.active().count(),
+                'question_similarities': QuestionSimilarity.objects.active().count(),
                 'recommendations': Recommendation.objects.count(),
                 'user_preferences': UserPreference.objects.count(),
                 'users_with_interactions': User.objects.filter(
-                    interaction__isnull=False
+                    interactions__isnull=False
                 ).distinct().count(),
                 'questions_with_interactions': Question.objects.filter(
-                    interaction__isnull=False
+                    interactions__isnull=False
                 ).distinct().count(),
             }
 
@@ -409,3 +605,23 @@ class RecommendationSystemViewSet(viewsets.GenericViewSet):
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    @action(detail=False, methods=['get'])
+    def telemetry(self, request):
+        """
+        构建与服务遥测
+        - builds: 每类离线构建最近一次的耗时、写入行数、实体对数、峰值内存、数据水位线，以及是否变慢 / 过期
+        - serving: 每种推荐类型的缓存命中率、延迟直方图与分位数、回退到热门题目的比例
+        """
+        return Response({
+            'builds': BuildTelemetry.status(),
+            'serving': ServingTelemetry.snapshot(),
+        })
+
+    @action(detail=False, methods=['post'])
+    def reset_telemetry(self, request):
+        """
+        清零服务遥测计数器（构建记录保留）
+        """
+        ServingTelemetry.reset()
+        return Response({'message': '服务遥测计数器已清零'})